@@ -1,9 +1,30 @@
-from typing import Dict, Any
+from typing import Dict, Any, Mapping
 
-def create_group_selection_card() -> Dict[str, Any]:
+from config.config import GROUP_TYPES
+from utils.group_matcher import selectable_group_types
+
+def _group_button(group_type: str, group: Mapping[str, Any]) -> Dict[str, Any]:
+    """根据群组类型配置生成群组选择按钮"""
+    return {
+        "tag": "button",
+        "text": {
+            "tag": "plain_text",
+            "content": group.get("button_label", group["name"])
+        },
+        "type": "primary",
+        "value": {
+            "type": "group_selection",
+            "group_type": group_type
+        }
+    }
+
+def create_group_selection_card(group_types: Mapping[str, Mapping[str, Any]] = GROUP_TYPES) -> Dict[str, Any]:
     """
     创建群组选择卡片，让用户选择要加入的群组类型
     
+    Args:
+        group_types: 群组类型配置，每个可选择的类型生成一个按钮
+        
     Returns:
         Dict: 群组选择卡片内容
     """
@@ -29,30 +50,8 @@ def create_group_selection_card() -> Dict[str, Any]:
             {
                 "tag": "action",
                 "actions": [
-                    {
-                        "tag": "button",
-                        "text": {
-                            "tag": "plain_text",
-                            "content": "选手群"
-                        },
-                        "type": "primary",
-                        "value": {
-                            "type": "group_selection",
-                            "group_type": "player"
-                        }
-                    },
-                    {
-                        "tag": "button",
-                        "text": {
-                            "tag": "plain_text",
-                            "content": "评委群"
-                        },
-                        "type": "primary",
-                        "value": {
-                            "type": "group_selection",
-                            "group_type": "judge"
-                        }
-                    }
+                    _group_button(group_type, group_types[group_type])
+                    for group_type in selectable_group_types(group_types)
                 ]
             },
             {
@@ -70,8 +69,12 @@ def create_group_selection_card() -> Dict[str, Any]:
         ]
     }
 
-def create_qr_request_card(group_type: str) -> Dict[str, Any]:
-    group_name = "选手群" if group_type == "player" else "评委群"
+def create_qr_request_card(
+    group_type: str,
+    group_types: Mapping[str, Mapping[str, Any]] = GROUP_TYPES
+) -> Dict[str, Any]:
+    group = group_types.get(group_type)
+    group_name = group["name"] if group else "群组"
     
     return {
         "config": {
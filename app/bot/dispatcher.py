@@ -0,0 +1,227 @@
+"""
+Event dispatcher for the Feishu bot.
+This module queues incoming events into priority lanes and processes them
+with a pool of worker tasks using weighted fair scheduling.
+"""
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from config.config import (
+    EVENT_DISPATCHER_WORKERS,
+    EVENT_LANE_WEIGHTS,
+    EVENT_LANE_CONCURRENCY,
+    EVENT_LANE_MAX_WAIT
+)
+from utils.deadline import current_deadline, set_deadline, reset_deadline
+from utils.tracing import current_span, set_span, reset_span
+from utils.latency import LatencyWindow
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 事件车道
+LANE_INTERACTIVE = "interactive"  # 卡片点击、文本回复：轻量且对延迟敏感
+LANE_LIFECYCLE = "lifecycle"      # 机器人入群等生命周期事件
+LANE_HEAVY = "heavy"              # 图片二维码验证：耗时长
+
+# 队列中的事件: (入队时间, 截止时间, 追踪根跨度, 事件数据)
+QueuedEvent = Tuple[float, Optional[float], Any, Dict[str, Any]]
+
+
+def classify_event(event_data: Dict[str, Any]) -> str:
+    """
+    根据事件类型划分车道
+    
+    Args:
+        event_data: 事件数据
+        
+    Returns:
+        str: 车道名称
+    """
+    event_type = event_data.get("header", {}).get("event_type", "")
+    
+    if event_type == "im.message.receive_v1":
+        message_type = event_data.get("event", {}).get("message", {}).get("message_type")
+        if message_type == "image":
+            return LANE_HEAVY
+        return LANE_INTERACTIVE
+    elif event_type == "im.message.action.v1":
+        return LANE_INTERACTIVE
+    elif event_type == "im.chat.member.bot.added_v1":
+        return LANE_LIFECYCLE
+    
+    return LANE_LIFECYCLE
+
+
+class EventDispatcher:
+    """
+    多车道事件调度器
+    
+    各车道按权重做平滑加权轮询；某车道最早的事件等待超过 max_wait 秒时优先调度，
+    防止低权重车道饿死。每个车道还可以限制同时处理的事件数，为轻量事件预留工作协程。
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[Any]],
+        workers: int = EVENT_DISPATCHER_WORKERS,
+        weights: Optional[Dict[str, int]] = None,
+        concurrency: Optional[Dict[str, int]] = None,
+        max_wait: float = EVENT_LANE_MAX_WAIT
+    ):
+        self._process = process
+        self._workers_count = workers
+        self._weights = dict(weights or EVENT_LANE_WEIGHTS)
+        self._concurrency = dict(concurrency or EVENT_LANE_CONCURRENCY)
+        self._max_wait = max_wait
+        
+        self._lanes: Dict[str, Deque[QueuedEvent]] = {lane: deque() for lane in self._weights}
+        self._current_weights: Dict[str, int] = {lane: 0 for lane in self._weights}
+        self._in_flight: Dict[str, int] = {lane: 0 for lane in self._weights}
+        self._processed: Dict[str, int] = {lane: 0 for lane in self._weights}
+        self._promoted: Dict[str, int] = {lane: 0 for lane in self._weights}
+        # 每个车道从入队到处理完成的耗时
+        self.latency: Dict[str, LatencyWindow] = {lane: LatencyWindow() for lane in self._weights}
+        
+        self._condition = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: list = []
+
+    @property
+    def running(self) -> bool:
+        """调度器是否已启动"""
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """启动工作协程"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"event-worker-{i}")
+            for i in range(self._workers_count)
+        ]
+        logger.info("事件调度器已启动，工作协程数: %s", self._workers_count)
+
+    async def stop(self) -> None:
+        """停止工作协程，丢弃尚未处理的事件"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        
+        dropped = sum(len(queue) for queue in self._lanes.values())
+        for queue in self._lanes.values():
+            queue.clear()
+        if dropped:
+            logger.warning("事件调度器停止，丢弃 %s 个未处理事件", dropped)
+
+    async def submit(self, event_data: Dict[str, Any]) -> str:
+        """
+        将事件放入对应车道，并沿用当前上下文的截止时间和追踪
+        
+        当前跨度应为事件的根跨度，事件处理完成后由调度器结束。
+        
+        Args:
+            event_data: 事件数据
+            
+        Returns:
+            str: 事件所在车道
+        """
+        lane = classify_event(event_data)
+        async with self._condition:
+            self._lanes[lane].append((time.monotonic(), current_deadline(), current_span(), event_data))
+            self._idle.clear()
+            self._condition.notify()
+        return lane
+
+    async def join(self) -> None:
+        """等待所有已提交的事件处理完毕"""
+        await self._idle.wait()
+
+    def queue_depth(self) -> int:
+        """等待处理的事件总数"""
+        return sum(len(queue) for queue in self._lanes.values())
+
+    def lane_load(self, lane: str) -> int:
+        """某车道排队中和处理中的事件数"""
+        return len(self._lanes[lane]) + self._in_flight[lane]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取调度器统计信息
+        
+        Returns:
+            Dict: 每个车道的排队数、处理中数量、已处理数量和防饿死提升次数
+        """
+        return {
+            lane: {
+                "queued": len(self._lanes[lane]),
+                "in_flight": self._in_flight[lane],
+                "processed": self._processed[lane],
+                "promoted": self._promoted[lane],
+            }
+            for lane in self._lanes
+        }
+
+    def _eligible(self, lane: str) -> bool:
+        limit = self._concurrency.get(lane)
+        return bool(self._lanes[lane]) and (limit is None or self._in_flight[lane] < limit)
+
+    def _pick(self) -> Optional[Tuple[str, QueuedEvent]]:
+        """选出下一个要处理的事件，没有可处理的事件时返回None"""
+        eligible = [lane for lane in self._lanes if self._eligible(lane)]
+        if not eligible:
+            return None
+        
+        # 防饿死：等待最久且超过阈值的车道优先
+        now = time.monotonic()
+        starving = [lane for lane in eligible if now - self._lanes[lane][0][0] >= self._max_wait]
+        if starving:
+            chosen = min(starving, key=lambda lane: self._lanes[lane][0][0])
+            self._promoted[chosen] += 1
+            return chosen, self._lanes[chosen].popleft()
+        
+        # 平滑加权轮询
+        total = 0
+        chosen = None
+        for lane in eligible:
+            self._current_weights[lane] += self._weights[lane]
+            total += self._weights[lane]
+            if chosen is None or self._current_weights[lane] > self._current_weights[chosen]:
+                chosen = lane
+        self._current_weights[chosen] -= total
+        return chosen, self._lanes[chosen].popleft()
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._condition:
+                picked = self._pick()
+                while picked is None:
+                    await self._condition.wait()
+                    picked = self._pick()
+                lane, (enqueued_at, deadline, trace_span, event_data) = picked
+                self._in_flight[lane] += 1
+            
+            token = set_deadline(deadline)
+            span_token = set_span(trace_span)
+            trace_span.set(lane=lane, queue_wait=round(time.monotonic() - enqueued_at, 6))
+            try:
+                await self._process(event_data)
+            except Exception:
+                logger.exception("处理事件出错 (车道: %s)", lane)
+            finally:
+                reset_span(span_token)
+                trace_span.finish()
+                reset_deadline(token)
+                self.latency[lane].observe(time.monotonic() - enqueued_at)
+                async with self._condition:
+                    self._in_flight[lane] -= 1
+                    self._processed[lane] += 1
+                    if not self.queue_depth() and not any(self._in_flight.values()):
+                        self._idle.set()
+                    # 车道名额释放后唤醒一个等待中的工作协程
+                    self._condition.notify()
@@ -13,7 +13,13 @@ from config.config import (
     QR_REQUEST_MESSAGE,
     VERIFICATION_SUCCESS_MESSAGE,
     VERIFICATION_FAILURE_MESSAGE,
-    GROUP_TYPES
+    DEADLINE_REPLY_GRACE,
+    DEADLINE_EXCEEDED_MESSAGE,
+    BULKHEAD_BUSY_MESSAGE,
+    ADMISSION_BUSY_MESSAGE,
+    RESET_COMMANDS,
+    QR_TOKEN_REUSED_MESSAGE,
+    QR_TOKEN_EXPIRED_MESSAGE
 )
 from app.bot.messages import (
     send_message,
@@ -24,6 +30,7 @@ from app.bot.messages import (
 from app.qrcode.parser import download_image, extract_qr_code
 from app.verification.api_client import verify_user_permission
 from app.group.manager import add_user_to_group
+from app.bot.dispatcher import EventDispatcher, classify_event, LANE_HEAVY
 from utils.memory_store import (
     get_user_state, 
     set_user_state,
@@ -32,6 +39,16 @@ from utils.memory_store import (
 )
 from utils.lark_client import get_lark_client
 from utils.error_handler import log_api_error
+from utils.deadline import run_stage, DeadlineExceeded
+from utils.bulkhead import BulkheadFull
+from utils.admission import AdmissionController
+from utils.metrics import registry, EVENTS_TOTAL, VERIFICATIONS_TOTAL
+from utils.tracing import start_trace, set_span, reset_span, current_span
+from utils.recorder import event_recorder
+from utils.routing import bind_routing, unbind_routing, current_routing
+from utils.tenants import tenant_registry, bind_tenant, unbind_tenant
+from utils.qr_ledger import qr_token_ledger, QR_TOKEN_ACCEPTED, QR_TOKEN_REUSED
+import asyncio
 import logging
 
 # 配置日志
@@ -41,6 +58,10 @@ async def handle_bot_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     处理来自飞书API的事件
     
+    调度器运行时事件进入优先级车道异步处理，立即应答飞书；否则直接处理。
+    每个事件开启一条以event_id为ID的追踪，事件处理完成时结束。
+    未配置的飞书应用（app_id）发来的事件直接应答，不做处理。
+    
     Args:
         event_data: 事件数据
         
@@ -51,19 +72,154 @@ async def handle_bot_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
     if "challenge" in event_data:
         return {"challenge": event_data["challenge"]}
     
+    header = event_data.get("header", {})
+    tenant = tenant_registry.for_event(event_data)
+    if tenant is None:
+        EVENTS_TOTAL.labels(_event_type_label(event_data), "unknown_tenant").inc()
+        logger.warning("收到未配置的应用 %s 的事件 %s，已忽略", header.get("app_id"), header.get("event_id"))
+        return {"code": 0, "msg": "success"}
+    
+    # 开启录制时保存匿名化的事件，用于回放做容量规划
+    if event_recorder.enabled:
+        event_recorder.record(event_data, tenant.routing.current)
+    
+    root = start_trace(
+        header.get("event_type") or "event",
+        trace_id=header.get("event_id"),
+        open_id=_event_open_id(event_data)
+    )
+    token = set_span(root)
+    # 过载提示等在这里发出的消息使用事件所属应用的凭证
+    tenant_token = bind_tenant(tenant)
+    try:
+        if event_dispatcher.running:
+            # 过载时尽早拒绝图片验证，卡片点击和文本照常处理
+            if classify_event(event_data) == LANE_HEAVY:
+                decision = admission_controller.admit()
+                if not decision.admitted:
+                    EVENTS_TOTAL.labels(_event_type_label(event_data), "rejected").inc()
+                    root.set(outcome="rejected")
+                    root.finish()
+                    _spawn(_reply_busy(event_data, decision.retry_after))
+                    return {"code": 0, "msg": "success"}
+            # 追踪随事件交给调度器，处理完成后结束
+            await event_dispatcher.submit(event_data)
+            return {"code": 0, "msg": "success"}
+        
+        try:
+            return await process_event(event_data)
+        finally:
+            root.finish()
+    finally:
+        unbind_tenant(tenant_token)
+        reset_span(token)
+
+def _event_open_id(event_data: Dict[str, Any]) -> Optional[str]:
+    """获取事件发起用户的open_id（消息发送者、卡片操作者或拉机器人入群的用户）"""
+    event = event_data.get("event", {})
+    if "sender" in event:
+        return event["sender"].get("sender_id", {}).get("open_id")
+    if "operator" in event:
+        return event["operator"].get("operator_id", {}).get("open_id")
+    return event.get("operator_id", {}).get("open_id")
+
+async def process_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按事件类型分发处理
+    
+    Args:
+        event_data: 事件数据
+        
+    Returns:
+        Dict: 返回给飞书的响应
+    """
     # 提取事件类型
     event_type = event_data.get("header", {}).get("event_type", "")
     
-    # 处理不同类型的事件
-    if event_type == "im.message.receive_v1":
-        return await handle_message_event(event_data)
-    elif event_type == "im.chat.member.bot.added_v1":
-        return await handle_bot_added_event(event_data)
-    elif event_type == "im.message.action.v1":
-        return await handle_card_action(event_data)
+    tenant = tenant_registry.for_event(event_data)
+    if tenant is None:
+        return {"code": 0, "msg": "success"}
     
-    # 未处理的事件类型的默认响应
-    return {"code": 0, "msg": "success"}
+    # 整个处理过程使用事件所属租户的凭证和同一份群组路由配置，处理途中重新加载不影响本事件
+    tenant_token = bind_tenant(tenant)
+    routing_token = bind_routing(tenant.routing)
+    try:
+        # 处理不同类型的事件
+        if event_type == "im.message.receive_v1":
+            result = await handle_message_event(event_data)
+        elif event_type == "im.chat.member.bot.added_v1":
+            result = await handle_bot_added_event(event_data)
+        elif event_type == "im.message.action.v1":
+            result = await handle_card_action(event_data)
+        else:
+            # 未处理的事件类型的默认响应
+            result = {"code": 0, "msg": "success"}
+    except Exception:
+        EVENTS_TOTAL.labels(_event_type_label(event_data), "error").inc()
+        current_span().set(outcome="error")
+        raise
+    finally:
+        unbind_routing(routing_token)
+        unbind_tenant(tenant_token)
+    
+    EVENTS_TOTAL.labels(_event_type_label(event_data), "ok").inc()
+    current_span().set(outcome="ok")
+    return result
+
+# 指标中区分的事件类型，其余归为other，避免标签无限增长
+_HANDLED_EVENT_TYPES = frozenset({
+    "im.message.receive_v1",
+    "im.chat.member.bot.added_v1",
+    "im.message.action.v1",
+})
+
+def _event_type_label(event_data: Dict[str, Any]) -> str:
+    event_type = event_data.get("header", {}).get("event_type", "")
+    return event_type if event_type in _HANDLED_EVENT_TYPES else "other"
+
+# 事件调度器：卡片点击和文本优先于图片验证
+event_dispatcher = EventDispatcher(process_event)
+
+# 图片验证准入控制：依据重负载车道的负载和延迟
+admission_controller = AdmissionController(
+    load=lambda: event_dispatcher.lane_load(LANE_HEAVY),
+    p99=lambda: event_dispatcher.latency[LANE_HEAVY].percentile(0.99),
+    samples=lambda: len(event_dispatcher.latency[LANE_HEAVY])
+)
+
+registry.gauge(
+    "xiaohuo_event_queue_depth",
+    "Events waiting in each dispatcher lane",
+    ["lane"],
+    lambda: [((lane,), stats["queued"]) for lane, stats in event_dispatcher.stats().items()]
+)
+registry.gauge(
+    "xiaohuo_event_lane_in_flight",
+    "Events being processed in each dispatcher lane",
+    ["lane"],
+    lambda: [((lane,), stats["in_flight"]) for lane, stats in event_dispatcher.stats().items()]
+)
+
+# 后台任务引用，防止任务在完成前被回收
+_background_tasks = set()
+
+def _spawn(coro) -> None:
+    """在后台运行协程"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _reply_busy(event_data: Dict[str, Any], retry_after: int) -> None:
+    """
+    图片验证被拒绝时给用户的简短提示
+    
+    Args:
+        event_data: 被拒绝的消息事件
+        retry_after: 建议重试的秒数
+    """
+    sender_id = _event_open_id(event_data)
+    if sender_id:
+        await send_message(sender_id, ADMISSION_BUSY_MESSAGE.format(seconds=retry_after))
 
 async def handle_message_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -107,7 +263,7 @@ async def handle_message_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
         text = content.get("text", "").strip()
         
         # 处理重新选择的请求
-        if text in ["重新选择", "重置", "reset"]:
+        if text in RESET_COMMANDS:
             await reset_user_state(sender_id)
             await send_message(sender_id, "已重置。" + GROUP_SELECTION_MESSAGE)
             await send_group_selection_card(sender_id)
@@ -123,11 +279,7 @@ async def handle_message_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
         
         elif current_state == UserState.WAITING_GROUP_SELECTION:
             # 尝试从文本中识别群组类型
-            group_type = None
-            if "选手" in text or "player" in text.lower():
-                group_type = "player"
-            elif "评委" in text or "judge" in text.lower():
-                group_type = "judge"
+            group_type = current_routing().matcher.match(text)
             
             if group_type:
                 # 用户选择了群组类型，更新状态并请求二维码
@@ -176,7 +328,7 @@ async def handle_card_action(event_data: Dict[str, Any]) -> Dict[str, Any]:
     if action_value.get("type") == "group_selection":
         group_type = action_value.get("group_type")
         
-        if group_type in GROUP_TYPES:
+        if group_type in current_routing().group_types:
             # 更新用户状态
             await set_user_state(open_id, {
                 "state": UserState.WAITING_QR_CODE,
@@ -201,6 +353,7 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
     """
     group_type = user_state.get("group_type")
     if not group_type:
+        VERIFICATIONS_TOTAL.labels("no_group_type").inc()
         await send_message(sender_id, "请先选择您要加入的群组类型。")
         await send_group_selection_card(sender_id)
         await set_user_state(sender_id, {"state": UserState.WAITING_GROUP_SELECTION})
@@ -213,6 +366,7 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
         image_key = content.get("image_key", "")
         
         if not image_key:
+            VERIFICATIONS_TOTAL.labels("no_image").inc()
             await send_message(sender_id, "无法识别图片，请重新发送二维码。")
             return
         
@@ -223,13 +377,14 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
         })
         
         # 下载并处理图片
-        image_data = await download_image(image_key)
+        image_data = await run_stage("download", download_image(image_key))
         if not image_data:
-            await send_verification_result(
+            VERIFICATIONS_TOTAL.labels("download_failed").inc()
+            await _reply(send_verification_result(
                 sender_id, 
                 False, 
                 "无法下载图片，请重新发送清晰的二维码。"
-            )
+            ))
             await set_user_state(sender_id, {
                 "state": UserState.WAITING_QR_CODE,
                 "group_type": group_type
@@ -237,45 +392,62 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
             return
         
         # 提取二维码内容
-        qr_data = await extract_qr_code(image_data)
+        qr_data = await run_stage("decode", extract_qr_code(image_data))
         if not qr_data:
-            await send_verification_result(
+            VERIFICATIONS_TOTAL.labels("no_qr_code").inc()
+            await _reply(send_verification_result(
                 sender_id,
                 False,
                 "无法识别二维码，请确保图片中包含清晰的二维码。"
-            )
+            ))
             await set_user_state(sender_id, {
                 "state": UserState.WAITING_QR_CODE,
                 "group_type": group_type
             })
             return
         
+        # 已被其他用户兑换或已过期的二维码直接拒绝，不调用验证API
+        token_status = await run_stage("qr_ledger", qr_token_ledger.check(qr_data, sender_id))
+        if token_status != QR_TOKEN_ACCEPTED:
+            await _reject_qr_token(sender_id, group_type, token_status)
+            return
+        
         # 调用API验证权限
-        verification_result = await verify_user_permission(sender_id, qr_data, group_type)
+        verification_result = await run_stage(
+            "verify",
+            verify_user_permission(sender_id, qr_data, group_type)
+        )
         
         if verification_result.get("success", False):
             # 验证成功，添加用户到群组
-            logger.info(f"用户 {sender_id} 验证成功，准备添加到{group_type}群组")
-            group_result = await add_user_to_group(sender_id, group_type)
+            logger.info("用户 %s 验证成功，准备添加到%s群组", sender_id, group_type)
+            # 登记兑换的用户；其他用户同时提交同一二维码并先通过验证时拒绝
+            token_status = await run_stage("qr_ledger", qr_token_ledger.redeem(qr_data, sender_id))
+            if token_status != QR_TOKEN_ACCEPTED:
+                await _reject_qr_token(sender_id, group_type, token_status)
+                return
+            group_result = await run_stage("add", add_user_to_group(sender_id, group_type))
             
             if group_result.get("success", False):
                 # 添加群组成功
+                VERIFICATIONS_TOTAL.labels("joined").inc()
                 message = group_result.get("message", "")
-                logger.info(f"用户 {sender_id} 成功加入群组")
-                await send_verification_result(
+                logger.info("用户 %s 成功加入群组", sender_id)
+                await _reply(send_verification_result(
                     sender_id,
                     True,
                     message
-                )
+                ))
                 # 重置用户状态
                 await reset_user_state(sender_id)
             else:
                 # 添加群组失败
+                VERIFICATIONS_TOTAL.labels("group_add_failed").inc()
                 error = group_result.get("error", "未知错误")
                 
                 # 检查是否是权限错误
                 if group_result.get("is_permission_error", False):
-                    logger.error(f"检测到权限错误: {error}")
+                    logger.error("检测到权限错误: %s", error)
                     
                     # 简化错误消息给用户，便于理解
                     user_friendly_error = "由于飞书权限限制，无法将您添加到群组。\n\n请联系管理员检查机器人权限设置。"
@@ -284,18 +456,18 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
                     admin_error = f"权限错误: {error}"
                     logger.error(admin_error)
                     
-                    await send_verification_result(
+                    await _reply(send_verification_result(
                         sender_id,
                         False,
                         user_friendly_error
-                    )
+                    ))
                 else:
                     # 非权限错误
-                    await send_verification_result(
+                    await _reply(send_verification_result(
                         sender_id,
                         False,
                         f"验证成功，但添加群组失败: {error}"
-                    )
+                    ))
                 
                 # 保持当前状态，以便用户可以重试
                 await set_user_state(sender_id, {
@@ -304,20 +476,36 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
                 })
         else:
             # 验证失败
+            VERIFICATIONS_TOTAL.labels("denied").inc()
             error_message = verification_result.get("message", "验证失败")
-            await send_verification_result(
+            await _reply(send_verification_result(
                 sender_id,
                 False,
                 error_message
-            )
+            ))
             # 保持当前状态，以便用户可以重试
             await set_user_state(sender_id, {
                 "state": UserState.WAITING_QR_CODE,
                 "group_type": group_type
             })
     
+    except DeadlineExceeded as e:
+        # 时间预算耗尽，回复一次"请重试"
+        VERIFICATIONS_TOTAL.labels("deadline_exceeded").inc()
+        await _reply_deadline_exceeded(sender_id, group_type, e.stage)
+    
+    except BulkheadFull:
+        # 下载或解码排队已满，提示用户稍后重试
+        VERIFICATIONS_TOTAL.labels("busy").inc()
+        await send_verification_result(sender_id, False, BULKHEAD_BUSY_MESSAGE)
+        await set_user_state(sender_id, {
+            "state": UserState.WAITING_QR_CODE,
+            "group_type": group_type
+        })
+    
     except Exception as e:
         # 处理异常
+        VERIFICATIONS_TOTAL.labels("error").inc()
         await send_verification_result(
             sender_id,
             False,
@@ -329,6 +517,57 @@ async def handle_qr_code_image(message_data: Dict[str, Any], sender_id: str, use
             "group_type": group_type
         })
 
+async def _reply(awaitable) -> Any:
+    """在剩余时间预算内发送结果回复"""
+    return await run_stage("reply", awaitable)
+
+async def _reject_qr_token(sender_id: str, group_type: str, token_status: str) -> None:
+    """
+    拒绝已被其他用户兑换或已过期的二维码，用户可以重新发送
+    
+    Args:
+        sender_id: 发送者ID
+        group_type: 群组类型
+        token_status: 账本检查结果
+    """
+    VERIFICATIONS_TOTAL.labels(f"qr_{token_status}").inc()
+    await _reply(send_verification_result(
+        sender_id,
+        False,
+        QR_TOKEN_REUSED_MESSAGE if token_status == QR_TOKEN_REUSED else QR_TOKEN_EXPIRED_MESSAGE
+    ))
+    await set_user_state(sender_id, {
+        "state": UserState.WAITING_QR_CODE,
+        "group_type": group_type
+    })
+
+async def _reply_deadline_exceeded(sender_id: str, group_type: str, stage: str) -> None:
+    """
+    事件处理超出时间预算后，给用户发送唯一一条"请重试"提示
+    
+    Args:
+        sender_id: 发送者ID
+        group_type: 群组类型
+        stage: 超时发生的阶段
+    """
+    # 回复阶段本身超时说明结果已处理完、只是消息通道很慢，不再追加提示
+    if stage == "reply":
+        return
+    
+    # 恢复到等待二维码的状态，以便用户可以重试
+    await set_user_state(sender_id, {
+        "state": UserState.WAITING_QR_CODE,
+        "group_type": group_type
+    })
+    
+    try:
+        await asyncio.wait_for(
+            send_verification_result(sender_id, False, DEADLINE_EXCEEDED_MESSAGE),
+            DEADLINE_REPLY_GRACE
+        )
+    except asyncio.TimeoutError:
+        logger.warning("向用户 %s 发送超时提示失败", sender_id)
+
 async def handle_bot_added_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     处理机器人被添加到聊天的事件
@@ -4,17 +4,135 @@ This module handles sending messages to users through the Feishu API.
 """
 import json
 import uuid
+import asyncio
+import logging
+from types import MappingProxyType
 from typing import Optional, Dict, Any
 
-import lark_oapi as lark
-from lark_oapi.api.im.v1 import *
-
-from utils.lark_client import get_lark_client
+from utils.lark_client import get_lark_client, get_request_option
+from utils.bulkhead import get_bulkhead
+from utils.metrics import stage_timer
+from utils.tracing import span
+from utils.outbox import outbox, classify_result, OutboxResult, OUTBOX_DONE
 from app.bot.cards import (
     create_group_selection_card,
     create_qr_request_card,
     create_verification_result_card
 )
+from utils.routing import register_template, current_routing
+from utils.tenants import current_tenant, tenant_context
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+MESSAGE_CREATE = "im.message.create"
+
+_MESSAGE_SEND_SECONDS = stage_timer("message_send")
+
+# 群组选择卡片和二维码请求卡片只随群组配置变化，随路由快照预先序列化
+GROUP_SELECTION_CARD = "group_selection_card"
+QR_REQUEST_CARDS = "qr_request_cards"
+
+register_template(
+    GROUP_SELECTION_CARD,
+    lambda group_types: json.dumps(create_group_selection_card(group_types))
+)
+register_template(
+    QR_REQUEST_CARDS,
+    lambda group_types: MappingProxyType({
+        group_type: json.dumps(create_qr_request_card(group_type, group_types))
+        for group_type in group_types
+    })
+)
+
+async def _deliver_message(payload: Dict[str, Any]) -> OutboxResult:
+    """
+    发件箱处理函数：通过飞书API发送一条消息
+    
+    Args:
+        payload: 包含app_id、receive_id_type、receive_id、msg_type、content和uuid的消息参数
+        
+    Returns:
+        OutboxResult: 发送结果，value为飞书响应或异常
+    """
+    from lark_oapi.api.im.v1 import CreateMessageRequest, CreateMessageRequestBody
+    
+    client = get_lark_client()
+    
+    # 构造请求对象，uuid用于飞书侧去重，重试时不会重复发送
+    request = CreateMessageRequest.builder() \
+        .receive_id_type(payload["receive_id_type"]) \
+        .request_body(CreateMessageRequestBody.builder()
+            .receive_id(payload["receive_id"])
+            .msg_type(payload["msg_type"])
+            .content(payload["content"])
+            .uuid(payload["uuid"])
+            .build()) \
+        .build()
+    
+    try:
+        option = await get_request_option()
+        # 在线程中发起请求，避免阻塞事件循环
+        async with get_bulkhead("message_send"):
+            with _MESSAGE_SEND_SECONDS.time(), span("lark.message.create", msg_type=payload["msg_type"]):
+                response = await asyncio.to_thread(client.im.v1.message.create, request, option)
+    except Exception as e:
+        response = e
+    
+    # 按错误分类决定是否由发件箱重试
+    return classify_result(response)
+
+async def _submit_message(
+    receiver_id: str,
+    content: str,
+    message_type: str,
+    is_chat_id: bool
+) -> Dict[str, Any]:
+    """
+    通过发件箱发送消息，并把首次发送结果转换为响应字典
+    
+    Args:
+        receiver_id: ID of the message receiver (open_id or chat_id)
+        content: Serialized message content
+        message_type: Type of message
+        is_chat_id: Whether the receiver_id is a chat_id
+        
+    Returns:
+        Dict: Response from Feishu API
+    """
+    message_uuid = str(uuid.uuid4())
+    payload = {
+        # 发送消息的飞书应用，后台重试时按此选择凭证
+        "app_id": current_tenant().app_id,
+        # 确定接收ID类型
+        "receive_id_type": "chat_id" if is_chat_id else "open_id",
+        "receive_id": receiver_id,
+        "msg_type": message_type,
+        "content": content,
+        "uuid": message_uuid
+    }
+    
+    result = await outbox.submit(MESSAGE_CREATE, message_uuid, payload)
+    response = result.value
+    
+    # 处理响应
+    if result.status == OUTBOX_DONE:
+        return {
+            "code": 0,
+            "data": response.data,
+            "msg": "success"
+        }
+    elif isinstance(response, Exception):
+        # 记录错误并继续（不让消息错误打断流程），发件箱会在后台重试
+        logger.error("发送%s消息出错: %s", message_type, response)
+        return {"error": str(response)}
+    else:
+        logger.error("发送%s消息失败: code=%s, msg=%s", message_type, response.code, response.msg)
+        return {
+            "code": response.code,
+            "msg": response.msg,
+            "error": True
+        }
 
 async def send_message(
     receiver_id: str, 
@@ -34,49 +152,12 @@ async def send_message(
     Returns:
         Dict: Response from Feishu API
     """
-    client = get_lark_client()
-    
     # 准备消息内容
     if message_type == "text":
         content_dict = {"text": content}
         content = json.dumps(content_dict)
     
-    # 确定接收ID类型
-    receive_id_type = "chat_id" if is_chat_id else "open_id"
-    
-    # 构造请求对象
-    request = CreateMessageRequest.builder() \
-        .receive_id_type(receive_id_type) \
-        .request_body(CreateMessageRequestBody.builder()
-            .receive_id(receiver_id)
-            .msg_type(message_type)
-            .content(content)
-            .uuid(str(uuid.uuid4()))
-            .build()) \
-        .build()
-    
-    try:
-        # 发起请求
-        response = client.im.v1.message.create(request)
-        
-        # 处理响应
-        if response.success():
-            return {
-                "code": 0,
-                "data": response.data,
-                "msg": "success"
-            }
-        else:
-            print(f"Error sending message: code={response.code}, msg={response.msg}")
-            return {
-                "code": response.code,
-                "msg": response.msg,
-                "error": True
-            }
-    except Exception as e:
-        # 记录错误并继续（不让消息错误打断流程）
-        print(f"Exception sending message: {str(e)}")
-        return {"error": str(e)}
+    return await _submit_message(receiver_id, content, message_type, is_chat_id)
 
 async def send_card_message(
     receiver_id: str,
@@ -94,47 +175,10 @@ async def send_card_message(
     Returns:
         Dict: Response from Feishu API
     """
-    client = get_lark_client()
-    
-    # 确定接收ID类型
-    receive_id_type = "chat_id" if is_chat_id else "open_id"
-    
     # 将卡片内容转换为JSON字符串
     card_content_str = json.dumps(card_content)
     
-    # 构造请求对象
-    request = CreateMessageRequest.builder() \
-        .receive_id_type(receive_id_type) \
-        .request_body(CreateMessageRequestBody.builder()
-            .receive_id(receiver_id)
-            .msg_type("interactive")
-            .content(card_content_str)
-            .uuid(str(uuid.uuid4()))
-            .build()) \
-        .build()
-    
-    try:
-        # 发起请求
-        response = client.im.v1.message.create(request)
-        
-        # 处理响应
-        if response.success():
-            return {
-                "code": 0,
-                "data": response.data,
-                "msg": "success"
-            }
-        else:
-            print(f"Error sending card message: code={response.code}, msg={response.msg}")
-            return {
-                "code": response.code,
-                "msg": response.msg,
-                "error": True
-            }
-    except Exception as e:
-        # 记录错误并继续
-        print(f"Exception sending card message: {str(e)}")
-        return {"error": str(e)}
+    return await _submit_message(receiver_id, card_content_str, "interactive", is_chat_id)
 
 async def send_group_selection_card(receiver_id: str) -> Dict[str, Any]:
     """
@@ -146,8 +190,8 @@ async def send_group_selection_card(receiver_id: str) -> Dict[str, Any]:
     Returns:
         Dict: 飞书API响应
     """
-    card_content = create_group_selection_card()
-    return await send_card_message(receiver_id, card_content)
+    card_content = current_routing().templates[GROUP_SELECTION_CARD]
+    return await _submit_message(receiver_id, card_content, "interactive", False)
 
 async def send_qr_request(receiver_id: str, group_type: str) -> Dict[str, Any]:
     """
@@ -160,8 +204,11 @@ async def send_qr_request(receiver_id: str, group_type: str) -> Dict[str, Any]:
     Returns:
         Dict: 飞书API响应
     """
-    card_content = create_qr_request_card(group_type)
-    return await send_card_message(receiver_id, card_content)
+    routing = current_routing()
+    card_content = routing.templates[QR_REQUEST_CARDS].get(group_type)
+    if card_content is None:
+        card_content = json.dumps(create_qr_request_card(group_type, routing.group_types))
+    return await _submit_message(receiver_id, card_content, "interactive", False)
 
 async def send_verification_result(
     receiver_id: str, 
@@ -181,3 +228,5 @@ async def send_verification_result(
     """
     card_content = create_verification_result_card(success, message)
     return await send_card_message(receiver_id, card_content)
+
+outbox.register(MESSAGE_CREATE, _deliver_message, context=tenant_context)
@@ -1,17 +1,61 @@
 from typing import Dict, Any, List
+import asyncio
 import logging
 import json
 
-import lark_oapi as lark
-from lark_oapi.api.im.v1 import *
-
-from config.config import GROUP_TYPES
-from utils.lark_client import get_lark_client
+from utils.routing import current_routing
+from utils.tenants import current_tenant, tenant_context
+from utils.lark_client import get_lark_client, get_request_option
+from utils.bulkhead import get_bulkhead
+from utils.metrics import stage_timer
+from utils.tracing import span
+from utils.outbox import outbox, classify_result, OutboxResult, OUTBOX_DONE, OUTBOX_RETRY
 from utils.error_handler import log_api_error, format_permission_guide, check_permission_error
 
 # 配置日志
 logger = logging.getLogger('xiaohuo-bot')
 
+_GROUP_ADD_SECONDS = stage_timer("group_add")
+
+CHAT_MEMBERS_CREATE = "im.chat_members.create"
+
+async def _deliver_chat_member(payload: Dict[str, Any]) -> OutboxResult:
+    """
+    发件箱处理函数：通过飞书API把用户添加到群组
+    
+    Args:
+        payload: 包含app_id、chat_id和user_id的参数
+        
+    Returns:
+        OutboxResult: 添加结果，value为飞书响应或异常
+    """
+    from lark_oapi.api.im.v1 import CreateChatMembersRequest, CreateChatMembersRequestBody
+    
+    client = get_lark_client()
+    
+    # 构造请求对象
+    request = CreateChatMembersRequest.builder() \
+        .chat_id(payload["chat_id"]) \
+        .member_id_type("open_id") \
+        .request_body(CreateChatMembersRequestBody.builder()
+            .id_list([payload["user_id"]])
+            .build()) \
+        .build()
+    
+    try:
+        option = await get_request_option()
+        # 在线程中发起请求，避免阻塞事件循环
+        async with get_bulkhead("group_add"):
+            with _GROUP_ADD_SECONDS.time(), span("lark.chat_members.create", chat_id=payload["chat_id"]):
+                response = await asyncio.to_thread(client.im.v1.chat_members.create, request, option)
+    except Exception as e:
+        response = e
+    
+    # 按错误分类决定是否由发件箱重试
+    return classify_result(response)
+
+outbox.register(CHAT_MEMBERS_CREATE, _deliver_chat_member, context=tenant_context)
+
 async def add_user_to_group(user_id: str, group_type: str) -> Dict[str, Any]:
     """
     将用户添加到指定类型的群组
@@ -23,98 +67,99 @@ async def add_user_to_group(user_id: str, group_type: str) -> Dict[str, Any]:
     Returns:
         Dict: 操作结果
     """
-    # 确认群组类型存在
-    if group_type not in GROUP_TYPES:
+    # 确认群组类型存在（使用当前事件绑定的路由快照）
+    group = current_routing().group_types.get(group_type)
+    if group is None:
         return {
             "success": False,
             "error": f"未知的群组类型: {group_type}"
         }
     
     # 获取该类型的群组ID列表
-    chat_ids = GROUP_TYPES[group_type].get("chat_ids", [])
+    chat_ids = group["chat_ids"]
+    group_name = group["name"]
     if not chat_ids:
         return {
             "success": False,
-            "error": f"没有配置{GROUP_TYPES[group_type]['name']}的ID，请在config中设置"
+            "error": f"没有配置{group_name}的ID，请在config中设置"
         }
     
-    client = get_lark_client()
-    
     # 记录添加结果
     results = []
     success_count = 0
+    queued_count = 0
     
     # 遍历目标群组，将用户添加到每个群组
     permission_error_detected = False
     permission_error_msg = ""
     
     for chat_id in chat_ids:
-        try:
-            # 构造请求对象
-            request = CreateChatMembersRequest.builder() \
-                .chat_id(chat_id) \
-                .member_id_type("open_id") \
-                .request_body(CreateChatMembersRequestBody.builder()
-                    .id_list([user_id])
-                    .build()) \
-                .build()
-
-            # 发起请求
-            logger.info(f"添加用户 {user_id} 到群组 {chat_id} ({GROUP_TYPES[group_type]['name']})")
-            response = client.im.v1.chat_members.create(request)
-            
-            # 处理响应
-            if response.success():
-                success_count += 1
-                results.append({"chat_id": chat_id, "success": True})
-                logger.info(f"成功添加用户到群组 {chat_id}")
-            else:
-                # 检查是否是权限错误
-                logger.warning(f"添加用户到群组失败: code={response.code}, msg={response.msg}")
-                
-                if hasattr(response, 'raw') and hasattr(response.raw, 'content'):
-                    try:
-                        error_data = json.loads(response.raw.content)
-                        is_permission_error, error_detail = check_permission_error(error_data)
-                        
-                        if is_permission_error:
-                            permission_error_detected = True
-                            permission_error_msg = error_detail
-                            logger.error(f"权限错误: {error_detail}")
-                    except Exception as parse_err:
-                        logger.error(f"解析错误响应失败: {parse_err}")
-                
-                results.append({
-                    "chat_id": chat_id, 
-                    "success": False,
-                    "error": response.msg,
-                    "code": response.code
-                })
+        # 发起请求（先写入发件箱，临时失败会在后台重试）
+        logger.info("添加用户 %s 到群组 %s (%s)", user_id, chat_id, group_name)
+        result = await outbox.submit(
+            CHAT_MEMBERS_CREATE,
+            f"{chat_id}:{user_id}",
+            {"app_id": current_tenant().app_id, "chat_id": chat_id, "user_id": user_id}
+        )
+        response = result.value
+        # 临时错误（网络、限流等）已进入发件箱，稍后自动重试
+        queued = result.status == OUTBOX_RETRY and outbox.running
+        if queued:
+            queued_count += 1
+        
+        # 处理响应
+        if result.status == OUTBOX_DONE:
+            success_count += 1
+            results.append({"chat_id": chat_id, "success": True})
+            logger.info("成功添加用户到群组 %s", chat_id)
         
-        except Exception as e:
-            error_result = log_api_error("add_user_to_group", e, {"chat_id": chat_id, "user_id": user_id})
+        elif isinstance(response, Exception):
+            error_result = log_api_error("add_user_to_group", response, {"chat_id": chat_id, "user_id": user_id})
             
             # 检查是否是权限错误
             if error_result.get("is_permission_error", False):
                 permission_error_detected = True
-                permission_error_msg = error_result.get("error", str(e))
+                permission_error_msg = error_result.get("error", str(response))
             
             results.append({
                 "chat_id": chat_id,
                 "success": False,
-                "error": str(e)
+                "queued": queued,
+                "error": str(response)
+            })
+        
+        else:
+            # 检查是否是权限错误
+            logger.warning("添加用户到群组失败: code=%s, msg=%s", response.code, response.msg)
+            
+            if hasattr(response, 'raw') and hasattr(response.raw, 'content'):
+                try:
+                    error_data = json.loads(response.raw.content)
+                    is_permission_error, error_detail = check_permission_error(error_data)
+                    
+                    if is_permission_error:
+                        permission_error_detected = True
+                        permission_error_msg = error_detail
+                        logger.error("权限错误: %s", error_detail)
+                except Exception as parse_err:
+                    logger.error("解析错误响应失败: %s", parse_err)
+            
+            results.append({
+                "chat_id": chat_id, 
+                "success": False,
+                "queued": queued,
+                "error": response.msg,
+                "code": response.code
             })
     
     # 整体操作结果
-    group_name = GROUP_TYPES[group_type]["name"]
-    
     # 处理权限错误情况，提供详细指导
     if permission_error_detected:
         # 生成权限指导信息
         guide = format_permission_guide(permission_error_msg)
         error_message = f"添加到{group_name}失败：检测到权限问题，请联系管理员。\n\n【技术详情】\n{permission_error_msg}\n\n【解决指南】\n{guide}"
         
-        logger.error(f"权限错误导致无法添加用户: {permission_error_msg}")
+        logger.error("权限错误导致无法添加用户: %s", permission_error_msg)
         
         return {
             "success": False,
@@ -129,6 +174,12 @@ async def add_user_to_group(user_id: str, group_type: str) -> Dict[str, Any]:
             "success": True,
             "message": f"您已成功加入{group_name}！"
         }
+    elif success_count + queued_count == len(chat_ids):
+        return {
+            "success": True,
+            "message": f"您的入群请求已提交，稍后将自动加入{group_name}。",
+            "details": results
+        }
     elif success_count > 0:
         return {
             "success": True,
@@ -0,0 +1,113 @@
+"""
+Health and readiness probes.
+Every value here is read from counters the request path already maintains
+(queue lengths, bulkhead occupancy, dict sizes, cached percentiles), so a
+probe costs the same whether the bot is idle or saturated.
+"""
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from config.config import BULKHEAD_LIMITS, HEALTH_STAGE_STALL_SECONDS, HEALTH_STATE_BACKEND_TIMEOUT
+from app.bot.handlers import event_dispatcher, admission_controller
+from app.verification.api_client import verification_breaker, verification_latency
+from app.warmup import warmup_report
+from utils.bulkhead import get_bulkhead
+from utils.circuit_breaker import BreakerState
+from utils.memory_store import memory_store_stats
+from utils.state_backend import get_state_backend
+
+
+def _stage_stats() -> Dict[str, Dict[str, Any]]:
+    """各处理阶段的并发占用和排队数"""
+    stages = {}
+    for name in BULKHEAD_LIMITS:
+        bulkhead = get_bulkhead(name)
+        stages[name] = {
+            "in_flight": bulkhead.in_flight,
+            "waiting": bulkhead.waiting,
+            "max_concurrent": bulkhead.max_concurrent,
+            "stalled_for": round(bulkhead.stalled_for(), 3),
+        }
+    return stages
+
+
+def _stalled_stages(stages: Dict[str, Dict[str, Any]]) -> List[str]:
+    return [name for name, stage in stages.items() if stage["stalled_for"] > HEALTH_STAGE_STALL_SECONDS]
+
+
+def health_snapshot() -> Dict[str, Any]:
+    """
+    获取实时容量指标
+    
+    Returns:
+        Dict: 事件队列、各阶段并发、状态存储、上游延迟等信息
+    """
+    return {
+        "warmed_up": warmup_report["ready"],
+        "dispatcher": {
+            "running": event_dispatcher.running,
+            "queue_depth": event_dispatcher.queue_depth(),
+            "lanes": event_dispatcher.stats(),
+        },
+        "stages": _stage_stats(),
+        "state_store": memory_store_stats(),
+        "upstream": {
+            "verification_api": {
+                "breaker": verification_breaker.state.value,
+                **verification_latency.summary(),
+            },
+        },
+        "admission": admission_controller.stats(),
+    }
+
+
+def liveness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    存活检查：只有处理阶段卡住时才判定为不健康，需要重启进程
+    
+    Returns:
+        Tuple: (是否健康, 指标快照及原因)
+    """
+    snapshot = health_snapshot()
+    stalled = _stalled_stages(snapshot["stages"])
+    snapshot["reasons"] = [f"{name}_stalled" for name in stalled]
+    return not stalled, snapshot
+
+
+async def _state_backend_reachable() -> bool:
+    """共享状态存储能否在时限内完成一次读取"""
+    try:
+        await asyncio.wait_for(asyncio.to_thread(get_state_backend().ping), HEALTH_STATE_BACKEND_TIMEOUT)
+    except Exception:
+        return False
+    return True
+
+
+async def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    就绪检查：只看本进程能否处理事件——预热完成、调度器在运行、共享状态存储可访问
+    
+    验证API熔断、限流和阶段卡住只在 degraded 中报告，不影响就绪：它们多由上游故障引起，
+    所有实例会同时出现，摘除实例不能恢复服务，反而让事件无人处理。
+    
+    Returns:
+        Tuple: (是否就绪, 指标快照、原因及降级情况)
+    """
+    snapshot = health_snapshot()
+    reasons = []
+    if not snapshot["warmed_up"]:
+        reasons.append("warming_up")
+    if not snapshot["dispatcher"]["running"]:
+        reasons.append("dispatcher_stopped")
+    if not await _state_backend_reachable():
+        reasons.append("state_backend_unreachable")
+    
+    degraded = []
+    if verification_breaker.state == BreakerState.OPEN:
+        degraded.append("verification_api_circuit_open")
+    if snapshot["admission"]["shedding"]:
+        degraded.append("shedding_load")
+    degraded.extend(f"{name}_stalled" for name in _stalled_stages(snapshot["stages"]))
+    snapshot["reasons"] = reasons
+    snapshot["degraded"] = degraded
+    return not reasons, snapshot
@@ -0,0 +1,196 @@
+"""
+Long-connection event intake.
+This module receives events over one persistent WebSocket connection instead of
+HTTP webhooks and feeds them into the same dispatcher as the webhook route.
+
+Two transports are supported:
+- Feishu's long-connection protocol through lark_oapi.ws (default); the
+  connection belongs to one app, so it uses the default tenant's credentials
+- plain JSON frames from EVENT_INTAKE_WS_URL, used with a relay or with
+  tools/ws_replay_server.py for local testing
+"""
+import asyncio
+import random
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+from config.config import (
+    FEISHU_APP_ID,
+    FEISHU_APP_SECRET,
+    EVENT_INTAKE_WS_URL,
+    WS_RECONNECT_BASE_DELAY,
+    WS_RECONNECT_MAX_DELAY
+)
+from app.bot.handlers import handle_bot_event
+from utils.authentication import loads_json
+from utils.deadline import start_deadline
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+async def submit_event(event_data: Dict[str, Any]) -> None:
+    """
+    把长连接收到的事件交给事件处理入口，与webhook一样从收到时开始计算时间预算
+    
+    Args:
+        event_data: 事件数据
+    """
+    start_deadline()
+    await handle_bot_event(event_data)
+
+
+class _LarkEventBridge:
+    """
+    lark_oapi.ws.Client 的事件处理器
+
+    SDK在自己的线程中收到事件后调用 do_without_validation，这里把原始事件转交到主事件循环解析和处理。
+    """
+
+    def __init__(self, intake: "LongConnectionIntake", loop: asyncio.AbstractEventLoop):
+        self._intake = intake
+        self._loop = loop
+
+    def do_without_validation(self, payload: bytes) -> None:
+        self._intake.received += 1
+        future = asyncio.run_coroutine_threadsafe(self._intake.handle_frame(payload), self._loop)
+        future.add_done_callback(_log_bridge_failure)
+
+
+def _log_bridge_failure(future: Future) -> None:
+    """记录转交到主事件循环后未能处理的事件（handle_frame 之外的错误，如主循环已关闭）"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error("长连接事件转交失败: %r", error)
+
+
+class LongConnectionIntake:
+    """
+    长连接事件接入
+
+    配置了 EVENT_INTAKE_WS_URL 时连接该地址并按JSON帧接收事件，断线后按指数退避重连；
+    否则使用飞书官方长连接（由SDK负责重连，SDK不提供连接状态，统计中不报告 connected）。
+    单个事件解析或处理失败只记录日志，不断开连接。
+    """
+
+    def __init__(
+        self,
+        url: str = EVENT_INTAKE_WS_URL,
+        base_delay: float = WS_RECONNECT_BASE_DELAY,
+        max_delay: float = WS_RECONNECT_MAX_DELAY
+    ):
+        self.url = url
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self.connected = False
+        self.received = 0
+        self.failed = 0
+        self.reconnects = 0
+
+    async def start(self) -> None:
+        """开始接收事件"""
+        if self.url:
+            self._task = asyncio.create_task(self._run_json_stream(), name="ws-intake")
+        else:
+            self._thread = threading.Thread(
+                target=self._run_lark_client,
+                args=(asyncio.get_running_loop(),),
+                name="lark-ws-intake",
+                daemon=True
+            )
+            self._thread.start()
+        logger.info("长连接事件接入已启动: %s", self.url or 'feishu')
+
+    async def stop(self) -> None:
+        """停止接收事件（SDK线程为守护线程，随进程退出）"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.connected = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取长连接统计信息
+        
+        Returns:
+            Dict: 连接状态（仅JSON帧方式）、收到和处理失败的事件数、重连次数
+        """
+        if not self.url:
+            return {"transport": "feishu", "received": self.received, "failed": self.failed}
+        return {
+            "transport": "json",
+            "connected": self.connected,
+            "received": self.received,
+            "failed": self.failed,
+            "reconnects": self.reconnects,
+        }
+
+    async def handle_frame(self, message: Any) -> None:
+        """
+        解析并处理一帧事件，失败只记录日志
+
+        Args:
+            message: 原始帧（JSON文本或字节）
+        """
+        try:
+            await submit_event(loads_json(message))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            logger.exception("长连接事件处理失败")
+
+    async def _run_json_stream(self) -> None:
+        import websockets
+        
+        delay = self.base_delay
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    self.connected = True
+                    delay = self.base_delay
+                    logger.info("长连接已建立: %s", self.url)
+                    async for message in websocket:
+                        self.received += 1
+                        await self.handle_frame(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # handle_frame 不抛出异常，到这里的只有连接错误
+                logger.warning("长连接断开: %s", e)
+            
+            self.connected = False
+            self.reconnects += 1
+            # 指数退避加随机抖动
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(self.max_delay, delay * 2)
+
+    def _run_lark_client(self, main_loop: asyncio.AbstractEventLoop) -> None:
+        import lark_oapi as lark
+        import lark_oapi.ws.client as ws_client
+        
+        # SDK在导入时绑定了事件循环，这里换成本线程自己的循环，避免与主循环冲突
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        ws_client.loop = loop
+        
+        client = lark.ws.Client(
+            FEISHU_APP_ID,
+            FEISHU_APP_SECRET,
+            event_handler=_LarkEventBridge(self, main_loop),
+            log_level=lark.LogLevel.INFO,
+            auto_reconnect=True
+        )
+        client.start()
+
+
+# 全局长连接实例（EVENT_INTAKE_MODE为websocket时启动）
+long_connection_intake = LongConnectionIntake()
@@ -1,34 +1,58 @@
 import uvicorn
+import asyncio
+import json
+import signal
 import time
 import threading
 import logging
-from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from typing import Optional
+from fastapi import FastAPI, Request, HTTPException, Header, Depends
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response
 
 from config.config import (
     HOST, PORT, DEBUG, 
-    BOT_EVENT_CALLBACK_PATH
+    BOT_EVENT_CALLBACK_PATH,
+    OUTBOX_ENABLED,
+    EVENT_INTAKE_MODE,
+    PROFILER_SIGNAL_SECONDS,
+    PROFILER_SIGNAL_TARGET
 )
-from app.bot.handlers import handle_bot_event
-from utils.authentication import verify_feishu_request
+from app.bot.handlers import handle_bot_event, event_dispatcher, admission_controller
+from utils.authentication import read_feishu_event, verify_admin_token, InvalidEventError
+from utils.deadline import start_deadline
+from utils.bulkhead import bulkhead_stats
+from utils.outbox import outbox
+from utils.error_handler import retry_stats
+from utils.responses import event_response, PathFilteredCORSMiddleware
+from utils.metrics import render_metrics
+from utils.tracing import slowest_traces
+from utils.profiler import profiler, ProfilerBusy
+from utils.recorder import event_recorder
+from utils.routing import RoutingTable
+from utils.tenants import tenant_registry
+from app.verification.api_client import close_verification_client
+from app.intake.long_connection import long_connection_intake
+from app.warmup import run_warmup, warmup_report
+from app.health import liveness, readiness
 from utils.memory_store import close_memory_store, cleanup_expired_states
+from utils.qr_ledger import qr_token_ledger
+from utils.log_config import setup_logging, shutdown_logging
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO if DEBUG else logging.WARNING,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志：后台线程写出JSON日志
+setup_logging()
 logger = logging.getLogger('xiaohuo-bot')
 
 app = FastAPI(
     title="小火机器人 API",
     description="小火飞书机器人API，用于群组验证和管理",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
+# 飞书回调不经过CORS处理
 app.add_middleware(
-    CORSMiddleware,
+    PathFilteredCORSMiddleware,
+    exclude_paths=[BOT_EVENT_CALLBACK_PATH],
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
@@ -37,26 +61,59 @@ app.add_middleware(
 
 # 后台线程：定期清理过期状态
 cleanup_thread = None
+warmup_task = None
 shutdown_flag = False
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not verify_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+
+def toggle_profiler():
+    """SIGUSR2: 未在分析时开始一次分析，正在分析时提前结束"""
+    if profiler.active:
+        profiler.stop()
+        return
+    try:
+        profiler.start(PROFILER_SIGNAL_SECONDS, target=PROFILER_SIGNAL_TARGET or None)
+    except ValueError as e:
+        logger.error("无法开始性能分析: %s", e)
+
 def cleanup_thread_func():
     global shutdown_flag
     while not shutdown_flag:
         try:
             cleanup_expired_states()
+            qr_token_ledger.cleanup()
         except Exception as e:
-            logger.error(f"状态清理出错: {e}")
+            logger.error("状态清理出错: %s", e)
         # 每60秒清理一次
         time.sleep(60)
 
 @app.on_event("startup")
 async def startup_event():
-    global cleanup_thread, shutdown_flag
+    global cleanup_thread, shutdown_flag, warmup_task
     # 重置关闭标志
     shutdown_flag = False
     # 启动清理线程
     cleanup_thread = threading.Thread(target=cleanup_thread_func, daemon=True)
     cleanup_thread.start()
+    # 打开发件箱并重放上次未完成的出站操作
+    if OUTBOX_ENABLED:
+        await outbox.start()
+    # 加载各租户的群组路由配置文件并监视修改，后台获取并定期刷新各租户的访问凭证
+    await tenant_registry.start()
+    # 启动事件调度器
+    event_dispatcher.start()
+    # 长连接模式下通过持久连接接收事件
+    if EVENT_INTAKE_MODE == "websocket":
+        await long_connection_intake.start()
+    # 收到SIGUSR2时开始或结束性能分析
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, toggle_profiler)
+    except (NotImplementedError, AttributeError):
+        pass
+    # 后台预热：导入SDK和解码库、获取凭证、建立连接、检查群组配置，完成后才报告就绪
+    warmup_task = asyncio.create_task(run_warmup())
     logger.info("应用已启动，状态清理线程已开始运行")
 
 @app.on_event("shutdown")
@@ -64,23 +121,155 @@ async def shutdown_event():
     global shutdown_flag
     # 设置关闭标志
     shutdown_flag = True
+    profiler.stop()
+    # 预热未完成时取消
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # 停止接收新事件
+    await long_connection_intake.stop()
+    # 停止事件调度器
+    await event_dispatcher.stop()
+    # 提交发件箱剩余写入，未完成的操作下次启动时重放
+    await outbox.stop()
+    # 写出剩余的录制事件
+    event_recorder.close()
+    await tenant_registry.stop()
     # 关闭内存存储
     await close_memory_store()
+    # 关闭验证API连接池
+    await close_verification_client()
     logger.info("应用已关闭，资源已清理")
+    # 写出剩余日志
+    shutdown_logging()
 
 @app.get("/")
 async def root():
     return {"status": "ok", "message": "小火机器人API正在运行"}
 
-@app.post(BOT_EVENT_CALLBACK_PATH)
-async def bot_event(request: Request, authenticated: bool = Depends(verify_feishu_request)):
-    # 处理认证失败的情况
-    if not authenticated:
+@app.get("/healthz")
+async def healthz():
+    healthy, snapshot = liveness()
+    return ORJSONResponse(snapshot, status_code=200 if healthy else 503)
+
+@app.get("/readyz")
+async def readyz():
+    ready, snapshot = await readiness()
+    return ORJSONResponse(snapshot, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces", dependencies=[Depends(require_admin)])
+async def traces(limit: int = 20, open_id: Optional[str] = None):
+    return slowest_traces(limit, open_id)
+
+@app.get("/debug/profile", dependencies=[Depends(require_admin)])
+async def profile_status():
+    return profiler.stats()
+
+@app.post("/debug/profile", dependencies=[Depends(require_admin)])
+async def start_profile(
+    seconds: float = 30,
+    requests: Optional[int] = None,
+    target: Optional[str] = None,
+    output: str = "collapsed"
+):
+    try:
+        return profiler.start(seconds, requests=requests, target=target, output=output)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/debug/profile/stop", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    return {"result": profiler.stop()}
+
+def _tenant_routing(app_id: Optional[str]) -> RoutingTable:
+    # 未指定app_id时为默认租户
+    tenant = tenant_registry.get(app_id) if app_id else tenant_registry.default
+    if tenant is None:
+        raise HTTPException(status_code=404, detail=f"未配置的应用: {app_id}")
+    return tenant.routing
+
+@app.get("/debug/tenants", dependencies=[Depends(require_admin)])
+async def tenants():
+    return tenant_registry.stats()
+
+@app.get("/debug/routing", dependencies=[Depends(require_admin)])
+async def routing_status(app_id: Optional[str] = None):
+    return _tenant_routing(app_id).stats()
+
+@app.post("/debug/routing/reload", dependencies=[Depends(require_admin)])
+async def reload_routing(request: Request, app_id: Optional[str] = None):
+    routing_table = _tenant_routing(app_id)
+    # 请求体为 {"group_types": {...}} 时加载提交的配置，否则重新读取配置文件
+    body = await request.body()
+    try:
+        if body.strip():
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("请求体必须是JSON对象")
+            routing_table.load(data.get("group_types"), source="admin")
+        else:
+            await routing_table.reload_from_file()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return routing_table.stats()
+
+@app.get("/debug/recording", dependencies=[Depends(require_admin)])
+async def recording():
+    return event_recorder.stats()
+
+@app.get("/debug/qr_tokens", dependencies=[Depends(require_admin)])
+async def qr_tokens():
+    return qr_token_ledger.stats()
+
+@app.get("/debug/warmup", dependencies=[Depends(require_admin)])
+async def warmup():
+    return warmup_report
+
+@app.get("/debug/bulkheads", dependencies=[Depends(require_admin)])
+async def bulkheads():
+    return bulkhead_stats()
+
+@app.get("/debug/dispatcher", dependencies=[Depends(require_admin)])
+async def dispatcher():
+    return event_dispatcher.stats()
+
+@app.get("/debug/admission", dependencies=[Depends(require_admin)])
+async def admission():
+    return admission_controller.stats()
+
+@app.get("/debug/outbox", dependencies=[Depends(require_admin)])
+async def outbox_stats():
+    return outbox.stats()
+
+@app.get("/debug/intake", dependencies=[Depends(require_admin)])
+async def intake():
+    return long_connection_intake.stats()
+
+@app.get("/debug/retries", dependencies=[Depends(require_admin)])
+async def retries():
+    return retry_stats()
+
+async def bot_event(request: Request) -> Response:
+    # 从收到webhook开始计算事件的时间预算
+    start_deadline()
+    
+    # 校验签名、解密并解析事件数据（请求体只解析一次）
+    try:
+        event_data = await read_feishu_event(request)
+    except InvalidEventError:
         raise HTTPException(status_code=401, detail="未授权的请求")
-        
-    # 解析事件数据
-    event_data = await request.json()
-    return await handle_bot_event(event_data)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的请求体")
+    
+    return event_response(await handle_bot_event(event_data))
+
+# webhook直接注册为Starlette路由，跳过FastAPI的参数解析和响应序列化
+app.router.add_route(BOT_EVENT_CALLBACK_PATH, bot_event, methods=["POST"], include_in_schema=False)
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host=HOST, port=PORT, reload=DEBUG)
@@ -3,13 +3,21 @@ QR code parser module.
 This module handles extracting QR code content from images.
 """
 import io
-from typing import Optional
-from PIL import Image
+import asyncio
+import logging
+from typing import Callable, List, Optional
 
-import lark_oapi as lark
-from lark_oapi.api.im.v1 import *
+from utils.lark_client import get_lark_client, get_request_option
+from utils.bulkhead import get_bulkhead, BulkheadFull
+from utils.error_handler import retry_async
+from utils.metrics import stage_timer
+from utils.tracing import span
 
-from utils.lark_client import get_lark_client
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+_DOWNLOAD_SECONDS = stage_timer("download")
+_DECODE_SECONDS = stage_timer("decode")
 
 async def download_image(image_key: str) -> Optional[bytes]:
     """
@@ -21,6 +29,8 @@ async def download_image(image_key: str) -> Optional[bytes]:
     Returns:
         Optional[bytes]: 图片二进制数据，失败返回None
     """
+    from lark_oapi.api.im.v1 import GetImageRequest
+    
     client = get_lark_client()
     
     try:
@@ -29,19 +39,27 @@ async def download_image(image_key: str) -> Optional[bytes]:
             .image_key(image_key) \
             .build()
         
-        # 发起请求
-        response = client.im.v1.image.get(request)
+        async def get_image():
+            option = await get_request_option()
+            return await asyncio.to_thread(client.im.v1.image.get, request, option)
+        
+        # 在线程中发起请求，避免阻塞事件循环；临时错误按重试策略重试
+        async with get_bulkhead("image_download"):
+            with _DOWNLOAD_SECONDS.time(), span("lark.image.get"):
+                response = await retry_async("download_image", get_image)
         
         # 处理响应
         if response.success():
             # 将文件对象读取为二进制数据
             return response.file.read()
         else:
-            print(f"Error downloading image: code={response.code}, msg={response.msg}")
+            logger.error("下载图片失败: code=%s, msg=%s", response.code, response.msg)
             return None
     
+    except BulkheadFull:
+        raise
     except Exception as e:
-        print(f"Exception downloading image: {str(e)}")
+        logger.error("下载图片出错: %s", e)
         return None
 
 async def extract_qr_code(image_data: bytes) -> Optional[str]:
@@ -54,45 +72,87 @@ async def extract_qr_code(image_data: bytes) -> Optional[str]:
     Returns:
         Optional[str]: 二维码内容，如果无法提取则返回None
     """
+    # 解码是CPU密集操作，放到线程中执行，超时取消时不会卡住事件循环
+    async with get_bulkhead("qr_decode"):
+        with _DECODE_SECONDS.time(), span("qr.decode", size=len(image_data)):
+            return await asyncio.to_thread(_decode_qr_code, image_data)
+
+# 可用的解码器，按优先级排列；由 warm_up_decoders 在启动时初始化
+_decoders: Optional[List[Callable[[bytes], Optional[str]]]] = None
+
+def _decode_with_pyzbar(image_data: bytes) -> Optional[str]:
+    """使用pyzbar解析（速度更快，更准确）"""
+    from PIL import Image
+    from pyzbar.pyzbar import decode
+    
+    # 使用PIL打开图片
+    image = Image.open(io.BytesIO(image_data))
+    
+    # 解析图片中的二维码
+    decoded_objects = decode(image)
+    
+    # 返回第一个解析到的二维码内容
+    if decoded_objects:
+        return decoded_objects[0].data.decode('utf-8')
+    return None
+
+def _decode_with_opencv(image_data: bytes) -> Optional[str]:
+    """使用OpenCV的QRCodeDetector解析"""
+    import cv2
+    import numpy as np
+    
+    # 将图片数据转换为OpenCV格式
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    qr_detector = cv2.QRCodeDetector()
+    data, bbox, _ = qr_detector.detectAndDecode(img)
+    return data or None
+
+def warm_up_decoders() -> List[str]:
+    """
+    导入并初始化二维码解码库，避免首个二维码请求承担导入开销
+    
+    Returns:
+        List[str]: 可用的解码器名称
+    """
+    global _decoders
+    
+    decoders = []
     try:
-        # 首先尝试使用pyzbar库解析（速度更快，更准确）
-        try:
-            from pyzbar.pyzbar import decode
-            
-            # 使用PIL打开图片
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 解析图片中的二维码
-            decoded_objects = decode(image)
-            
-            # 返回第一个解析到的二维码内容
-            if decoded_objects:
-                return decoded_objects[0].data.decode('utf-8')
-        except ImportError:
-            # 如果pyzbar不可用，尝试使用qrcode库（仅作为备选方案）
-            pass
-        
-        # 备选：使用OpenCV尝试解析
-        try:
-            import cv2
-            import numpy as np
-            
-            # 将图片数据转换为OpenCV格式
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # 使用OpenCV的QRCodeDetector
-            qr_detector = cv2.QRCodeDetector()
-            data, bbox, _ = qr_detector.detectAndDecode(img)
-            
+        import PIL.Image
+        import pyzbar.pyzbar
+        decoders.append(_decode_with_pyzbar)
+    except ImportError:
+        pass
+    
+    try:
+        import cv2
+        import numpy
+        decoders.append(_decode_with_opencv)
+    except ImportError:
+        pass
+    
+    if not decoders:
+        logger.warning("没有可用的二维码解码库（pyzbar或opencv）")
+    
+    _decoders = decoders
+    return [decoder.__name__ for decoder in decoders]
+
+def _decode_qr_code(image_data: bytes) -> Optional[str]:
+    """同步解析二维码（在工作线程中执行），依次尝试可用的解码器"""
+    if _decoders is None:
+        warm_up_decoders()
+    
+    try:
+        for decoder in _decoders:
+            data = decoder(image_data)
             if data:
                 return data
-        except ImportError:
-            pass
         
-        # 如果前面的方法都失败了，返回None
+        # 如果所有方法都失败了，返回None
         return None
     
     except Exception as e:
-        print(f"Error extracting QR code: {str(e)}")
+        logger.error("解析二维码出错: %s", e)
         return None
@@ -2,17 +2,156 @@
 API verification client.
 This module handles verification through the external API.
 """
+import asyncio
+import time
+import logging
 import httpx
 from typing import Dict, Any, Optional
 import json
 
 from config.config import (
     API_VERIFICATION_ENABLED,
-    API_ENDPOINT,
-    API_TOKEN,
-    EVENT_ID
+    VERIFICATION_TIMEOUT,
+    VERIFICATION_BREAKER_OPEN_POLICY,
+    VERIFICATION_FALLBACK_ALLOWLIST,
+    VERIFICATION_HEDGE_ENABLED,
+    VERIFICATION_HEDGE_MIN_DELAY,
+    VERIFICATION_HEDGE_MIN_SAMPLES
 )
 from utils.memory_store import cache_verification_result, get_cached_verification_result
+from utils.circuit_breaker import BreakerState
+from utils.latency import LatencyWindow
+from utils.deadline import timeout_for
+from utils.bulkhead import get_bulkhead, BulkheadFull
+from utils.metrics import registry, stage_timer
+from utils.tracing import span, current_span
+from utils.tenants import tenant_registry, current_tenant
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 复用的HTTP客户端（连接池，所有租户共用）
+_http_client: Optional[httpx.AsyncClient] = None
+
+# 验证API熔断器与耗时统计按租户区分，这里是默认租户的（健康检查使用）
+verification_breaker = tenant_registry.default.verification_breaker
+verification_latency = tenant_registry.default.verification_latency
+_VERIFICATION_SECONDS = stage_timer("verification_api")
+
+registry.gauge(
+    "xiaohuo_circuit_breaker_state",
+    "Circuit breaker state (1 for the current state)",
+    ["name", "state"],
+    lambda: [
+        ((tenant.verification_breaker.name, state.value), int(tenant.verification_breaker.state == state))
+        for tenant in tenant_registry
+        for state in BreakerState
+    ]
+)
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """
+    获取验证API的HTTP客户端（单例模式）
+
+    Returns:
+        httpx.AsyncClient: HTTP客户端实例
+    """
+    global _http_client
+
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=VERIFICATION_TIMEOUT)
+
+    return _http_client
+
+
+async def close_verification_client():
+    """关闭验证API的HTTP客户端"""
+    global _http_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def warm_up_connection() -> None:
+    """预先建立到各租户验证API的连接（TLS握手），放入连接池供后续请求复用"""
+    endpoints = sorted({tenant.api_endpoint for tenant in tenant_registry if tenant.api_endpoint})
+    client = _get_http_client()
+    await asyncio.gather(*(client.head(endpoint) for endpoint in endpoints))
+
+
+def _is_upstream_failure(status_code: int) -> bool:
+    """判断响应状态码是否说明上游不健康（计入熔断）"""
+    return status_code >= 500 or status_code == 429
+
+
+async def _request_once(url: str, headers: Dict[str, str], latency: LatencyWindow) -> httpx.Response:
+    """发起一次验证请求并记录耗时，超时时间不超过事件剩余预算"""
+    start = time.monotonic()
+    with span("verification_api.request") as request_span:
+        response = await _get_http_client().get(url, headers=headers, timeout=timeout_for(VERIFICATION_TIMEOUT))
+        request_span.set(status_code=response.status_code)
+    latency.observe(time.monotonic() - start)
+    return response
+
+
+async def _request_with_hedge(url: str, headers: Dict[str, str], latency: LatencyWindow) -> httpx.Response:
+    """
+    发起验证请求，超过p95耗时仍未返回时发出一个对冲请求，取先成功的结果
+
+    Args:
+        url: 请求地址
+        headers: 请求头
+        latency: 该验证API的耗时统计
+
+    Returns:
+        httpx.Response: 先成功返回的响应
+    """
+    if not VERIFICATION_HEDGE_ENABLED or len(latency) < VERIFICATION_HEDGE_MIN_SAMPLES:
+        return await _request_once(url, headers, latency)
+
+    hedge_delay = max(VERIFICATION_HEDGE_MIN_DELAY, latency.percentile(0.95))
+    tasks = [asyncio.ensure_future(_request_once(url, headers, latency))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done:
+            return tasks[0].result()
+
+        logger.info("验证API超过 %.3fs 未返回，发起对冲请求", hedge_delay)
+        tasks.append(asyncio.ensure_future(_request_once(url, headers, latency)))
+
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _breaker_open_result(user_id: str) -> Dict[str, Any]:
+    """
+    熔断打开时的降级结果
+
+    Args:
+        user_id: 用户ID（open_id）
+
+    Returns:
+        Dict: 验证结果
+    """
+    if VERIFICATION_BREAKER_OPEN_POLICY == "allowlist" and user_id in VERIFICATION_FALLBACK_ALLOWLIST:
+        logger.warning("验证API熔断中，白名单用户 %s 降级放行", user_id)
+        return {"success": True, "message": "验证通过（验证服务降级，白名单放行）"}
+
+    return {"success": False, "message": "验证服务暂时不可用，请稍后重试"}
+
 
 async def verify_user_permission(user_id: str, qr_data: str, group_type: str) -> Dict[str, Any]:
     """
@@ -31,48 +170,85 @@ async def verify_user_permission(user_id: str, qr_data: str, group_type: str) ->
     # 先检查缓存中是否有结果
     cached_result = await get_cached_verification_result(user_id, qr_data, group_type)
     if cached_result is not None:
+        current_span().set(verification_cache="hit")
         if cached_result:
             return {"success": True, "message": "验证通过（来自缓存）"}
         else:
             return {"success": False, "message": "验证失败（来自缓存）"}
     
+    # 限制同时访问验证API的请求数，排队过长时直接返回繁忙
+    try:
+        async with get_bulkhead("verification_api"):
+            with _VERIFICATION_SECONDS.time():
+                return await _call_verification_api(user_id, qr_data, group_type)
+    except BulkheadFull:
+        return {"success": False, "message": "验证服务繁忙，请稍后重试"}
+
+async def _call_verification_api(user_id: str, qr_data: str, group_type: str) -> Dict[str, Any]:
+    """
+    调用当前租户的验证API验证用户权限
+    
+    Args:
+        user_id: 用户ID（open_id）
+        qr_data: 二维码扫描结果
+        group_type: 群组类型
+        
+    Returns:
+        Dict: 验证结果，包含success和message字段
+    """
+    tenant = current_tenant()
+    breaker = tenant.verification_breaker
+    
+    # 熔断打开时不再等待上游超时
+    if not breaker.allow_request():
+        return _breaker_open_result(user_id)
+    
     # 调用外部API进行验证
     try:
         # 构建API请求
-        url = f"{API_ENDPOINT}?eventId={EVENT_ID}&id={qr_data}"
+        url = f"{tenant.api_endpoint}?eventId={tenant.event_id}&id={qr_data}"
         headers = {
-            "Authorization": API_TOKEN,
+            "Authorization": tenant.api_token,
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers=headers,
-                timeout=10.0
-            )
-            
-            # 检查响应状态
-            if response.status_code != 200:
-                error_message = f"API返回错误代码: {response.status_code}"
-                print(error_message)
-                return {"success": False, "message": error_message}
-            
-            # 解析响应内容
-            result = response.json()
-            
-            # 判断是否有权限
-            has_permission = result.get("data", {}).get("status", False)
-            
-            # 缓存验证结果
-            await cache_verification_result(user_id, qr_data, group_type, has_permission)
-            
-            if has_permission:
-                return {"success": True, "message": "验证通过"}
-            else:
-                return {"success": False, "message": "验证失败，无权限加入该群组"}
+        try:
+            response = await _request_with_hedge(url, headers, tenant.verification_latency)
+        except Exception:
+            # 网络错误和超时计为上游失败
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # 取消不代表上游故障，只归还半开状态的试探名额
+            breaker.release()
+            raise
+        
+        if _is_upstream_failure(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        
+        # 检查响应状态
+        if response.status_code != 200:
+            error_message = f"API返回错误代码: {response.status_code}"
+            logger.error(error_message)
+            return {"success": False, "message": error_message}
+        
+        # 解析响应内容
+        result = response.json()
+        
+        # 判断是否有权限
+        has_permission = result.get("data", {}).get("status", False)
+        
+        # 缓存验证结果
+        await cache_verification_result(user_id, qr_data, group_type, has_permission)
+        
+        if has_permission:
+            return {"success": True, "message": "验证通过"}
+        else:
+            return {"success": False, "message": "验证失败，无权限加入该群组"}
     
     except Exception as e:
         error_message = f"API调用出错: {str(e)}"
-        print(error_message)
+        logger.error(error_message)
         return {"success": False, "message": error_message}
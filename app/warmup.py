@@ -0,0 +1,138 @@
+"""
+Startup warm-up.
+This module moves one-off costs out of the first user requests and into
+application startup: SDK import and client construction, tenant token
+acquisition, connection setup to the verification API, QR decoder
+initialization, and validation of every chat configured in GROUP_TYPES.
+With several tenants, every tenant's token and chats are warmed up.
+"""
+import asyncio
+import io
+import time
+import logging
+from typing import Any, Awaitable, Dict
+
+from app.qrcode.parser import warm_up_decoders, extract_qr_code
+from app.verification.api_client import warm_up_connection
+from utils.lark_client import get_lark_client, get_request_option
+from utils.tenants import Tenant, tenant_registry
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 预热结果：是否完成、各步骤耗时、群组信息
+warmup_report: Dict[str, Any] = {
+    "ready": False,
+    "timings": {},
+    "errors": {},
+}
+
+# 已配置群组的信息: chat_id -> {"name", "user_count"}
+chat_metadata: Dict[str, Dict[str, Any]] = {}
+
+
+def warm_up_imports() -> Dict[str, float]:
+    """
+    导入并初始化首个请求会用到的重量级模块（同步执行，应放在线程中调用）
+    
+    Returns:
+        Dict: 各步骤耗时（秒）
+    """
+    timings = {}
+    
+    start = time.perf_counter()
+    for tenant in tenant_registry:
+        get_lark_client(tenant)
+    import lark_oapi.api.im.v1  # 消息、图片、群成员请求构造器
+    timings["lark_sdk"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    decoders = warm_up_decoders()
+    timings["qr_decoders"] = time.perf_counter() - start
+    
+    logger.info("模块预热完成: 可用解码器=%s", decoders)
+    return timings
+
+
+async def _warm_up_decoder_workers() -> None:
+    """在工作线程中解码一张生成的二维码，让解码线程和解码库的内部状态提前就绪"""
+    try:
+        import qrcode
+    except ImportError:
+        return
+    
+    buffer = io.BytesIO()
+    qrcode.make("warmup").save(buffer, format="PNG")
+    await extract_qr_code(buffer.getvalue())
+
+
+async def _fetch_chat(tenant: Tenant, chat_id: str) -> Dict[str, Any]:
+    """获取群组名称和成员数"""
+    from lark_oapi.api.im.v1 import GetChatRequest
+    
+    request = GetChatRequest.builder().chat_id(chat_id).build()
+    option = await get_request_option(tenant)
+    response = await asyncio.to_thread(get_lark_client(tenant).im.v1.chat.get, request, option)
+    if not response.success():
+        raise RuntimeError(f"code={response.code}, msg={response.msg}")
+    return {"name": response.data.name, "user_count": response.data.user_count}
+
+
+async def _warm_up_chats() -> None:
+    """并发获取所有租户已配置群组的信息，配置错误的chat_id在启动时即可发现"""
+    chats = sorted({
+        (tenant.app_id, chat_id)
+        for tenant in tenant_registry
+        for group in tenant.routing.current.group_types.values()
+        for chat_id in group.get("chat_ids", [])
+    })
+    results = await asyncio.gather(
+        *(_fetch_chat(tenant_registry.get(app_id), chat_id) for app_id, chat_id in chats),
+        return_exceptions=True
+    )
+    for (_, chat_id), result in zip(chats, results):
+        if isinstance(result, Exception):
+            warmup_report["errors"][f"chat:{chat_id}"] = str(result)
+            logger.error("群组 %s 无法访问，请检查GROUP_TYPES配置: %s", chat_id, result)
+        else:
+            chat_metadata[chat_id] = result
+            logger.info("群组 %s: %s，成员数 %s", chat_id, result['name'], result['user_count'])
+
+
+async def _timed(name: str, awaitable: Awaitable[Any]) -> None:
+    """执行一个预热步骤并记录耗时，失败只记录不抛出"""
+    start = time.perf_counter()
+    try:
+        await awaitable
+    except Exception as e:
+        warmup_report["errors"][name] = str(e)
+        logger.error("预热步骤 %s 失败: %s", name, e)
+    warmup_report["timings"][name] = round(time.perf_counter() - start, 3)
+
+
+async def run_warmup() -> Dict[str, Any]:
+    """
+    执行启动预热，全部步骤完成后才标记为就绪
+    
+    Returns:
+        Dict: 预热结果
+    """
+    start = time.perf_counter()
+    
+    # 第一阶段：导入模块、获取访问凭证、建立验证API连接，互不依赖
+    await asyncio.gather(
+        _timed("imports", asyncio.to_thread(warm_up_imports)),
+        _timed("tenant_token", tenant_registry.refresh_tokens()),
+        _timed("verification_api", warm_up_connection()),
+    )
+    
+    # 第二阶段：依赖SDK和凭证的群组检查，以及解码线程预热
+    await asyncio.gather(
+        _timed("chats", _warm_up_chats()),
+        _timed("decoder_workers", _warm_up_decoder_workers()),
+    )
+    
+    warmup_report["timings"]["total"] = round(time.perf_counter() - start, 3)
+    warmup_report["ready"] = True
+    logger.warning("启动预热完成，耗时明细: %s", warmup_report['timings'])
+    return warmup_report
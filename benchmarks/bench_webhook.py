@@ -0,0 +1,76 @@
+"""
+Webhook路由吞吐量基准测试
+使用进程内ASGI客户端反复调用事件回调路由，统计每秒请求数和延迟分位数。
+
+用法:
+    python -m benchmarks.bench_webhook --requests 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from config.config import BOT_EVENT_CALLBACK_PATH
+from app.main import app
+
+# 未注册处理逻辑的事件类型，只测量路由本身的开销
+_EVENT_BODY = json.dumps({
+    "schema": "2.0",
+    "header": {"event_id": "bench", "event_type": "bench.noop_v1"},
+    "event": {}
+}).encode()
+
+
+async def _run(total: int, concurrency: int) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                response = await client.post(
+                    BOT_EVENT_CALLBACK_PATH,
+                    content=_EVENT_BODY,
+                    headers={"content-type": "application/json"}
+                )
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        # 预热
+        await client.post(BOT_EVENT_CALLBACK_PATH, content=_EVENT_BODY)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    return {
+        "benchmark": "webhook",
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(percentile(0.5), 3),
+        "p99_ms": round(percentile(0.99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook路由吞吐量基准测试")
+    parser.add_argument("--requests", type=int, default=20000, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发数")
+    args = parser.parse_args()
+
+    result = asyncio.run(_run(args.requests, args.concurrency))
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+端到端压测的进程内运行环境
+在导入应用之前把飞书接口和验证API指向替身服务器，然后在当前进程中启动FastAPI应用，
+以签名后的webhook请求投递事件，并从追踪和指标中汇总每个阶段的耗时。
+
+用法:
+    configure(stub.url, workdir)      # 必须在导入 app.* 之前调用
+    async with AppRunner() as runner:
+        await runner.post_event(event)
+        await runner.drain()
+        report = runner.report(elapsed)
+"""
+import base64
+import hashlib
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# 压测时使用的事件订阅Encrypt Key，请求按该Key签名
+ENCRYPT_KEY = "loadtest-encrypt-key"
+
+
+def configure(stub_url: str, workdir: str, **overrides: str) -> None:
+    """
+    设置压测用的环境变量，必须在导入 config 和 app 之前调用
+
+    Args:
+        stub_url: 替身服务器地址
+        workdir: 存放状态库和发件箱的临时目录
+        overrides: 额外的环境变量
+    """
+    env = {
+        "FEISHU_DOMAIN": stub_url,
+        "FEISHU_APP_ID": "cli_loadtest",
+        "FEISHU_APP_SECRET": "loadtest-secret",
+        "FEISHU_ENCRYPT_KEY": ENCRYPT_KEY,
+        "API_ENDPOINT": f"{stub_url}/verify",
+        "API_TOKEN": "loadtest-token",
+        "EVENT_ID": "loadtest",
+        "STATE_BACKEND_PATH": os.path.join(workdir, "state.db"),
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.db"),
+        "EVENT_INTAKE_MODE": "webhook",
+        "TRACING_ENABLED": "True",
+        "TRACE_BUFFER_SIZE": "1000000",
+        "TRACE_EXPORT_PATH": "",
+        "LOG_LEVEL": "WARNING",
+    }
+    env.update(overrides)
+    os.environ.update(env)
+
+
+def sign_headers(body: bytes, encrypt_key: str = ENCRYPT_KEY) -> Dict[str, str]:
+    """
+    生成飞书事件签名请求头
+
+    Args:
+        body: 请求体
+        encrypt_key: 事件订阅的 Encrypt Key
+
+    Returns:
+        Dict: 请求头
+    """
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    signature = hashlib.sha256((timestamp + nonce + encrypt_key).encode() + body).hexdigest()
+    return {
+        "content-type": "application/json",
+        "x-lark-request-timestamp": timestamp,
+        "x-lark-request-nonce": nonce,
+        "x-lark-signature": signature,
+    }
+
+
+def text_content(text: str) -> str:
+    """消息事件中文本消息的content字段（与handlers中的解析方式一致）"""
+    return base64.b64encode(json.dumps({"text": text}, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def image_content(image_key: str) -> str:
+    """消息事件中图片消息的content字段（与handlers中的解析方式一致）"""
+    return base64.b64encode(json.dumps({"image_key": image_key}).encode("utf-8")).decode("ascii")
+
+
+def message_event(open_id: str, message_type: str, content: str) -> Dict[str, Any]:
+    """
+    构造 im.message.receive_v1 事件
+
+    Args:
+        open_id: 发送者open_id
+        message_type: 消息类型，text 或 image
+        content: 消息内容，见 text_content / image_content
+
+    Returns:
+        Dict: 事件数据
+    """
+    event_id = uuid.uuid4().hex
+    return {
+        "schema": "2.0",
+        "header": {
+            "event_id": event_id,
+            "event_type": "im.message.receive_v1",
+            "create_time": str(int(time.time() * 1000)),
+            "app_id": os.environ.get("FEISHU_APP_ID", ""),
+        },
+        "event": {
+            "sender": {"sender_id": {"open_id": open_id}, "sender_type": "user"},
+            "message": {
+                "message_id": f"om_{event_id}",
+                "chat_type": "p2p",
+                "message_type": message_type,
+                "content": content,
+            },
+        },
+    }
+
+
+def card_action_event(open_id: str, value: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    构造 im.message.action.v1 卡片交互事件
+
+    Args:
+        open_id: 点击者open_id
+        value: 按钮的value
+
+    Returns:
+        Dict: 事件数据
+    """
+    return {
+        "schema": "2.0",
+        "header": {
+            "event_id": uuid.uuid4().hex,
+            "event_type": "im.message.action.v1",
+            "create_time": str(int(time.time() * 1000)),
+            "app_id": os.environ.get("FEISHU_APP_ID", ""),
+        },
+        "event": {
+            "operator": {"operator_id": {"open_id": open_id}},
+            "action": {"value": json.dumps(value, ensure_ascii=False)},
+        },
+    }
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """
+    计算耗时分位数（毫秒）
+
+    Args:
+        values: 耗时（秒）
+
+    Returns:
+        Dict: count、p50、p95、p99、max
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class AppRunner:
+    """
+    在当前进程中运行应用：执行启动事件、等待预热完成，并通过ASGI客户端投递webhook请求
+    """
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.status_codes: Dict[int, int] = defaultdict(int)
+        self.request_seconds: List[float] = []
+
+    async def __aenter__(self) -> "AppRunner":
+        import app.main as main_module
+        from config.config import BOT_EVENT_CALLBACK_PATH
+
+        self._main = main_module
+        self._path = BOT_EVENT_CALLBACK_PATH
+        await main_module.startup_event()
+        if main_module.warmup_task is not None:
+            await main_module.warmup_task
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main_module.app), base_url="http://loadtest"
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.client.aclose()
+        await self._main.shutdown_event()
+
+    async def post_event(self, event: Dict[str, Any]) -> int:
+        """
+        以签名的webhook请求投递一个事件
+
+        Args:
+            event: 事件数据
+
+        Returns:
+            int: HTTP状态码
+        """
+        body = json.dumps(event, ensure_ascii=False).encode("utf-8")
+        started = time.perf_counter()
+        response = await self.client.post(self._path, content=body, headers=sign_headers(body))
+        self.request_seconds.append(time.perf_counter() - started)
+        self.status_codes[response.status_code] += 1
+        return response.status_code
+
+    async def drain(self) -> None:
+        """等待调度器中已提交的事件全部处理完毕"""
+        await self._main.event_dispatcher.join()
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """
+        汇总本次运行的结果
+
+        Args:
+            elapsed: 从开始投递到处理完毕的时长（秒）
+
+        Returns:
+            Dict: 吞吐量、webhook响应耗时、每个事件类型和阶段的耗时分位数、处理结果计数和峰值内存
+        """
+        from utils.metrics import EVENTS_TOTAL, VERIFICATIONS_TOTAL
+        from utils.tracing import recent_traces
+
+        events: Dict[str, List[float]] = defaultdict(list)
+        stages: Dict[str, List[float]] = defaultdict(list)
+        for trace in recent_traces():
+            for span in trace["spans"]:
+                if span["parent_id"] is None:
+                    events[span["name"]].append(span["duration"])
+                else:
+                    stages[span["name"]].append(span["duration"])
+
+        total = sum(self.status_codes.values())
+        return {
+            "events": total,
+            "seconds": round(elapsed, 3),
+            "events_per_second": round(total / elapsed, 1) if elapsed else None,
+            "status_codes": {str(code): count for code, count in sorted(self.status_codes.items())},
+            "webhook": percentiles(self.request_seconds),
+            "event_types": {name: percentiles(values) for name, values in sorted(events.items())},
+            "stages": {name: percentiles(values) for name, values in sorted(stages.items())},
+            "outcomes": {
+                "events": {"/".join(labels): child.value for labels, child in EVENTS_TOTAL._children.items()},
+                "verifications": {"/".join(labels): child.value for labels, child in VERIFICATIONS_TOTAL._children.items()},
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
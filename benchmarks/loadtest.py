@@ -0,0 +1,127 @@
+"""
+端到端压测
+在本地子进程中启动飞书接口和验证API的替身服务器，在当前进程中运行应用，
+按目标速率开始合成会话（文本 → 点击群组卡片 → 发送二维码图片），
+结束后输出吞吐量、各阶段耗时分位数和峰值内存（JSON，可在多次运行间对比）。
+
+用法:
+    python -m benchmarks.loadtest --users 500 --rate 50 --output results/loadtest.json
+    python -m benchmarks.loadtest --users 200 --rate 20 --verify-latency 0.5 --verify-error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Dict
+
+from benchmarks.harness import AppRunner, card_action_event, configure, image_content, message_event, text_content
+from benchmarks.stubs import StubConfig, StubServer, image_key_for
+
+
+async def conversation(runner: AppRunner, index: int, group_type: str, think: float, rng: random.Random) -> None:
+    """
+    一个用户的完整会话
+
+    Args:
+        runner: 应用运行环境
+        index: 用户序号，决定open_id和二维码内容
+        group_type: 选择的群组类型
+        think: 两步之间的平均间隔（秒）
+        rng: 随机数生成器
+    """
+    open_id = f"ou_loadtest_{index:06d}"
+    steps = (
+        message_event(open_id, "text", text_content("你好")),
+        card_action_event(open_id, {"type": "group_selection", "group_type": group_type}),
+        message_event(open_id, "image", image_content(image_key_for(f"ticket-{index:06d}"))),
+    )
+    for step, event in enumerate(steps):
+        if step and think > 0:
+            await asyncio.sleep(think * rng.uniform(0.5, 1.5))
+        await runner.post_event(event)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    async with AppRunner() as runner:
+        from utils.routing import current_routing
+
+        group_types = current_routing().selectable
+        rng = random.Random(args.seed)
+        tasks = []
+        started = time.perf_counter()
+        for index in range(args.users):
+            # 按目标速率开始新会话（泊松到达）
+            tasks.append(asyncio.create_task(
+                conversation(runner, index, group_types[index % len(group_types)], args.think, rng)
+            ))
+            if args.rate > 0:
+                await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        await runner.drain()
+        return runner.report(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测（本地替身服务器）")
+    parser.add_argument("--users", type=int, default=200, help="会话数")
+    parser.add_argument("--rate", type=float, default=20, help="每秒开始的会话数，0表示同时开始")
+    parser.add_argument("--think", type=float, default=0.5, help="会话中两步之间的平均间隔（秒）")
+    parser.add_argument("--feishu-latency", type=float, default=0.05, help="飞书接口平均延迟（秒）")
+    parser.add_argument("--image-latency", type=float, default=0.1, help="图片下载平均延迟（秒）")
+    parser.add_argument("--feishu-error-rate", type=float, default=0.0, help="飞书接口错误比例")
+    parser.add_argument("--verify-latency", type=float, default=0.1, help="验证API平均延迟（秒）")
+    parser.add_argument("--verify-error-rate", type=float, default=0.0, help="验证API返回503的比例")
+    parser.add_argument("--deny-rate", type=float, default=0.1, help="验证API判定无权限的比例")
+    parser.add_argument("--qr-box-size", type=int, default=10, help="二维码模块像素大小，决定图片尺寸")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", help="结果JSON写入的文件，默认只输出到标准输出")
+    args = parser.parse_args()
+
+    stub_config = StubConfig(
+        feishu_latency=args.feishu_latency,
+        feishu_error_rate=args.feishu_error_rate,
+        image_latency=args.image_latency,
+        verify_latency=args.verify_latency,
+        verify_error_rate=args.verify_error_rate,
+        deny_rate=args.deny_rate,
+        qr_box_size=args.qr_box_size,
+        seed=args.seed,
+    )
+
+    with StubServer(stub_config) as stub, tempfile.TemporaryDirectory(prefix="xiaohuo-loadtest-") as workdir:
+        # 应用模块读取的配置在导入时确定，必须先设置环境变量
+        configure(stub.url, workdir)
+        result = asyncio.run(run(args))
+        stub_calls = stub.stats()["calls"]
+
+    result = {
+        "benchmark": "loadtest",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "parameters": {
+            "users": args.users,
+            "rate": args.rate,
+            "think": args.think,
+            "stubs": asdict(stub_config),
+        },
+        **result,
+        "stub_calls": stub_calls,
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,541 @@
+"""
+热点纯Python路径的微基准测试
+覆盖内存存储、卡片构造和序列化、事件签名校验、权限错误分类和二维码解析（多种图片尺寸）。
+
+每项基准先自动确定每批调用次数（每批不少于 --min-time 秒），预热后重复测量多批，
+测量期间关闭GC，以各批单次耗时的中位数作为结果，并给出最小值和四分位距。
+与基线文件对比，中位数变慢超过容差时以非零状态码退出，可用于部署前检查。
+
+基线与机器相关，应在同一台机器（或同规格的CI机器）上生成和对比。
+
+用法:
+    python -m benchmarks.micro                      # 运行并与 benchmarks/baseline.json 对比
+    python -m benchmarks.micro --filter memory_store
+    python -m benchmarks.micro --update-baseline    # 用本次结果更新基线
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import hashlib
+import inspect
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 内存存储基准的条目数
+STORE_SCALE = 100_000
+
+# 二维码图片语料：名称 -> (模块像素大小, 画布边长)，画布为0时使用二维码原始尺寸
+QR_CORPUS = {
+    "small": (4, 0),
+    "medium": (10, 0),
+    "large": (20, 0),
+    "photo": (10, 2000),
+}
+
+
+class SkipBenchmark(Exception):
+    """缺少可选依赖等原因无法运行某项基准时抛出"""
+
+
+# 已注册的基准: (名称, 返回被测调用的工厂函数)
+_BENCHMARKS: List[Tuple[str, Callable[[], Callable]]] = []
+
+
+def benchmark(name: str):
+    """
+    注册基准，被装饰的工厂函数完成准备工作并返回被测的无参调用（可以是协程函数）
+
+    Args:
+        name: 基准名称，写入结果和基线
+    """
+    def decorator(factory: Callable[[], Callable]) -> Callable[[], Callable]:
+        _BENCHMARKS.append((name, factory))
+        return factory
+    return decorator
+
+
+# ---------------------------------------------------------------- 内存存储
+
+def _fill_user_states(expire_at: float) -> List[str]:
+    from utils import memory_store
+
+    memory_store._user_states.clear()
+    user_ids = [f"ou_bench_{i:06d}" for i in range(STORE_SCALE)]
+    for user_id in user_ids:
+        memory_store._user_states[user_id] = {"state": "waiting_qr_code", "group_type": "player", "expire_at": expire_at}
+    return user_ids
+
+
+@benchmark("memory_store.get_hit")
+def bench_get_hit():
+    from utils.memory_store import get_user_state
+
+    user_ids = itertools.cycle(_fill_user_states(time.time() + 3600))
+    return lambda: get_user_state(next(user_ids))
+
+
+@benchmark("memory_store.get_miss")
+def bench_get_miss():
+    from utils.memory_store import get_user_state
+
+    _fill_user_states(time.time() + 3600)
+    return lambda: get_user_state("ou_bench_missing")
+
+
+@benchmark("memory_store.get_expired")
+def bench_get_expired():
+    from utils import memory_store
+
+    _fill_user_states(time.time() + 3600)
+    stale = {"state": "waiting_qr_code", "group_type": "player", "expire_at": 0}
+
+    async def op():
+        memory_store._user_states["ou_bench_stale"] = stale
+        return await memory_store.get_user_state("ou_bench_stale")
+    return op
+
+
+@benchmark("memory_store.set")
+def bench_set():
+    from utils.memory_store import set_user_state
+
+    user_ids = itertools.cycle(_fill_user_states(time.time() + 3600))
+    return lambda: set_user_state(next(user_ids), {"state": "waiting_group_selection"})
+
+
+@benchmark("memory_store.cleanup_scan")
+def bench_cleanup_scan():
+    """定期清理扫描全部条目（没有过期条目时），单次调用即一次全量扫描"""
+    from utils.memory_store import cleanup_expired_states
+
+    _fill_user_states(time.time() + 3600)
+    return cleanup_expired_states
+
+
+@benchmark("memory_store.verification_cache_get")
+def bench_verification_cache_get():
+    from utils import memory_store
+
+    memory_store._verification_cache.clear()
+    expire_at = time.time() + 3600
+    keys = []
+    for i in range(STORE_SCALE):
+        user_id, qr_data = f"ou_bench_{i:06d}", f"ticket-{i:06d}"
+        memory_store._verification_cache[f"{user_id}:{qr_data}:player"] = {"result": True, "expire_at": expire_at}
+        keys.append((user_id, qr_data))
+    keys = itertools.cycle(keys)
+
+    def op():
+        user_id, qr_data = next(keys)
+        return memory_store.get_cached_verification_result(user_id, qr_data, "player")
+    return op
+
+
+# ---------------------------------------------------------------- 二维码账本
+
+def _qr_ledger(owner: str):
+    """进程内缓存中已有一条记录的账本（不访问共享状态存储）"""
+    from utils.qr_ledger import QrTokenLedger
+
+    ledger = QrTokenLedger(validity=3600, retention=3600, enabled=True)
+    now = time.time()
+    ledger._entries[ledger._key("ticket-bench")] = (owner, now, now + 3600)
+    return ledger
+
+
+@benchmark("qr_ledger.check_cached")
+def bench_qr_ledger_check_cached():
+    """兑换的用户在有效期内重新提交"""
+    ledger = _qr_ledger("ou_bench")
+    return lambda: ledger.check("ticket-bench", "ou_bench")
+
+
+@benchmark("qr_ledger.check_reused")
+def bench_qr_ledger_check_reused():
+    """其他用户提交已被兑换的二维码"""
+    ledger = _qr_ledger("ou_bench_owner")
+    return lambda: ledger.check("ticket-bench", "ou_bench")
+
+
+@benchmark("qr_ledger.check_miss")
+def bench_qr_ledger_check_miss():
+    """首次提交：缓存未命中，在线程中读取临时目录下的sqlite共享存储"""
+    import tempfile
+    from utils import state_backend
+
+    directory = tempfile.mkdtemp(prefix="xiaohuo-bench-")
+    state_backend._state_backend = state_backend.SqliteStateBackend(os.path.join(directory, "state.db"))
+    ledger = _qr_ledger("ou_bench")
+    return lambda: ledger.check("ticket-unseen", "ou_bench")
+
+
+# ---------------------------------------------------------------- 卡片
+
+@benchmark("cards.group_selection")
+def bench_group_selection_card():
+    from app.bot.cards import create_group_selection_card
+
+    return lambda: json.dumps(create_group_selection_card())
+
+
+@benchmark("cards.qr_request")
+def bench_qr_request_card():
+    from app.bot.cards import create_qr_request_card
+
+    return lambda: json.dumps(create_qr_request_card("player"))
+
+
+@benchmark("cards.verification_result")
+def bench_verification_result_card():
+    from app.bot.cards import create_verification_result_card
+
+    return lambda: json.dumps(create_verification_result_card(False, "您没有加入该群组的权限"))
+
+
+# ---------------------------------------------------------------- 签名校验
+
+def _event_body() -> bytes:
+    return json.dumps({
+        "schema": "2.0",
+        "header": {"event_id": "5e3702a84e847582be8db7fb73283c02", "event_type": "im.message.receive_v1"},
+        "event": {
+            "sender": {"sender_id": {"open_id": "ou_84aad35d084aa403a838cf73ee18467"}, "sender_type": "user"},
+            "message": {
+                "message_id": "om_5ce6d572455d361153b7cb51da133945",
+                "chat_type": "p2p",
+                "message_type": "text",
+                "content": base64.b64encode(json.dumps({"text": "你好" * 100}).encode()).decode(),
+            },
+        },
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def _signed_headers(body: bytes, encrypt_key: str) -> Dict[str, str]:
+    timestamp, nonce = "1700000000", "bench-nonce"
+    signature = hashlib.sha256((timestamp + nonce + encrypt_key).encode() + body).hexdigest()
+    return {"x-lark-request-timestamp": timestamp, "x-lark-request-nonce": nonce, "x-lark-signature": signature}
+
+
+@benchmark("signature.verify")
+def bench_verify_signature():
+    from utils.authentication import verify_signature
+
+    encrypt_key = "bench-encrypt-key"
+    body = _event_body()
+    headers = _signed_headers(body, encrypt_key)
+    timestamp, nonce = headers["x-lark-request-timestamp"], headers["x-lark-request-nonce"]
+    signature = headers["x-lark-signature"]
+    return lambda: verify_signature(timestamp, nonce, signature, body, encrypt_key)
+
+
+@benchmark("signature.parse_event_body")
+def bench_parse_event_body():
+    """签名校验和JSON解析的完整入口（使用配置中的 Encrypt Key）"""
+    from config.config import ENCRYPT_KEY
+    from utils.authentication import parse_event_body
+
+    if not ENCRYPT_KEY:
+        raise SkipBenchmark("未配置 FEISHU_ENCRYPT_KEY")
+    body = _event_body()
+    headers = _signed_headers(body, ENCRYPT_KEY)
+    return lambda: parse_event_body(body, headers)
+
+
+@benchmark("signature.decrypt_event")
+def bench_decrypt_event():
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        raise SkipBenchmark("未安装 cryptography")
+    from utils.authentication import decrypt_event
+
+    encrypt_key = "bench-encrypt-key"
+    plain = _event_body()
+    padding = 16 - len(plain) % 16
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(hashlib.sha256(encrypt_key.encode()).digest()), modes.CBC(iv)).encryptor()
+    encrypted = base64.b64encode(iv + encryptor.update(plain + bytes([padding]) * padding) + encryptor.finalize()).decode()
+    return lambda: decrypt_event(encrypted, encrypt_key)
+
+
+# ---------------------------------------------------------------- 权限错误分类
+
+@benchmark("errors.check_permission.success")
+def bench_check_permission_success():
+    from utils.error_handler import check_permission_error
+
+    response = {"code": 0, "msg": "success", "data": {}}
+    return lambda: check_permission_error(response)
+
+
+@benchmark("errors.check_permission.known_code")
+def bench_check_permission_known_code():
+    from utils.error_handler import check_permission_error
+
+    response = {"code": 99991672, "msg": "Access denied. One of the following scopes is required"}
+    return lambda: check_permission_error(response)
+
+
+@benchmark("errors.check_permission.keyword")
+def bench_check_permission_keyword():
+    from utils.error_handler import check_permission_error
+
+    response = {"code": 1234567, "msg": "operator has no permission to add members to this chat"}
+    return lambda: check_permission_error(response)
+
+
+@benchmark("errors.check_permission.other")
+def bench_check_permission_other():
+    from utils.error_handler import check_permission_error
+
+    response = {"code": 1234567, "msg": "chat not found, please check the chat_id"}
+    return lambda: check_permission_error(response)
+
+
+# ---------------------------------------------------------------- 二维码解析
+
+def _qr_image(box_size: int, canvas: int) -> bytes:
+    import io
+
+    try:
+        import qrcode
+        from PIL import Image
+    except ImportError:
+        raise SkipBenchmark("未安装 qrcode 或 Pillow")
+
+    image = qrcode.make("ticket-000042-bench", box_size=box_size).get_image().convert("RGB")
+    if canvas:
+        # 模拟手机截图：二维码只占画面的一部分
+        background = Image.new("RGB", (canvas, canvas), (235, 235, 235))
+        background.paste(image, ((canvas - image.width) // 2, (canvas - image.height) // 3))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _register_qr_benchmarks() -> None:
+    for size_name, (box_size, canvas) in QR_CORPUS.items():
+        def factory(box_size=box_size, canvas=canvas):
+            from app.qrcode.parser import extract_qr_code, warm_up_decoders
+
+            image_data = _qr_image(box_size, canvas)
+            if not warm_up_decoders():
+                raise SkipBenchmark("没有可用的二维码解码库")
+            return lambda: extract_qr_code(image_data)
+        benchmark(f"qr.extract.{size_name}")(factory)
+
+
+_register_qr_benchmarks()
+
+
+# ---------------------------------------------------------------- 运行
+
+def _run_batch(op: Callable, loops: int, loop: asyncio.AbstractEventLoop, is_async: bool) -> float:
+    """执行一批调用，返回总耗时（秒）"""
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if is_async:
+            async def batch():
+                for _ in range(loops):
+                    await op()
+            started = time.perf_counter()
+            loop.run_until_complete(batch())
+        else:
+            started = time.perf_counter()
+            for _ in range(loops):
+                op()
+        return time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure(
+    op: Callable,
+    loop: asyncio.AbstractEventLoop,
+    repeat: int,
+    min_time: float,
+    warmup: float
+) -> Dict[str, Any]:
+    """
+    测量单个调用的耗时
+
+    Args:
+        op: 被测调用，协程函数时在事件循环中执行
+        loop: 事件循环
+        repeat: 测量批数
+        min_time: 每批最短时长（秒）
+        warmup: 预热时长（秒）
+
+    Returns:
+        Dict: 每批调用次数和单次耗时统计（微秒）
+    """
+    probe = op()
+    is_async = inspect.isawaitable(probe)
+    if is_async:
+        loop.run_until_complete(probe)
+
+    # 确定每批调用次数
+    loops = 1
+    while True:
+        elapsed = _run_batch(op, loops, loop, is_async)
+        if elapsed >= min_time:
+            break
+        loops = loops * 2 if elapsed <= 0 else max(loops * 2, int(loops * min_time * 1.2 / elapsed))
+
+    # 预热
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        _run_batch(op, loops, loop, is_async)
+
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        samples.append(_run_batch(op, loops, loop, is_async) / loops * 1e6)
+
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+    median = statistics.median(samples)
+    return {
+        "loops": loops,
+        "repeat": repeat,
+        "median_us": round(median, 4),
+        "min_us": round(min(samples), 4),
+        "iqr_us": round(quartiles[2] - quartiles[0], 4),
+        "rel_iqr": round((quartiles[2] - quartiles[0]) / median, 4) if median else None,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线对比，返回变慢超过容差的基准名称，并在结果中记录相对基线的变化
+
+    Args:
+        results: 本次结果
+        baseline: 基线文件内容
+        tolerance: 容差，例如0.2表示中位数变慢超过20%视为退化
+
+    Returns:
+        List[str]: 退化的基准名称
+    """
+    regressions = []
+    reference = baseline.get("results", {})
+    for name, result in results.items():
+        base = reference.get(name)
+        if not base or "median_us" not in result or not base.get("median_us"):
+            continue
+        change = result["median_us"] / base["median_us"] - 1
+        result["baseline_median_us"] = base["median_us"]
+        result["change"] = round(change, 4)
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def _machine() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点路径微基准测试")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的基准")
+    parser.add_argument("--repeat", type=int, default=15, help="测量批数")
+    parser.add_argument("--min-time", type=float, default=0.05, help="每批最短时长（秒）")
+    parser.add_argument("--warmup", type=float, default=0.2, help="每项基准的预热时长（秒）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="中位数变慢超过该比例视为退化")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果更新基线")
+    parser.add_argument("--output", help="结果JSON写入的文件")
+    parser.add_argument("--list", action="store_true", help="只列出基准名称")
+    args = parser.parse_args()
+
+    selected = [(name, factory) for name, factory in _BENCHMARKS if not args.filter or args.filter in name]
+    if args.list:
+        for name, _ in selected:
+            print(name)
+        return
+
+    # 未配置时使用固定的 Encrypt Key，使签名校验入口走完整路径（需在导入配置前设置）
+    os.environ.setdefault("FEISHU_ENCRYPT_KEY", "bench-encrypt-key")
+
+    # 被测函数中的日志照常创建记录，但不输出
+    bot_logger = logging.getLogger('xiaohuo-bot')
+    bot_logger.addHandler(logging.NullHandler())
+    bot_logger.propagate = False
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, factory in selected:
+        try:
+            op = factory()
+            results[name] = measure(op, loop, args.repeat, args.min_time, args.warmup)
+        except SkipBenchmark as e:
+            results[name] = {"skipped": str(e)}
+        summary = results[name]
+        if "skipped" in summary:
+            print(f"{name:45s} skipped: {summary['skipped']}", file=sys.stderr)
+        else:
+            print(
+                f"{name:45s} {summary['median_us']:>12.3f} µs  (min {summary['min_us']:.3f}, iqr {summary['iqr_us']:.3f})",
+                file=sys.stderr
+            )
+    loop.close()
+
+    baseline: Optional[Dict[str, Any]] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance) if baseline else []
+
+    report = {
+        "benchmark": "micro",
+        "machine": _machine(),
+        "parameters": {"repeat": args.repeat, "min_time": args.min_time, "tolerance": args.tolerance},
+        "results": results,
+        "regressions": regressions,
+    }
+    if baseline and baseline.get("machine") != report["machine"]:
+        report["warning"] = "基线在不同的机器或Python版本上生成，对比结果仅供参考"
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    if args.update_baseline:
+        merged = dict((baseline or {}).get("results", {}))
+        merged.update({name: result for name, result in results.items() if "median_us" in result})
+        for result in merged.values():
+            result.pop("baseline_median_us", None)
+            result.pop("change", None)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": report["machine"], "results": merged}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    for name in regressions:
+        result = results[name]
+        print(f"退化: {name} {result['baseline_median_us']} → {result['median_us']} µs ({result['change']:+.1%})", file=sys.stderr)
+    if regressions and not args.update_baseline:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
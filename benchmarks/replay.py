@@ -0,0 +1,201 @@
+"""
+录制回放
+把事件录制器（utils/recorder.py）写入的录制按原始节奏或加速回放到本地替身环境，
+用于容量规划，例如 "5000人在10分钟内签到需要多少工作协程"。
+
+可以把录制复制多份（每份的用户和图片标识不同）来放大人数，并覆盖调度器和隔离舱的并发配置做对比。
+结果格式与 benchmarks.loadtest 相同，另外给出投递相对计划时间的滞后。
+
+用法:
+    python -m benchmarks.replay data/recording.jsonl.gz --speed 10
+    python -m benchmarks.replay data/recording.jsonl.gz --copies 5 --workers 32 --output results/replay-32.json
+"""
+import argparse
+import asyncio
+import base64
+import copy
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.harness import AppRunner, configure, image_content, percentiles
+from benchmarks.stubs import StubConfig, StubServer
+from tools.ws_replay_server import load_recording
+
+# 复制录制时需要区分的标识字段
+_COPY_KEYS = frozenset({"open_id", "user_id", "union_id", "message_id", "event_id"})
+
+
+def _suffix_ids(value: Any, suffix: str) -> Any:
+    """给标识字段加后缀，使每份复制成为不同的用户"""
+    if isinstance(value, dict):
+        return {
+            key: item + suffix if key in _COPY_KEYS and isinstance(item, str) else _suffix_ids(item, suffix)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_suffix_ids(item, suffix) for item in value]
+    return value
+
+
+def _suffix_image_key(event: Dict[str, Any], suffix: str) -> None:
+    """给图片消息的image_key加后缀（content为base64编码的JSON）"""
+    message = event.get("event", {}).get("message", {})
+    if message.get("message_type") != "image":
+        return
+    try:
+        image_key = json.loads(base64.b64decode(message.get("content", ""))).get("image_key", "")
+    except Exception:
+        return
+    if image_key:
+        message["content"] = image_content(image_key + suffix)
+
+
+def build_schedule(
+    records: List[Tuple[float, Dict[str, Any]]],
+    speed: float,
+    copies: int,
+    spread: float,
+    max_gap: float
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    生成回放计划
+
+    Args:
+        records: 录制 (相对时间, 事件) 列表
+        speed: 回放倍速
+        copies: 复制份数
+        spread: 每份复制之间错开的秒数（回放时间）
+        max_gap: 录制中超过该秒数的空闲间隔压缩为该值，0表示不压缩
+
+    Returns:
+        List: 按计划时间排序的 (计划时间, 事件) 列表
+    """
+    compressed = []
+    shift = 0.0
+    previous = None
+    for offset, event in records:
+        if previous is not None and max_gap > 0 and offset - previous > max_gap:
+            shift += offset - previous - max_gap
+        previous = offset
+        compressed.append(((offset - shift) / speed, event))
+
+    schedule = []
+    for copy_index in range(copies):
+        suffix = f"-r{copy_index}" if copies > 1 else ""
+        for at, event in compressed:
+            event = _suffix_ids(copy.deepcopy(event), suffix) if suffix else copy.deepcopy(event)
+            if suffix:
+                _suffix_image_key(event, suffix)
+            schedule.append((at + copy_index * spread, event))
+    schedule.sort(key=lambda item: item[0])
+    return schedule
+
+
+async def run(schedule: List[Tuple[float, Dict[str, Any]]]) -> Dict[str, Any]:
+    async with AppRunner() as runner:
+        # 每次回放使用新的event_id，避免与之前的运行混淆
+        run_id = f"-{int(time.time())}"
+        loop = asyncio.get_running_loop()
+        lags = []
+        tasks = []
+        started = loop.time()
+        wall_started = time.perf_counter()
+        for at, event in schedule:
+            delay = started + at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, loop.time() - started - at))
+            header = event.get("header")
+            if isinstance(header, dict) and header.get("event_id"):
+                header["event_id"] += run_id
+            tasks.append(asyncio.create_task(runner.post_event(event)))
+        await asyncio.gather(*tasks)
+        await runner.drain()
+        report = runner.report(time.perf_counter() - wall_started)
+        report["schedule_lag"] = percentiles(lags)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制回放（本地替身服务器）")
+    parser.add_argument("recording", help="录制文件（.jsonl或.jsonl.gz）")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速")
+    parser.add_argument("--copies", type=int, default=1, help="录制复制份数，用于放大人数")
+    parser.add_argument("--spread", type=float, default=0.0, help="每份复制之间错开的秒数")
+    parser.add_argument("--max-gap", type=float, default=60.0, help="超过该秒数的空闲间隔压缩为该值，0表示不压缩")
+    parser.add_argument("--workers", type=int, help="覆盖 EVENT_DISPATCHER_WORKERS")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="NAME=VALUE",
+        help="额外的应用环境变量，例如 BULKHEAD_QR_DECODE_CONCURRENCY=4，可重复"
+    )
+    parser.add_argument("--feishu-latency", type=float, default=0.05, help="飞书接口平均延迟（秒）")
+    parser.add_argument("--image-latency", type=float, default=0.1, help="图片下载平均延迟（秒）")
+    parser.add_argument("--feishu-error-rate", type=float, default=0.0, help="飞书接口错误比例")
+    parser.add_argument("--verify-latency", type=float, default=0.1, help="验证API平均延迟（秒）")
+    parser.add_argument("--verify-error-rate", type=float, default=0.0, help="验证API返回503的比例")
+    parser.add_argument("--deny-rate", type=float, default=0.1, help="验证API判定无权限的比例")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", help="结果JSON写入的文件，默认只输出到标准输出")
+    args = parser.parse_args()
+
+    records = load_recording(args.recording)
+    if not records:
+        parser.error("录制文件中没有事件")
+    schedule = build_schedule(records, args.speed, args.copies, args.spread, args.max_gap)
+
+    overrides = dict(item.split("=", 1) for item in args.env)
+    if args.workers:
+        overrides["EVENT_DISPATCHER_WORKERS"] = str(args.workers)
+
+    stub_config = StubConfig(
+        feishu_latency=args.feishu_latency,
+        feishu_error_rate=args.feishu_error_rate,
+        image_latency=args.image_latency,
+        verify_latency=args.verify_latency,
+        verify_error_rate=args.verify_error_rate,
+        deny_rate=args.deny_rate,
+        seed=args.seed,
+    )
+
+    with StubServer(stub_config) as stub, tempfile.TemporaryDirectory(prefix="xiaohuo-replay-") as workdir:
+        # 应用模块读取的配置在导入时确定，必须先设置环境变量
+        configure(stub.url, workdir, **overrides)
+        result = asyncio.run(run(schedule))
+        stub_calls = stub.stats()["calls"]
+
+    result = {
+        "benchmark": "replay",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "parameters": {
+            "recording": args.recording,
+            "recorded_events": len(records),
+            "speed": args.speed,
+            "copies": args.copies,
+            "spread": args.spread,
+            "max_gap": args.max_gap,
+            "scheduled_seconds": round(schedule[-1][0], 3),
+            "env": overrides,
+            "stubs": asdict(stub_config),
+        },
+        **result,
+        "stub_calls": stub_calls,
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+本地替身服务器
+模拟压测中用到的飞书开放平台接口和外部验证API，支持配置延迟和错误注入。
+替身服务器运行在独立进程中，不占用被测应用的CPU和内存。
+
+模拟的接口:
+    POST /open-apis/auth/v3/tenant_access_token/internal  获取访问凭证
+    POST /open-apis/im/v1/messages                        发送消息
+    GET  /open-apis/im/v1/images/{image_key}              下载图片（按image_key生成二维码）
+    POST /open-apis/im/v1/chats/{chat_id}/members         添加群成员
+    GET  /open-apis/im/v1/chats/{chat_id}                 获取群信息
+    GET  /verify                                          外部验证API
+    GET  /stub/stats                                      各接口调用次数
+
+图片的image_key格式为 "img_<二维码内容>"，下载时生成对应内容的二维码PNG。
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import random
+import socket
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Dict, Tuple
+
+import httpx
+
+# 注入的飞书错误码（服务端临时错误，应用会按可重试处理）
+INJECTED_ERROR_CODE = 55001
+
+IMAGE_KEY_PREFIX = "img_"
+
+
+@dataclass
+class StubConfig:
+    """替身服务器配置，延迟单位为秒，实际延迟在 [0.5, 1.5] 倍之间随机"""
+
+    feishu_latency: float = 0.05
+    feishu_error_rate: float = 0.0
+    image_latency: float = 0.1
+    verify_latency: float = 0.1
+    verify_error_rate: float = 0.0
+    deny_rate: float = 0.0        # 验证API返回无权限的比例（按二维码内容固定）
+    qr_box_size: int = 10         # 生成二维码的模块像素大小，决定图片尺寸
+    seed: int = 0
+
+
+def image_key_for(payload: str) -> str:
+    """
+    获取会被替身服务器解析为指定二维码内容的image_key
+
+    Args:
+        payload: 二维码内容
+
+    Returns:
+        str: image_key
+    """
+    return IMAGE_KEY_PREFIX + payload
+
+
+def create_stub_app(config: StubConfig):
+    """
+    创建替身服务器应用
+
+    Args:
+        config: 替身服务器配置
+
+    Returns:
+        Starlette: ASGI应用
+    """
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+
+    rng = random.Random(config.seed)
+    calls: Counter = Counter()
+    images: Dict[Tuple[str, int], bytes] = {}
+
+    async def delay(seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds * rng.uniform(0.5, 1.5))
+
+    def injected_error(name: str) -> JSONResponse:
+        calls[f"{name}.error"] += 1
+        return JSONResponse({"code": INJECTED_ERROR_CODE, "msg": "stub injected error"})
+
+    async def token(request: Request):
+        calls["token"] += 1
+        return JSONResponse({"code": 0, "msg": "ok", "tenant_access_token": "t-stub", "expire": 7200})
+
+    async def message_create(request: Request):
+        calls["message.create"] += 1
+        await delay(config.feishu_latency)
+        if rng.random() < config.feishu_error_rate:
+            return injected_error("message.create")
+        return JSONResponse({
+            "code": 0,
+            "msg": "success",
+            "data": {"message_id": f"om_stub_{calls['message.create']}", "create_time": str(int(time.time() * 1000))}
+        })
+
+    async def image_get(request: Request):
+        calls["image.get"] += 1
+        await delay(config.image_latency)
+        if rng.random() < config.feishu_error_rate:
+            return injected_error("image.get")
+
+        image_key = request.path_params["image_key"]
+        if not image_key.startswith(IMAGE_KEY_PREFIX):
+            return JSONResponse({"code": 234001, "msg": "invalid image key"}, status_code=400)
+
+        cache_key = (image_key, config.qr_box_size)
+        if cache_key not in images:
+            import qrcode
+
+            buffer = io.BytesIO()
+            qrcode.make(image_key[len(IMAGE_KEY_PREFIX):], box_size=config.qr_box_size).save(buffer, format="PNG")
+            images[cache_key] = buffer.getvalue()
+        return Response(
+            images[cache_key],
+            media_type="image/png",
+            headers={"Content-Disposition": f'attachment; filename="{image_key}.png"'}
+        )
+
+    async def chat_members_create(request: Request):
+        calls["chat_members.create"] += 1
+        await delay(config.feishu_latency)
+        if rng.random() < config.feishu_error_rate:
+            return injected_error("chat_members.create")
+        return JSONResponse({"code": 0, "msg": "success", "data": {"invalid_id_list": [], "not_existed_id_list": []}})
+
+    async def chat_get(request: Request):
+        calls["chat.get"] += 1
+        await delay(config.feishu_latency)
+        return JSONResponse({
+            "code": 0,
+            "msg": "success",
+            "data": {"name": f"stub {request.path_params['chat_id']}", "user_count": "0", "bot_count": "1"}
+        })
+
+    async def verify(request: Request):
+        calls["verify"] += 1
+        await delay(config.verify_latency)
+        if rng.random() < config.verify_error_rate:
+            calls["verify.error"] += 1
+            return JSONResponse({"message": "stub injected error"}, status_code=503)
+
+        qr_data = request.query_params.get("id", "")
+        bucket = int(hashlib.md5(qr_data.encode()).hexdigest(), 16) % 10000
+        allowed = bucket >= config.deny_rate * 10000
+        return JSONResponse({"code": 0, "data": {"status": allowed}})
+
+    async def stats(request: Request):
+        return JSONResponse({"config": asdict(config), "calls": dict(calls)})
+
+    return Starlette(routes=[
+        Route("/open-apis/auth/v3/tenant_access_token/internal", token, methods=["POST"]),
+        Route("/open-apis/auth/v3/app_access_token/internal", token, methods=["POST"]),
+        Route("/open-apis/im/v1/messages", message_create, methods=["POST"]),
+        Route("/open-apis/im/v1/images/{image_key}", image_get, methods=["GET"]),
+        Route("/open-apis/im/v1/chats/{chat_id}/members", chat_members_create, methods=["POST"]),
+        Route("/open-apis/im/v1/chats/{chat_id}", chat_get, methods=["GET"]),
+        Route("/verify", verify, methods=["GET"]),
+        Route("/stub/stats", stats, methods=["GET"]),
+    ])
+
+
+def _serve(config: StubConfig, host: str, port: int) -> None:
+    import uvicorn
+
+    uvicorn.run(create_stub_app(config), host=host, port=port, log_level="warning", access_log=False)
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class StubServer:
+    """
+    在子进程中运行的替身服务器
+
+    用法:
+        with StubServer(StubConfig(feishu_latency=0.05)) as stub:
+            os.environ["FEISHU_DOMAIN"] = stub.url
+    """
+
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.host = host
+        self.port = port or _free_port(host)
+        self.url = f"http://{host}:{self.port}"
+        self._process = None
+
+    def start(self, timeout: float = 15.0) -> "StubServer":
+        """启动子进程并等待服务可用"""
+        context = multiprocessing.get_context("spawn")
+        self._process = context.Process(target=_serve, args=(self.config, self.host, self.port), daemon=True)
+        self._process.start()
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{self.url}/stub/stats", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            if not self._process.is_alive():
+                break
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("替身服务器启动失败")
+
+    def stats(self) -> Dict:
+        """获取各接口调用次数"""
+        return httpx.get(f"{self.url}/stub/stats", timeout=5.0).json()
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(5)
+            self._process = None
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
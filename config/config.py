@@ -13,12 +13,23 @@ load_dotenv()
 FEISHU_APP_ID = os.getenv("FEISHU_APP_ID", "")
 FEISHU_APP_SECRET = os.getenv("FEISHU_APP_SECRET", "")
 
+# 多租户：同一部署服务多个飞书应用（或多场比赛）时，其余租户在该JSON文件中配置，
+# 格式见 utils/tenants.py；上面的凭证和下面的验证API配置作为默认租户
+TENANTS_CONFIG_PATH = os.getenv("TENANTS_CONFIG_PATH", "")
+
 # Feishu API Endpoints
-FEISHU_BASE_URL = "https://open.feishu.cn/open-apis"
+# 飞书开放平台域名，本地压测时可指向替身服务器
+FEISHU_DOMAIN = os.getenv("FEISHU_DOMAIN", "https://open.feishu.cn").rstrip("/")
+FEISHU_BASE_URL = f"{FEISHU_DOMAIN}/open-apis"
 FEISHU_GET_TOKEN_URL = f"{FEISHU_BASE_URL}/auth/v3/tenant_access_token/internal"
 FEISHU_SEND_MESSAGE_URL = f"{FEISHU_BASE_URL}/im/v1/messages"
 FEISHU_ADD_USER_TO_GROUP_URL = f"{FEISHU_BASE_URL}/im/v1/chats"  # /{chat_id}/members
 
+# tenant_access_token 刷新配置
+# 飞书在凭证剩余有效期不足30分钟时才会返回新凭证，提前量需小于30分钟
+TOKEN_REFRESH_MARGIN = 20 * 60  # 到期前多久刷新（秒）
+TOKEN_MIN_REFRESH_INTERVAL = 5.0  # 凭证被判定无效时，两次强制刷新的最小间隔（秒）
+
 # Bot Configuration
 BOT_NAME = "小火验证机器人"
 WELCOME_MESSAGE = "你好！我是小火验证机器人。请问您想加入哪一类群组？"
@@ -28,10 +39,16 @@ VERIFICATION_FAILURE_MESSAGE = "验证失败！您没有权限加入该群组。
 QR_REQUEST_MESSAGE = "请发送您的二维码进行验证。"
 
 # 群组类型配置
+# keywords: 用户文本中出现任一关键词（不区分大小写）即识别为该群组类型
+# button_label: 群组选择卡片上的按钮文字
+# selectable: 是否出现在群组选择卡片上并参与文本识别
 GROUP_TYPES = {
     "player": {
         "name": "选手群",
         "description": "比赛选手交流群组",
+        "keywords": ["选手", "player"],
+        "button_label": "选手群",
+        "selectable": True,
         "chat_ids": [
             # 测试群
             "oc_2165872e0dcb789b64d6ab59e86d5b0e"
@@ -40,6 +57,9 @@ GROUP_TYPES = {
     "judge": {
         "name": "评委群",
         "description": "比赛评委交流群组",
+        "keywords": ["评委", "judge"],
+        "button_label": "评委群",
+        "selectable": True,
         "chat_ids": [
             # 在这里填写评委群的chat_id列表
             # "oc_hijklmn789012"
@@ -48,17 +68,51 @@ GROUP_TYPES = {
     "test": {
         "name": "测试群",
         "description": "测试用群组",
+        "keywords": [],
+        "button_label": "测试群",
+        "selectable": False,
         "chat_ids": [
             "oc_2165872e0dcb789b64d6ab59e86d5b0e"
         ]
     }
 }
 
+# 群组路由热更新：设置后从该JSON文件（{"group_types": {...}}，格式同GROUP_TYPES）加载群组配置，
+# 文件修改后自动生效，无需重启；留空时使用上面的GROUP_TYPES
+ROUTING_CONFIG_PATH = os.getenv("ROUTING_CONFIG_PATH", "")
+ROUTING_RELOAD_INTERVAL = float(os.getenv("ROUTING_RELOAD_INTERVAL", "5"))  # 检查文件修改的间隔（秒）
+
+# 重新选择群组类型的命令
+RESET_COMMANDS = ["重新选择", "重置", "reset"]
+
 # API Verification Configuration
 API_VERIFICATION_ENABLED = True
 API_ENDPOINT = os.getenv("API_ENDPOINT", "")
 API_TOKEN = os.getenv("API_TOKEN", "")
 EVENT_ID = os.getenv("EVENT_ID", "")
+VERIFICATION_TIMEOUT = float(os.getenv("VERIFICATION_TIMEOUT", "10"))  # 单次请求超时（秒）
+
+# 验证API熔断配置
+VERIFICATION_BREAKER_FAILURE_THRESHOLD = int(os.getenv("VERIFICATION_BREAKER_FAILURE_THRESHOLD", "5"))
+VERIFICATION_BREAKER_RESET_TIMEOUT = float(os.getenv("VERIFICATION_BREAKER_RESET_TIMEOUT", "30"))
+# 熔断打开时的处理策略: "fail_fast" 直接失败, "allowlist" 白名单用户放行
+VERIFICATION_BREAKER_OPEN_POLICY = os.getenv("VERIFICATION_BREAKER_OPEN_POLICY", "fail_fast")
+VERIFICATION_FALLBACK_ALLOWLIST = frozenset(
+    item.strip() for item in os.getenv("VERIFICATION_FALLBACK_ALLOWLIST", "").split(",") if item.strip()
+)  # open_id列表，逗号分隔
+
+# 验证API对冲请求配置：首个请求超过p95耗时仍未返回时，再发一个相同请求
+VERIFICATION_HEDGE_ENABLED = os.getenv("VERIFICATION_HEDGE_ENABLED", "False").lower() == "true"
+VERIFICATION_HEDGE_MIN_DELAY = float(os.getenv("VERIFICATION_HEDGE_MIN_DELAY", "0.05"))  # 对冲延迟下限（秒）
+VERIFICATION_HEDGE_MIN_SAMPLES = 20  # 样本不足时不对冲
+
+# 二维码单次使用账本：验证通过后登记兑换的用户，其他用户重复使用或过期的二维码在调用验证API前直接拒绝
+QR_TOKEN_LEDGER_ENABLED = os.getenv("QR_TOKEN_LEDGER_ENABLED", "True").lower() == "true"
+QR_TOKEN_VALIDITY = float(os.getenv("QR_TOKEN_VALIDITY", "60"))  # 二维码有效期（秒），从兑换（验证通过）时计算
+# 账本记录的保留时长（秒），需大于有效期，过期的二维码在保留期内也能直接拒绝
+QR_TOKEN_LEDGER_RETENTION = float(os.getenv("QR_TOKEN_LEDGER_RETENTION", "600"))
+QR_TOKEN_REUSED_MESSAGE = "该二维码已被其他用户使用，请发送您本人的二维码。"
+QR_TOKEN_EXPIRED_MESSAGE = "该二维码已过期，请刷新二维码后重新发送。"
 
 # Redis Configuration
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -68,6 +122,10 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 REDIS_TIMEOUT = int(os.getenv("REDIS_TIMEOUT", "5"))  # Connection timeout in seconds
 REDIS_PREFIX = os.getenv("REDIS_PREFIX", "xiaohuo:")
 
+# 共享状态存储: "sqlite" 在同一主机的多个工作进程间共享, "memory" 仅当前进程
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_BACKEND_PATH = os.getenv("STATE_BACKEND_PATH", "data/state.db")
+
 # Cache TTLs (in seconds)
 USER_STATE_TTL = 60 * 60  # 1 hour
 VERIFICATION_RESULT_TTL = 60 * 60 * 24  # 24 hours
@@ -77,10 +135,121 @@ VERIFICATION_CALLBACK_PATH = "/api/bot/verification_callback"
 BOT_EVENT_CALLBACK_PATH = "/api/bot/event_callback"
 ENCRYPT_KEY = os.getenv("FEISHU_ENCRYPT_KEY", "")  # For event subscription encryption
 
+# 事件接入方式: "webhook" 仅HTTP回调, "websocket" 额外通过长连接接收事件
+EVENT_INTAKE_MODE = os.getenv("EVENT_INTAKE_MODE", "webhook")
+# 长连接地址，留空时使用飞书官方长连接；设置后按JSON帧接收（中继或本地替身服务器）
+EVENT_INTAKE_WS_URL = os.getenv("EVENT_INTAKE_WS_URL", "")
+WS_RECONNECT_BASE_DELAY = 1.0  # 重连初始等待（秒）
+WS_RECONNECT_MAX_DELAY = 60.0  # 重连最大等待（秒）
+
+# 事件处理时间预算
+EVENT_DEADLINE_SECONDS = float(os.getenv("EVENT_DEADLINE_SECONDS", "10"))  # 从收到webhook开始计算
+DEADLINE_REPLY_GRACE = 3.0  # 超时后发送"请重试"提示的额外时间（秒）
+DEADLINE_EXCEEDED_MESSAGE = "处理超时，请稍后重新发送二维码。"
+
+# 事件调度配置
+EVENT_DISPATCHER_WORKERS = int(os.getenv("EVENT_DISPATCHER_WORKERS", "16"))
+# 车道权重：权重越高，调度越频繁
+EVENT_LANE_WEIGHTS = {
+    "interactive": 8,  # 卡片点击、文本回复
+    "lifecycle": 2,    # 机器人入群等事件
+    "heavy": 1,        # 图片二维码验证
+}
+# 车道同时处理上限，为轻量事件预留工作协程
+EVENT_LANE_CONCURRENCY = {
+    "heavy": max(1, EVENT_DISPATCHER_WORKERS * 3 // 4),
+}
+EVENT_LANE_MAX_WAIT = float(os.getenv("EVENT_LANE_MAX_WAIT", "2"))  # 防饿死阈值（秒）
+
+# 准入控制配置（仅作用于图片验证）
+ADMISSION_MAX_HEAVY_LOAD = int(os.getenv("ADMISSION_MAX_HEAVY_LOAD", "200"))  # 排队中+处理中的图片事件上限
+ADMISSION_MAX_P99 = float(os.getenv("ADMISSION_MAX_P99", "8"))  # 图片事件p99耗时上限（秒）
+ADMISSION_MIN_SAMPLES = 20  # 样本不足时不按延迟拒绝
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "30"))  # 建议用户重试的最短间隔（秒）
+ADMISSION_BUSY_MESSAGE = "当前验证人数较多，请 {seconds} 秒后重新发送二维码。"
+
+# 出站操作发件箱配置
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "True").lower() == "true"
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "data/outbox.db")
+OUTBOX_BATCH_SIZE = 64  # 每批重试的最大操作数
+OUTBOX_FLUSH_INTERVAL = 0.002  # 组提交合并窗口（秒）
+OUTBOX_DEAD_RETENTION = float(os.getenv("OUTBOX_DEAD_RETENTION", "604800"))  # 永久失败的记录保留时间（秒），用于排查
+OUTBOX_PRUNE_INTERVAL = 3600  # 清理过期记录的间隔（秒）
+
+# 按错误分类的重试策略: 最大尝试次数（含首次）、首次重试延迟、最大延迟（秒）、抖动比例
+# 同步调用的重试等待不会超出事件剩余时间预算；发件箱的后台重试按完整策略执行
+RETRY_POLICIES = {
+    "retryable": {"max_attempts": 8, "base_delay": 0.2, "max_delay": 60.0, "jitter": 0.5},
+    "rate_limited": {"max_attempts": 10, "base_delay": 1.0, "max_delay": 120.0, "jitter": 0.5},
+    "token_expired": {"max_attempts": 3, "base_delay": 0.5, "max_delay": 2.0, "jitter": 0.2},
+    "permanent": {"max_attempts": 1},
+    "permission": {"max_attempts": 1},
+}
+
+# 舱壁隔离配置: 名称 -> (最大并发数, 最大排队数)
+BULKHEAD_LIMITS = {
+    "image_download": (
+        int(os.getenv("BULKHEAD_IMAGE_DOWNLOAD_CONCURRENCY", "8")),
+        int(os.getenv("BULKHEAD_IMAGE_DOWNLOAD_QUEUE", "64")),
+    ),
+    "qr_decode": (
+        int(os.getenv("BULKHEAD_QR_DECODE_CONCURRENCY", str(os.cpu_count() or 2))),
+        int(os.getenv("BULKHEAD_QR_DECODE_QUEUE", "64")),
+    ),
+    "verification_api": (
+        int(os.getenv("BULKHEAD_VERIFICATION_API_CONCURRENCY", "16")),
+        int(os.getenv("BULKHEAD_VERIFICATION_API_QUEUE", "128")),
+    ),
+    "group_add": (
+        int(os.getenv("BULKHEAD_GROUP_ADD_CONCURRENCY", "8")),
+        int(os.getenv("BULKHEAD_GROUP_ADD_QUEUE", "64")),
+    ),
+    "message_send": (
+        int(os.getenv("BULKHEAD_MESSAGE_SEND_CONCURRENCY", "16")),
+        int(os.getenv("BULKHEAD_MESSAGE_SEND_QUEUE", "256")),
+    ),
+}
+BULKHEAD_BUSY_MESSAGE = "系统繁忙，请稍后重新发送二维码。"
+
+# 事件追踪配置
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "True").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))  # 内存中保留的最近追踪数
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")  # 设置后以JSONL格式追加写入该文件
+TRACE_MAX_SPANS = 256  # 单条追踪的跨度上限
+
+# 事件录制配置（用于容量规划的回放），留空时不录制
+# 多个工作进程时路径中应包含 {pid}，每个进程写入各自的文件
+EVENT_RECORDING_PATH = os.getenv("EVENT_RECORDING_PATH", "")
+EVENT_RECORDING_SALT = os.getenv("EVENT_RECORDING_SALT", "")  # 用户ID匿名化的密钥，留空时每个进程随机生成
+
+# 管理接口令牌（请求头 X-Admin-Token），留空时管理接口不可用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 按需性能分析配置
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "data/profiles")
+PROFILER_INTERVAL = 0.005  # 采样间隔（秒）
+PROFILER_MAX_SECONDS = 300  # 单次分析最长时长（秒）
+PROFILER_SIGNAL_SECONDS = float(os.getenv("PROFILER_SIGNAL_SECONDS", "30"))  # 收到SIGUSR2时的分析时长
+PROFILER_SIGNAL_TARGET = os.getenv("PROFILER_SIGNAL_TARGET", "")  # 收到SIGUSR2时只分析的目标，留空分析全部
+# 可单独分析的处理函数: 名称 -> "模块:函数"
+PROFILER_TARGETS = {
+    "handle_qr_code_image": "app.bot.handlers:handle_qr_code_image",
+    "handle_message_event": "app.bot.handlers:handle_message_event",
+    "handle_card_action": "app.bot.handlers:handle_card_action",
+}
+
+# 健康检查: 某阶段并发占满且超过该时长没有任何操作完成，视为卡住（秒）
+HEALTH_STAGE_STALL_SECONDS = float(os.getenv("HEALTH_STAGE_STALL_SECONDS", "30"))
+HEALTH_STATE_BACKEND_TIMEOUT = 1.0  # 就绪检查访问共享状态存储的超时（秒）
+
 # Server Configuration
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "True").lower() == "true"  # False时输出为普通文本，便于本地调试
+
 # Rate Limiting
 MAX_REQUESTS_PER_MINUTE = 60
@@ -0,0 +1,42 @@
+"""
+发件箱持久化测试
+"""
+import asyncio
+
+from utils.error_handler import ErrorClass
+from utils.outbox import Outbox, OutboxResult, OUTBOX_DEAD, OUTBOX_RETRY
+
+
+def test_dead_key_resubmitted_is_replayed_after_restart(tmp_path):
+    """已永久失败的键重新提交后临时失败，重启后仍会重放"""
+    path = str(tmp_path / "outbox.db")
+    results = [
+        OutboxResult(OUTBOX_DEAD, "permission denied", ErrorClass.PERMISSION),
+        OutboxResult(OUTBOX_RETRY, "timeout", ErrorClass.RETRYABLE),
+    ]
+
+    async def handler(payload):
+        return results.pop(0)
+
+    async def run():
+        outbox = Outbox(path)
+        outbox.register("chat_members.create", handler)
+        await outbox.start()
+        first = await outbox.submit("chat_members.create", "oc_1:ou_1", {"attempt": 1})
+        second = await outbox.submit("chat_members.create", "oc_1:ou_1", {"attempt": 2})
+        await outbox.stop()
+
+        reopened = Outbox(path)
+        await reopened.start()
+        try:
+            return first, second, dict(reopened._pending)
+        finally:
+            await reopened.stop()
+
+    first, second, pending = asyncio.run(run())
+    assert first.status == OUTBOX_DEAD
+    assert second.status == OUTBOX_RETRY
+    kind, payload, attempts, _ = pending["oc_1:ou_1"]
+    assert kind == "chat_members.create"
+    assert payload == {"attempt": 2}
+    assert attempts == 1
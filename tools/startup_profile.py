@@ -0,0 +1,115 @@
+"""
+启动耗时分析
+在独立子进程中测量冷启动各阶段耗时：导入 app.main、启动预热、首个webhook请求和首次二维码解码。
+
+用法:
+    python -m tools.startup_profile              # 输出JSON格式的阶段耗时
+    python -m tools.startup_profile --importtime # 输出 python -X importtime 报告（按累计耗时排序）
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# 在子进程中执行，保证每次都是冷启动
+_PROFILE_SCRIPT = r"""
+import asyncio, io, json, sys, time
+
+t0 = time.perf_counter()
+import app.main as main_module
+from app.main import app, startup_event, shutdown_event
+from config.config import BOT_EVENT_CALLBACK_PATH
+t_import = time.perf_counter() - t0
+
+async def main():
+    import httpx
+    from app.qrcode.parser import extract_qr_code
+
+    timings = {"import_app_main": t_import}
+
+    if "--skip-warmup" not in sys.argv:
+        start = time.perf_counter()
+        await startup_event()
+        timings["startup_event"] = time.perf_counter() - start
+        report = await main_module.warmup_task
+        timings.update({f"warmup_{k}": v for k, v in report["timings"].items()})
+
+    body = json.dumps({"header": {"event_type": "profile.noop_v1"}, "event": {}}).encode()
+    async with httpx.AsyncClient(app=app, base_url="http://profile") as client:
+        start = time.perf_counter()
+        await client.post(BOT_EVENT_CALLBACK_PATH, content=body)
+        timings["first_webhook_request"] = time.perf_counter() - start
+
+    try:
+        import qrcode
+        buffer = io.BytesIO()
+        qrcode.make("startup-profile").save(buffer, format="PNG")
+        start = time.perf_counter()
+        await extract_qr_code(buffer.getvalue())
+        timings["first_qr_decode"] = time.perf_counter() - start
+    except ImportError:
+        pass
+
+    if "--skip-warmup" not in sys.argv:
+        await shutdown_event()
+    print(json.dumps({k: round(v * 1000, 2) for k, v in timings.items()}))
+
+asyncio.run(main())
+"""
+
+
+def importtime_report(module: str, top: int) -> str:
+    """
+    运行 python -X importtime 并按累计耗时排序
+
+    Args:
+        module: 要导入的模块
+        top: 显示前多少项
+
+    Returns:
+        str: 报告文本
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    total = max((row[0] for row in rows), default=0)
+    rows.sort(reverse=True)
+    lines = [f"导入 {module} 总耗时: {total / 1000:.1f} ms", f"{'cumulative(ms)':>15} {'self(ms)':>10}  module"]
+    for cumulative_us, self_us, name in rows[:top]:
+        lines.append(f"{cumulative_us / 1000:>15.1f} {self_us / 1000:>10.1f}  {name}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时分析")
+    parser.add_argument("--importtime", action="store_true", help="输出 -X importtime 报告")
+    parser.add_argument("--module", default="app.main", help="importtime 报告的目标模块")
+    parser.add_argument("--top", type=int, default=30, help="importtime 报告显示的条目数")
+    parser.add_argument("--skip-warmup", action="store_true", help="不执行启动预热，对比首个请求的耗时")
+    args = parser.parse_args()
+
+    if args.importtime:
+        print(importtime_report(args.module, args.top))
+        return
+
+    command = [sys.executable, "-c", _PROFILE_SCRIPT]
+    if args.skip_warmup:
+        command.append("--skip-warmup")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        sys.exit(result.returncode)
+    print(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+本地长连接替身服务器
+向每个连接上来的客户端按录制时的节奏（或加速）回放事件，用于在本地测试长连接接入模式。
+
+录制文件为JSONL（可gzip压缩），每行为 {"offset": 秒, "event": {...}}，也可以直接是事件对象。
+事件录制器（utils/recorder.py）写入的记录还带有 "time" 时间戳，多次录制追加到同一文件时按时间戳排列。
+
+用法:
+    python -m tools.ws_replay_server recording.jsonl.gz --port 8765 --speed 10
+    EVENT_INTAKE_MODE=websocket EVENT_INTAKE_WS_URL=ws://127.0.0.1:8765 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import gzip
+import json
+from typing import Any, Dict, List, Tuple
+
+
+def load_recording(path: str) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    读取录制文件
+
+    Args:
+        path: 录制文件路径，.gz结尾时按gzip读取
+
+    Returns:
+        List: (相对时间, 事件) 列表，按相对时间排序
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    records = []
+    timed = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "event" in record and "time" in record:
+                timed.append((float(record["time"]), record["event"]))
+            elif "event" in record and "offset" in record:
+                records.append((float(record["offset"]), record["event"]))
+            else:
+                records.append((float(index), record))
+    if timed:
+        # 以第一个事件的时间为起点，跨越多次录制也保持真实的间隔
+        start = min(received_at for received_at, _ in timed)
+        records.extend((received_at - start, event) for received_at, event in timed)
+        records.sort(key=lambda record: record[0])
+    return records
+
+
+async def replay(websocket, records: List[Tuple[float, Dict[str, Any]]], speed: float, close_after: bool) -> None:
+    """按节奏向一个客户端发送事件"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for offset, event in records:
+        delay = started + offset / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await websocket.send(json.dumps(event, ensure_ascii=False))
+    if close_after:
+        await websocket.close()
+    else:
+        await websocket.wait_closed()
+
+
+async def serve(path: str, host: str, port: int, speed: float, close_after: bool) -> None:
+    import websockets
+
+    records = load_recording(path)
+    async with websockets.serve(lambda ws, *_: replay(ws, records, speed, close_after), host, port):
+        print(f"回放 {len(records)} 个事件: ws://{host}:{port} (速度 {speed}x)")
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地长连接替身服务器")
+    parser.add_argument("recording", help="录制文件（JSONL，可gzip压缩）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数")
+    parser.add_argument("--close", action="store_true", help="回放完成后断开连接（用于测试重连）")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.recording, args.host, args.port, args.speed, args.close))
+
+
+if __name__ == "__main__":
+    main()
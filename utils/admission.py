@@ -0,0 +1,118 @@
+"""
+准入控制模块
+根据排队深度和近期p99延迟决定是否接受新的重负载请求（图片验证），过载时尽早拒绝
+"""
+import math
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from config.config import (
+    ADMISSION_MAX_HEAVY_LOAD,
+    ADMISSION_MAX_P99,
+    ADMISSION_MIN_SAMPLES,
+    ADMISSION_RETRY_AFTER
+)
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+class AdmissionDecision:
+    """准入决定"""
+
+    __slots__ = ("admitted", "reason", "retry_after")
+
+    def __init__(self, admitted: bool, reason: str = "ok", retry_after: int = 0):
+        self.admitted = admitted
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+_ADMITTED = AdmissionDecision(True)
+
+
+class AdmissionController:
+    """
+    重负载请求的准入控制器
+
+    以下任一条件满足时拒绝新请求：
+    - 排队中和处理中的重负载事件数达到 max_load
+    - 有重负载事件正在处理，且近期p99延迟超过 max_p99 秒
+    延迟条件只在有负载时生效，负载清空后自动恢复放行。
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], int],
+        p99: Callable[[], Optional[float]],
+        samples: Callable[[], int],
+        max_load: int = ADMISSION_MAX_HEAVY_LOAD,
+        max_p99: float = ADMISSION_MAX_P99,
+        min_samples: int = ADMISSION_MIN_SAMPLES,
+        retry_after: int = ADMISSION_RETRY_AFTER
+    ):
+        self._load = load
+        self._p99 = p99
+        self._samples = samples
+        self.max_load = max_load
+        self.max_p99 = max_p99
+        self.min_samples = min_samples
+        self.retry_after = retry_after
+
+        self._admitted = 0
+        self._rejected: Dict[str, int] = {"queue_depth": 0, "latency": 0}
+        self._shedding = False
+
+    def admit(self) -> AdmissionDecision:
+        """
+        判断是否接受一个新的重负载请求
+
+        Returns:
+            AdmissionDecision: 准入决定，拒绝时带有原因和建议的重试秒数
+        """
+        load = self._load()
+        reason = None
+        p99 = None
+
+        if load >= self.max_load:
+            reason = "queue_depth"
+        elif load > 0 and self._samples() >= self.min_samples:
+            p99 = self._p99()
+            if p99 is not None and p99 > self.max_p99:
+                reason = "latency"
+
+        if reason is None:
+            self._admitted += 1
+            self._set_shedding(False, load, p99)
+            return _ADMITTED
+
+        self._rejected[reason] += 1
+        self._set_shedding(True, load, p99)
+        retry_after = max(self.retry_after, math.ceil(p99 or 0))
+        return AdmissionDecision(False, reason, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取准入控制统计信息
+
+        Returns:
+            Dict: 是否正在限流、当前负载、阈值和决定计数
+        """
+        return {
+            "shedding": self._shedding,
+            "load": self._load(),
+            "p99": self._p99(),
+            "max_load": self.max_load,
+            "max_p99": self.max_p99,
+            "admitted": self._admitted,
+            "rejected": dict(self._rejected),
+        }
+
+    def _set_shedding(self, shedding: bool, load: int, p99: Optional[float]) -> None:
+        if shedding == self._shedding:
+            return
+        self._shedding = shedding
+        if shedding:
+            logger.warning("开始拒绝图片验证请求: 负载=%s, p99=%s", load, p99)
+        else:
+            logger.warning("恢复接受图片验证请求: 负载=%s", load)
@@ -1,31 +1,194 @@
+"""
+飞书事件请求入口处理
+请求体只读取一次：在原始字节上校验签名、按需解密，并且只解析一次JSON
+
+多租户时依次尝试各租户的 Encrypt Key，签名匹配的Key同时用于解密。
+"""
 import hashlib
 import hmac
 import base64
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
 from fastapi import Request
 
-from config.config import ENCRYPT_KEY
+from config.config import ENCRYPT_KEY, ADMIN_TOKEN
+from utils.metrics import stage_timer
+from utils.tenants import tenant_registry
+
+try:
+    import orjson
+
+    def loads_json(data: bytes) -> Any:
+        return orjson.loads(data)
+except ImportError:
+    def loads_json(data: bytes) -> Any:
+        return json.loads(data)
+
+
+_SIGNATURE_SECONDS = stage_timer("signature_verify")
+
+
+class InvalidEventError(Exception):
+    """请求签名校验失败或无法解密"""
+
+
+def verify_signature(timestamp: str, nonce: str, signature: str, body: bytes, encrypt_key: str = ENCRYPT_KEY) -> bool:
+    """
+    校验飞书事件签名: sha256(timestamp + nonce + encrypt_key + body)
+    
+    Args:
+        timestamp: X-Lark-Request-Timestamp 请求头
+        nonce: X-Lark-Request-Nonce 请求头
+        signature: X-Lark-Signature 请求头
+        body: 原始请求体
+        encrypt_key: 事件订阅的 Encrypt Key
+        
+    Returns:
+        bool: 签名是否正确
+    """
+    digest = hashlib.sha256((timestamp + nonce + encrypt_key).encode() + body).hexdigest()
+    return hmac.compare_digest(digest, signature)
+
+
+@lru_cache(maxsize=None)
+def _aes_algorithm(encrypt_key: str):
+    """根据 Encrypt Key 派生AES-256密钥，结果缓存"""
+    from cryptography.hazmat.primitives.ciphers import algorithms
+    return algorithms.AES(hashlib.sha256(encrypt_key.encode()).digest())
+
+
+def decrypt_event(encrypted: str, encrypt_key: str = ENCRYPT_KEY) -> bytes:
+    """
+    解密飞书加密事件（AES-256-CBC，前16字节为IV，PKCS7填充）
+    
+    Args:
+        encrypted: 事件中的 encrypt 字段
+        encrypt_key: 事件订阅的 Encrypt Key
+        
+    Returns:
+        bytes: 解密后的JSON字节
+        
+    Raises:
+        InvalidEventError: 密文长度或填充无效
+        ValueError: 不是合法的base64
+    """
+    from cryptography.hazmat.primitives.ciphers import Cipher, modes
+    
+    raw = base64.b64decode(encrypted)
+    # 至少一个IV块加一个密文块，且按块对齐
+    if len(raw) < 32 or len(raw) % 16:
+        raise InvalidEventError("密文长度无效")
+    decryptor = Cipher(_aes_algorithm(encrypt_key), modes.CBC(raw[:16])).decryptor()
+    plain = decryptor.update(raw[16:]) + decryptor.finalize()
+    
+    padding = plain[-1]
+    if not 1 <= padding <= 16:
+        raise InvalidEventError("解密后的填充无效")
+    return plain[:-padding]
+
+
+def _decrypt_with_any(encrypted: str, encrypt_keys: List[str]) -> Dict[str, Any]:
+    """依次用各个 Encrypt Key 解密，返回第一个能解析为JSON的结果"""
+    error: Exception = InvalidEventError("没有可用的 Encrypt Key")
+    for encrypt_key in encrypt_keys:
+        try:
+            return _load_event(decrypt_event(encrypted, encrypt_key))
+        except (ValueError, InvalidEventError) as e:
+            error = e
+    raise InvalidEventError(f"事件解密失败: {error}")
 
-async def verify_feishu_request(request: Request) -> bool:
-    if not ENCRYPT_KEY:
-        return True
+
+def _load_event(data: bytes) -> Dict[str, Any]:
+    """解析事件JSON，顶层必须是对象"""
+    event_data = loads_json(data)
+    if not isinstance(event_data, dict):
+        raise ValueError("事件必须是JSON对象")
+    return event_data
+
+
+def parse_event_body(body: bytes, headers: Dict[str, str], encrypt_keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    校验并解析事件请求体
+    
+    Args:
+        body: 原始请求体
+        headers: 请求头
+        encrypt_keys: 可接受的 Encrypt Key，默认为所有租户的Key
+        
+    Returns:
+        Dict: 解析后的事件数据
+        
+    Raises:
+        InvalidEventError: 签名校验失败或无法解密
+        ValueError: 请求体不是JSON对象
+    """
+    if encrypt_keys is None:
+        encrypt_keys = tenant_registry.encrypt_keys()
+    if not encrypt_keys:
+        return _load_event(body)
     
-    signature = request.headers.get("X-Lark-Signature")
-    timestamp = request.headers.get("X-Lark-Request-Timestamp")
-    nonce = request.headers.get("X-Lark-Request-Nonce")
+    signature = headers.get("x-lark-signature")
+    timestamp = headers.get("x-lark-request-timestamp")
+    nonce = headers.get("x-lark-request-nonce")
+    signed = all([signature, timestamp, nonce])
     
-    if not all([signature, timestamp, nonce]):
+    if signed:
+        with _SIGNATURE_SECONDS.time():
+            signed_with = next(
+                (key for key in encrypt_keys if verify_signature(timestamp, nonce, signature, body, key)),
+                None
+            )
+        if signed_with is None:
+            raise InvalidEventError("签名校验失败")
+        # 已知事件所属租户的Key，只用它解密
+        encrypt_keys = [signed_with]
+    
+    event_data = _load_event(body)
+    if "encrypt" not in event_data:
+        if not signed:
+            raise InvalidEventError("缺少签名")
+        return event_data
+    
+    if not isinstance(event_data["encrypt"], str):
+        raise ValueError("encrypt 字段必须是字符串")
+    event_data = _decrypt_with_any(event_data["encrypt"], encrypt_keys)
+    
+    # 配置地址时的校验请求不带签名，能正确解密即说明来源可信
+    if not signed and event_data.get("type") != "url_verification":
+        raise InvalidEventError("缺少签名")
+    return event_data
+
+
+def verify_admin_token(token: Optional[str]) -> bool:
+    """
+    校验管理接口令牌，未配置 ADMIN_TOKEN 时一律拒绝
+    
+    Args:
+        token: X-Admin-Token 请求头
+        
+    Returns:
+        bool: 令牌是否正确
+    """
+    if not ADMIN_TOKEN or not token:
         return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+async def read_feishu_event(request: Request) -> Dict[str, Any]:
+    """
+    读取飞书事件请求：只读取一次原始字节，校验签名、解密并解析JSON
     
+    Args:
+        request: FastAPI请求对象
+        
+    Returns:
+        Dict: 事件数据
+        
+    Raises:
+        InvalidEventError: 签名校验失败或无法解密
+        ValueError: 请求体不是JSON对象
+    """
     body = await request.body()
-    body_str = body.decode("utf-8")
-    
-    base_string = timestamp + nonce + ENCRYPT_KEY + body_str
-    expected_signature = base64.b64encode(
-        hmac.new(
-            ENCRYPT_KEY.encode(),
-            base_string.encode(),
-            hashlib.sha256
-        ).digest()
-    ).decode()
-    
-    return signature == expected_signature
+    return parse_event_body(body, request.headers)
@@ -0,0 +1,145 @@
+"""
+舱壁隔离模块
+为每类下游操作提供独立的并发上限和排队上限，避免某一类请求激增拖垮其他请求
+"""
+import asyncio
+import time
+import logging
+from typing import Dict, Any
+
+from config.config import BULKHEAD_LIMITS
+from utils.metrics import registry
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+class BulkheadFull(Exception):
+    """舱壁排队已满时抛出"""
+
+    def __init__(self, name: str):
+        super().__init__(f"舱壁 {name} 已满")
+        self.name = name
+
+
+class Bulkhead:
+    """
+    带排队上限的有界信号量
+
+    同时执行的操作不超过 max_concurrent 个；等待中的操作超过 max_queue 个时直接拒绝。
+    使用方式: async with get_bulkhead("qr_decode"): ...
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._semaphore = asyncio.BoundedSemaphore(max_concurrent)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.accepted = 0
+        self.rejected = 0
+        # 最近一次释放的时间，用于判断是否卡住
+        self.last_release = time.monotonic()
+
+    async def __aenter__(self) -> "Bulkhead":
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            logger.warning("舱壁 [%s] 已满，拒绝请求", self.name)
+            raise BulkheadFull(self.name)
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        self.accepted += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.in_flight -= 1
+        self.last_release = time.monotonic()
+        self._semaphore.release()
+
+    def stalled_for(self) -> float:
+        """
+        并发已占满时，距最近一次释放的秒数；未占满时为0
+        
+        Returns:
+            float: 卡住的时长（秒）
+        """
+        if self.in_flight < self.max_concurrent:
+            return 0.0
+        return time.monotonic() - self.last_release
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取舱壁统计信息
+
+        Returns:
+            Dict: 并发上限、当前占用、排队数和拒绝次数
+        """
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }
+
+
+# 已创建的舱壁
+_bulkheads: Dict[str, Bulkhead] = {}
+
+
+def get_bulkhead(name: str) -> Bulkhead:
+    """
+    获取指定名称的舱壁（首次使用时按配置创建）
+
+    Args:
+        name: 舱壁名称，需在 BULKHEAD_LIMITS 中配置
+
+    Returns:
+        Bulkhead: 舱壁实例
+    """
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        max_concurrent, max_queue = BULKHEAD_LIMITS[name]
+        bulkhead = Bulkhead(name, max_concurrent, max_queue)
+        _bulkheads[name] = bulkhead
+    return bulkhead
+
+
+def bulkhead_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    获取所有舱壁的实时统计
+
+    Returns:
+        Dict: 舱壁名称 -> 统计信息
+    """
+    return {name: get_bulkhead(name).stats() for name in BULKHEAD_LIMITS}
+
+
+registry.gauge(
+    "xiaohuo_stage_in_flight",
+    "Operations currently running per stage",
+    ["stage"],
+    lambda: [((name,), get_bulkhead(name).in_flight) for name in BULKHEAD_LIMITS]
+)
+registry.gauge(
+    "xiaohuo_stage_waiting",
+    "Operations waiting for a slot per stage",
+    ["stage"],
+    lambda: [((name,), get_bulkhead(name).waiting) for name in BULKHEAD_LIMITS]
+)
+registry.gauge(
+    "xiaohuo_stage_rejected_total",
+    "Operations rejected because the stage queue was full",
+    ["stage"],
+    lambda: [((name,), get_bulkhead(name).rejected) for name in BULKHEAD_LIMITS],
+    metric_type="counter"
+)
@@ -0,0 +1,114 @@
+"""
+熔断器模块
+在上游服务持续失败时快速失败，避免每个请求都等待完整的超时时间
+"""
+import time
+import logging
+from enum import Enum
+from typing import Dict, Any
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+class BreakerState(Enum):
+    """熔断器状态枚举"""
+    CLOSED = "closed"        # 正常放行
+    OPEN = "open"            # 熔断中，直接拒绝
+    HALF_OPEN = "half_open"  # 试探中，只放行少量请求
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态时抛出"""
+
+
+class CircuitBreaker:
+    """
+    三态熔断器
+
+    连续失败达到 failure_threshold 次后打开；打开 reset_timeout 秒后进入半开状态，
+    最多放行 half_open_max_calls 个试探请求，试探成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = BreakerState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> BreakerState:
+        """当前状态（打开超时后自动转为半开）"""
+        if self._state == BreakerState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(BreakerState.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        判断是否放行本次请求，放行后调用方必须调用 record_success、record_failure 或 release 之一
+
+        Returns:
+            bool: 是否放行
+        """
+        state = self.state
+        if state == BreakerState.CLOSED:
+            return True
+        if state == BreakerState.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        self._rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        """记录一次成功调用"""
+        self._consecutive_failures = 0
+        if self._state != BreakerState.CLOSED:
+            self._transition(BreakerState.CLOSED)
+
+    def record_failure(self) -> None:
+        """记录一次失败调用"""
+        self._consecutive_failures += 1
+        if self._state == BreakerState.HALF_OPEN:
+            self._transition(BreakerState.OPEN)
+        elif self._state == BreakerState.CLOSED and self._consecutive_failures >= self.failure_threshold:
+            self._transition(BreakerState.OPEN)
+
+    def release(self) -> None:
+        """放行的请求没有得到结果（例如被取消）时归还半开状态的试探名额，不计成功也不计失败"""
+        if self._state == BreakerState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取熔断器统计信息
+
+        Returns:
+            Dict: 状态、连续失败次数和拒绝次数
+        """
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "consecutive_failures": self._consecutive_failures,
+            "rejected": self._rejected,
+        }
+
+    def _transition(self, new_state: BreakerState) -> None:
+        if new_state == self._state:
+            return
+        logger.warning("熔断器 [%s] 状态变更: %s -> %s", self.name, self._state.value, new_state.value)
+        self._state = new_state
+        self._half_open_calls = 0
+        if new_state == BreakerState.OPEN:
+            self._opened_at = time.monotonic()
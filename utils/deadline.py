@@ -0,0 +1,145 @@
+"""
+事件截止时间模块
+在收到webhook时设置整体时间预算，通过contextvars传递给处理流程中的每个阶段
+"""
+import asyncio
+import time
+import logging
+from contextvars import ContextVar, Token
+from typing import Any, Awaitable, Dict, Optional
+
+from config.config import EVENT_DEADLINE_SECONDS
+from utils.tracing import span
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 当前事件的截止时间（time.monotonic()时间戳），None表示没有限制
+_deadline: ContextVar[Optional[float]] = ContextVar("xiaohuo_deadline", default=None)
+
+# 各阶段超出截止时间的次数
+_deadline_misses: Dict[str, int] = {}
+
+
+class DeadlineExceeded(Exception):
+    """事件处理超出时间预算时抛出"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"阶段 {stage} 超出事件时间预算")
+        self.stage = stage
+
+
+def start_deadline(budget: float = EVENT_DEADLINE_SECONDS) -> Token:
+    """
+    为当前上下文开始一个新的时间预算
+
+    Args:
+        budget: 时间预算（秒）
+
+    Returns:
+        Token: 可用于 reset_deadline 的令牌
+    """
+    return _deadline.set(time.monotonic() + budget)
+
+
+def set_deadline(deadline: Optional[float]) -> Token:
+    """
+    在当前上下文中设置已有的截止时间（用于跨任务传递）
+
+    Args:
+        deadline: 截止时间（time.monotonic()时间戳）
+
+    Returns:
+        Token: 可用于 reset_deadline 的令牌
+    """
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: Token) -> None:
+    """恢复设置截止时间之前的上下文"""
+    _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    """获取当前上下文的截止时间"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """
+    获取剩余时间预算
+
+    Returns:
+        Optional[float]: 剩余秒数（可能为负），没有截止时间时返回None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def timeout_for(default: float) -> float:
+    """
+    计算下游调用应使用的超时时间：默认超时与剩余预算取较小值
+
+    Args:
+        default: 下游调用的默认超时（秒）
+
+    Returns:
+        float: 超时时间（秒），不小于0
+    """
+    left = remaining()
+    if left is None:
+        return default
+    return max(0.0, min(default, left))
+
+
+def record_deadline_miss(stage: str) -> None:
+    """记录某阶段超出截止时间"""
+    _deadline_misses[stage] = _deadline_misses.get(stage, 0) + 1
+    logger.warning("事件处理在阶段 %s 超出时间预算", stage)
+
+
+async def run_stage(stage: str, awaitable: Awaitable[Any]) -> Any:
+    """
+    在剩余时间预算内执行一个处理阶段，预算耗尽时取消该阶段
+
+    Args:
+        stage: 阶段名称
+        awaitable: 要执行的协程
+
+    Returns:
+        Any: 协程的返回值
+
+    Raises:
+        DeadlineExceeded: 预算已耗尽或执行超时
+    """
+    with span(stage):
+        left = remaining()
+        if left is None:
+            return await awaitable
+
+        if left <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            record_deadline_miss(stage)
+            raise DeadlineExceeded(stage)
+
+        try:
+            return await asyncio.wait_for(awaitable, left)
+        except asyncio.TimeoutError:
+            # 只有预算确实耗尽时才视为超时，其余情况是阶段内部抛出的超时
+            if remaining() > 0:
+                raise
+            record_deadline_miss(stage)
+            raise DeadlineExceeded(stage)
+
+
+def deadline_stats() -> Dict[str, int]:
+    """
+    获取各阶段超出截止时间的次数
+
+    Returns:
+        Dict: 阶段名称 -> 次数
+    """
+    return dict(_deadline_misses)
@@ -2,15 +2,20 @@
 错误处理工具模块
 包含错误识别、诊断和处理的通用功能
 """
+import asyncio
 import logging
 import json
-from typing import Dict, Any, Optional, Tuple
+import random
+import re
+from enum import Enum
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple, TypeVar
+
+import httpx
+
+from config.config import RETRY_POLICIES
+from utils.deadline import remaining
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger('xiaohuo-bot')
 
 # 飞书API权限错误码映射
@@ -36,6 +41,238 @@ PERMISSION_ERROR_CODES = {
     22008: "机器人未加入群聊"
 }
 
+class ErrorClass(Enum):
+    """错误分类，决定重试策略"""
+    RETRYABLE = "retryable"          # 临时错误（网络、服务端内部错误）
+    RATE_LIMITED = "rate_limited"    # 触发频率限制
+    TOKEN_EXPIRED = "token_expired"  # 访问凭证过期或无效
+    PERMANENT = "permanent"          # 参数错误等，重试无意义
+    PERMISSION = "permission"        # 权限不足，需要管理员处理
+
+class TokenUnavailableError(Exception):
+    """没有可用的访问凭证（获取失败或超出时间预算），按 TOKEN_EXPIRED 重试"""
+
+# 访问凭证相关错误码
+TOKEN_ERROR_CODES = frozenset({99991661, 99991663, 99991664})
+
+# 频率限制错误码
+RATE_LIMIT_ERROR_CODES = frozenset({99991400, 230020, 11232})
+
+# 服务端临时错误码
+RETRYABLE_ERROR_CODES = frozenset({55001})
+
+# 视为临时错误的异常类型（网络、超时）
+RETRYABLE_EXCEPTIONS = (ConnectionError, TimeoutError, asyncio.TimeoutError, OSError, httpx.TransportError)
+
+# 错误码 -> 分类，按此表一次查找
+_CODE_CLASSES: Dict[int, ErrorClass] = {
+    **{code: ErrorClass.PERMISSION for code in PERMISSION_ERROR_CODES},
+    **{code: ErrorClass.RETRYABLE for code in RETRYABLE_ERROR_CODES},
+    **{code: ErrorClass.RATE_LIMITED for code in RATE_LIMIT_ERROR_CODES},
+    **{code: ErrorClass.TOKEN_EXPIRED for code in TOKEN_ERROR_CODES},
+}
+
+# 错误信息关键词匹配，预编译为一个正则，一次扫描得到分类
+_MESSAGE_PATTERN = re.compile(
+    r"(?P<permission>权限|permission|access|权利|禁止|拒绝)"
+    r"|(?P<rate_limited>frequency|rate limit|too many requests|频率|限流)"
+    r"|(?P<retryable>timeout|timed out|internal error|temporarily|内部错误|系统错误|繁忙|稍后重试)",
+    re.IGNORECASE
+)
+
+def _match_message(msg: str) -> Optional[ErrorClass]:
+    """按关键词匹配错误信息，无匹配时返回None"""
+    match = _MESSAGE_PATTERN.search(msg)
+    if match is None:
+        return None
+    return ErrorClass(match.lastgroup)
+
+def classify_error(code: int, msg: str = "") -> ErrorClass:
+    """
+    根据飞书错误码和错误信息分类
+    
+    Args:
+        code: 错误码
+        msg: 错误信息
+        
+    Returns:
+        ErrorClass: 错误分类
+    """
+    error_class = _CODE_CLASSES.get(code)
+    if error_class is not None:
+        return error_class
+    return _match_message(msg or "") or ErrorClass.PERMANENT
+
+def classify_exception(error: BaseException) -> ErrorClass:
+    """
+    对调用过程中抛出的异常分类
+    
+    只有网络和超时类异常视为临时错误；其他异常按错误信息识别权限和限流问题，
+    其余（多为程序错误）视为永久错误，重试无意义。
+    
+    Args:
+        error: 异常对象
+        
+    Returns:
+        ErrorClass: 错误分类
+    """
+    if isinstance(error, TokenUnavailableError):
+        return ErrorClass.TOKEN_EXPIRED
+    if isinstance(error, RETRYABLE_EXCEPTIONS):
+        return ErrorClass.RETRYABLE
+    error_class = _match_message(str(error))
+    if error_class in (ErrorClass.PERMISSION, ErrorClass.RATE_LIMITED):
+        return error_class
+    return ErrorClass.PERMANENT
+
+def classify_response(response: Any) -> Optional[ErrorClass]:
+    """
+    对飞书SDK的响应或调用异常分类
+    
+    Args:
+        response: SDK响应对象或异常
+        
+    Returns:
+        Optional[ErrorClass]: 错误分类，成功时返回None
+    """
+    if isinstance(response, BaseException):
+        return classify_exception(response)
+    if response.success():
+        return None
+    return classify_error(response.code, response.msg)
+
+class RetryPolicy:
+    """
+    某类错误的重试策略
+    
+    第n次重试前等待 min(max_delay, base_delay * 2^(n-1))，并按 jitter 比例随机缩短。
+    """
+    
+    __slots__ = ("max_attempts", "base_delay", "max_delay", "jitter")
+    
+    def __init__(self, max_attempts: int, base_delay: float = 0.0, max_delay: float = 0.0, jitter: float = 0.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+    
+    def should_retry(self, attempts: int) -> bool:
+        """已尝试 attempts 次后是否还能重试"""
+        return attempts < self.max_attempts
+    
+    def delay(self, attempts: int) -> float:
+        """已尝试 attempts 次后，下一次重试前的等待时间（秒）"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * (1 - self.jitter * random.random())
+
+RETRY_POLICY_TABLE: Dict[ErrorClass, RetryPolicy] = {
+    error_class: RetryPolicy(**RETRY_POLICIES[error_class.value])
+    for error_class in ErrorClass
+}
+
+# 每类错误的重试次数和最终结果
+_retry_stats: Dict[str, Dict[str, int]] = {
+    error_class.value: {"retries": 0, "recovered": 0, "exhausted": 0}
+    for error_class in ErrorClass
+}
+
+def record_retry(error_class: ErrorClass) -> None:
+    """记录一次重试"""
+    _retry_stats[error_class.value]["retries"] += 1
+
+def record_retry_outcome(error_class: ErrorClass, recovered: bool) -> None:
+    """
+    记录一次带重试的操作的最终结果
+    
+    Args:
+        error_class: 最后一次失败的错误分类
+        recovered: 重试后是否成功
+    """
+    _retry_stats[error_class.value]["recovered" if recovered else "exhausted"] += 1
+
+# 重试前执行的钩子，例如凭证失效时先刷新凭证
+_retry_hooks: Dict[ErrorClass, Callable[[], Awaitable[None]]] = {}
+
+def register_retry_hook(error_class: ErrorClass, hook: Callable[[], Awaitable[None]]) -> None:
+    """
+    注册某类错误在重试前执行的钩子
+    
+    Args:
+        error_class: 错误分类
+        hook: 无参数的协程函数
+    """
+    _retry_hooks[error_class] = hook
+
+async def run_retry_hook(error_class: ErrorClass) -> None:
+    """执行某类错误的重试钩子，钩子失败不影响重试"""
+    hook = _retry_hooks.get(error_class)
+    if hook is None:
+        return
+    try:
+        await hook()
+    except Exception as e:
+        logger.error("重试钩子执行失败 (%s): %s", error_class.value, e)
+
+def retry_stats() -> Dict[str, Dict[str, int]]:
+    """
+    获取每类错误的重试统计
+    
+    Returns:
+        Dict: 分类 -> 重试次数、重试后成功次数、放弃次数
+    """
+    return {name: dict(counts) for name, counts in _retry_stats.items()}
+
+T = TypeVar("T")
+
+async def retry_async(
+    operation: str,
+    attempt: Callable[[], Awaitable[T]],
+    classify: Callable[[Any], Optional[ErrorClass]] = classify_response
+) -> T:
+    """
+    按错误分类对应的策略重试一个操作，重试等待不会超出事件剩余时间预算
+    
+    Args:
+        operation: 操作名称（用于日志）
+        attempt: 执行一次操作的函数
+        classify: 对结果或异常分类的函数，成功时返回None
+        
+    Returns:
+        T: 最后一次尝试的结果；最后一次尝试抛出的异常会继续抛出
+    """
+    attempts = 0
+    last_class = None
+    while True:
+        attempts += 1
+        try:
+            value = await attempt()
+            error = None
+        except Exception as e:
+            value = None
+            error = e
+        
+        error_class = classify(error if error is not None else value)
+        if error_class is None:
+            if last_class is not None:
+                record_retry_outcome(last_class, True)
+            return value
+        
+        last_class = error_class
+        policy = RETRY_POLICY_TABLE[error_class]
+        delay = policy.delay(attempts)
+        left = remaining()
+        if not policy.should_retry(attempts) or (left is not None and left <= delay):
+            if attempts > 1:
+                record_retry_outcome(error_class, False)
+            if error is not None:
+                raise error
+            return value
+        
+        record_retry(error_class)
+        logger.warning("%s 失败 (%s)，%.2fs 后第 %s 次重试", operation, error_class.value, delay, attempts)
+        await run_retry_hook(error_class)
+        await asyncio.sleep(delay)
+
 def check_permission_error(response_data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
     """
     检查API响应是否包含权限错误
@@ -47,20 +284,20 @@ def check_permission_error(response_data: Dict[str, Any]) -> Tuple[bool, Optiona
         Tuple[bool, Optional[str]]: (是否是权限错误, 错误描述)
     """
     code = response_data.get("code", 0)
+    msg = response_data.get("msg", "")
     
-    # 检查是否是已知的权限错误码
+    # 已知的权限错误码（含访问凭证过期/无效，重试时按 TOKEN_EXPIRED 处理，但仍需给出诊断）
     if code in PERMISSION_ERROR_CODES:
         error_msg = PERMISSION_ERROR_CODES[code]
-        logger.error(f"飞书API权限错误: {error_msg} (错误码: {code})")
+        logger.error("飞书API权限错误: %s (错误码: %s)", error_msg, code)
         return True, f"{error_msg} (错误码: {code})"
     
-    # 检查错误信息是否包含权限关键词
-    msg = response_data.get("msg", "")
-    if any(keyword in msg.lower() for keyword in ["权限", "permission", "access", "权利", "禁止", "拒绝"]):
-        logger.error(f"可能的权限错误: {msg} (错误码: {code})")
-        return True, f"可能的权限问题: {msg} (错误码: {code})"
+    if classify_error(code, msg) != ErrorClass.PERMISSION:
+        return False, None
     
-    return False, None
+    # 错误信息包含权限关键词
+    logger.error("可能的权限错误: %s (错误码: %s)", msg, code)
+    return True, f"可能的权限问题: {msg} (错误码: {code})"
 
 def log_api_error(api_name: str, error: Exception, context: Dict[str, Any] = None):
     """
@@ -75,7 +312,7 @@ def log_api_error(api_name: str, error: Exception, context: Dict[str, Any] = Non
         context = {}
     
     error_str = str(error)
-    logger.error(f"API错误 [{api_name}]: {error_str}")
+    logger.error("API错误 [%s]: %s", api_name, error_str)
     
     # 尝试解析错误响应
     if hasattr(error, 'response') and getattr(error, 'response', None) is not None:
@@ -93,12 +330,12 @@ def log_api_error(api_name: str, error: Exception, context: Dict[str, Any] = Non
                         "is_permission_error": True
                     }
                 
-                logger.error(f"API响应详情: {json.dumps(response_data, ensure_ascii=False)}")
+                logger.error("API响应详情: %s", json.dumps(response_data, ensure_ascii=False))
         except Exception as e:
-            logger.error(f"解析错误响应失败: {e}")
+            logger.error("解析错误响应失败: %s", e)
     
     # 检查错误字符串中是否包含权限关键词
-    if any(keyword in error_str.lower() for keyword in ["权限", "permission", "access", "权利", "禁止", "拒绝"]):
+    if _match_message(error_str) == ErrorClass.PERMISSION:
         logger.error("检测到可能的权限问题，请检查应用权限配置")
         return {
             "success": False,
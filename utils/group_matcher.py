@@ -0,0 +1,60 @@
+"""
+群组类型识别模块
+根据 GROUP_TYPES 中各群组类型的关键词，把所有关键词预编译为一个正则，一次扫描识别用户文本。
+匹配器随路由快照一起构建（见 utils/routing.py），通过 current_routing().matcher 使用。
+"""
+import re
+from typing import Any, Dict, List, Mapping, Optional
+
+from config.config import GROUP_TYPES
+
+
+class GroupTypeMatcher:
+    """
+    群组类型关键词匹配器
+
+    文本中出现多个关键词时，以最先出现的关键词为准；同一位置上较长的关键词优先。
+    """
+
+    def __init__(self, group_types: Mapping[str, Mapping[str, Any]]):
+        self._group_types: Dict[str, str] = {}
+        for group_type, group in group_types.items():
+            if not group.get("selectable", True):
+                continue
+            for keyword in group.get("keywords", []):
+                # 同一关键词配置在多个群组类型下时，以先配置的为准
+                self._group_types.setdefault(keyword.lower(), group_type)
+
+        keywords = sorted(self._group_types, key=len, reverse=True)
+        self._pattern = re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE) if keywords else None
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        识别文本中的群组类型
+
+        Args:
+            text: 用户文本
+
+        Returns:
+            Optional[str]: 群组类型，没有命中任何关键词时返回None
+        """
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(text)
+        if match is None:
+            return None
+        return self._group_types[match.group().lower()]
+
+
+def selectable_group_types(group_types: Mapping[str, Mapping[str, Any]] = GROUP_TYPES) -> List[str]:
+    """
+    获取出现在群组选择卡片上的群组类型（按配置顺序）
+
+    Args:
+        group_types: 群组类型配置
+
+    Returns:
+        List[str]: 群组类型
+    """
+    return [group_type for group_type, group in group_types.items() if group.get("selectable", True)]
+
@@ -2,27 +2,69 @@
 Lark SDK 客户端工具
 提供飞书 API 的客户端实例和相关工具函数
 """
-import os
-import lark_oapi as lark
-from config.config import FEISHU_APP_ID, FEISHU_APP_SECRET
+from typing import Any, Dict, Optional
 
-# 缓存客户端实例
-_lark_client = None
+from config.config import FEISHU_DOMAIN
+from utils.deadline import run_stage
+from utils.error_handler import TokenUnavailableError
+from utils.tenants import Tenant, current_tenant
 
-def get_lark_client():
+# 缓存客户端实例: app_id -> lark.Client
+_lark_clients: Dict[str, Any] = {}
+
+def get_lark_client(tenant: Optional[Tenant] = None):
     """
-    获取 Lark 客户端实例（单例模式）
-    
+    获取租户的 Lark 客户端实例（每个租户一个）
+
+    Args:
+        tenant: 租户，默认使用当前事件所属的租户
+
     Returns:
         lark.Client: Lark 客户端实例
     """
-    global _lark_client
-    
-    if _lark_client is None:
-        _lark_client = lark.Client.builder() \
-            .app_id(FEISHU_APP_ID) \
-            .app_secret(FEISHU_APP_SECRET) \
+    tenant = tenant or current_tenant()
+    client = _lark_clients.get(tenant.app_id)
+
+    if client is None:
+        # SDK导入较慢，延迟到首次使用（启动预热阶段）时导入
+        import lark_oapi as lark
+
+        # 凭证统一由租户的凭证管理器提供（见 get_request_option），SDK不自行获取和缓存
+        client = lark.Client.builder() \
+            .app_id(tenant.app_id) \
+            .app_secret(tenant.app_secret) \
+            .enable_set_token(True) \
+            .domain(FEISHU_DOMAIN) \
             .log_level(lark.LogLevel.INFO) \
             .build()
-    
-    return _lark_client
+        _lark_clients[tenant.app_id] = client
+
+    return client
+
+async def get_request_option(tenant: Optional[Tenant] = None):
+    """
+    获取携带租户当前 tenant_access_token 的请求选项
+
+    凭证由租户的凭证管理器在后台维护；尚未获取到或已过期时（冷启动、后台刷新失败），
+    在事件剩余时间预算内等待凭证管理器的刷新（并发请求共享同一次刷新），不交给SDK自行获取，
+    避免出现不经共享状态存储协调的第二份凭证缓存。
+
+    Args:
+        tenant: 租户，默认使用当前事件所属的租户
+
+    Returns:
+        lark.RequestOption: 请求选项
+
+    Raises:
+        TokenUnavailableError: 凭证获取失败或超出时间预算（发件箱按 TOKEN_EXPIRED 稍后重试）
+    """
+    import lark_oapi as lark
+
+    manager = (tenant or current_tenant()).token_manager
+    token = manager.token
+    if token is None:
+        try:
+            token = await run_stage("token", manager.refresh())
+        except Exception as e:
+            raise TokenUnavailableError(f"没有可用的访问凭证: {e}") from e
+    return lark.RequestOption.builder().tenant_access_token(token).build()
@@ -0,0 +1,76 @@
+"""
+延迟统计工具模块
+维护最近一段时间的耗时样本，并提供带缓存的分位数查询
+"""
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyWindow:
+    """
+    固定容量的耗时滑动窗口
+
+    分位数按需计算并缓存 refresh_interval 秒，热路径上的查询只是读取缓存结果。
+    """
+
+    def __init__(self, size: int = 512, refresh_interval: float = 1.0):
+        self._samples = deque(maxlen=size)
+        self._refresh_interval = refresh_interval
+        self._snapshot: Dict[float, float] = {}
+        self._snapshot_at = 0.0
+        self._dirty = False
+
+    def observe(self, seconds: float) -> None:
+        """
+        记录一次耗时
+
+        Args:
+            seconds: 耗时（秒）
+        """
+        self._samples.append(seconds)
+        self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        获取分位数
+
+        Args:
+            q: 分位点，取值0-1，例如0.95
+
+        Returns:
+            Optional[float]: 分位数（秒），没有样本时返回None
+        """
+        if not self._samples:
+            return None
+
+        now = time.monotonic()
+        if self._dirty and now - self._snapshot_at >= self._refresh_interval:
+            self._snapshot = {}
+            self._snapshot_at = now
+            self._dirty = False
+
+        value = self._snapshot.get(q)
+        if value is None:
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(q * len(ordered)))
+            value = ordered[index]
+            self._snapshot[q] = value
+        return value
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """
+        获取常用分位数摘要
+
+        Returns:
+            Dict: 包含count、p50、p95、p99字段
+        """
+        return {
+            "count": len(self._samples),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
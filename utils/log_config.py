@@ -0,0 +1,94 @@
+"""
+日志配置模块
+日志记录只放入内存队列，由后台线程格式化为JSON并写出，事件循环不会因日志I/O阻塞。
+消息参数在后台线程中才格式化；记录中附带当前事件的event_id和open_id。
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from config.config import LOG_LEVEL, LOG_JSON
+from utils.tracing import trace_context
+
+# 不出现在JSON额外字段中的标准LogRecord属性
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为单行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    把日志记录放入队列，并附带当前事件的上下文
+
+    与标准QueueHandler不同，这里不在调用线程中格式化消息，由后台线程完成。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        context = trace_context()
+        if context:
+            record.event_id, record.open_id = context
+        if record.exc_info and not record.exc_text:
+            # 异常的traceback对象不能跨线程保留太久，这里先转成文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> None:
+    """
+    配置 xiaohuo-bot 日志：队列处理器 + 后台写出线程（重复调用无效）
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if LOG_JSON:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    logger = logging.getLogger('xiaohuo-bot')
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(ContextQueueHandler(log_queue))
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
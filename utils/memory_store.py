@@ -8,6 +8,8 @@ import time
 import logging
 import json
 
+from utils.metrics import registry
+
 # 配置日志
 logger = logging.getLogger('xiaohuo-bot')
 
@@ -22,6 +24,10 @@ class UserState(Enum):
 _user_states = {}  # 用户ID -> 状态数据
 _state_expiry = 60 * 5  # 状态过期时间（5分钟）
 
+# 命中统计：用户状态查询和验证结果缓存
+_hits = {"user_state": 0, "verification_cache": 0}
+_misses = {"user_state": 0, "verification_cache": 0}
+
 async def get_user_state(user_id: str) -> Dict[str, Any]:
     """
     获取用户状态
@@ -40,10 +46,15 @@ async def get_user_state(user_id: str) -> Dict[str, Any]:
         # 状态已过期，删除并返回初始状态
         if user_id in _user_states:
             del _user_states[user_id]
+        _misses["user_state"] += 1
         return {"state": UserState.INITIAL.value}
     
     # 返回状态，如果不存在则返回初始状态
-    return state_data or {"state": UserState.INITIAL.value}
+    if not state_data:
+        _misses["user_state"] += 1
+        return {"state": UserState.INITIAL.value}
+    _hits["user_state"] += 1
+    return state_data
 
 async def set_user_state(user_id: str, state_data: Dict[str, Any]) -> bool:
     """
@@ -91,7 +102,7 @@ def cleanup_expired_states():
         del _user_states[user_id]
     
     if expired_users:
-        logger.info(f"已清理 {len(expired_users)} 个过期用户状态")
+        logger.info("已清理 %s 个过期用户状态", len(expired_users))
 
 # 验证结果缓存
 _verification_cache = {}
@@ -133,6 +144,7 @@ async def get_cached_verification_result(user_id: str, qr_data: str, group_type:
     cache_data = _verification_cache.get(key)
     
     if not cache_data:
+        _misses["verification_cache"] += 1
         return None
         
     # 检查是否过期
@@ -140,10 +152,53 @@ async def get_cached_verification_result(user_id: str, qr_data: str, group_type:
         # 过期，删除缓存
         if key in _verification_cache:
             del _verification_cache[key]
+        _misses["verification_cache"] += 1
         return None
     
+    _hits["verification_cache"] += 1
     return cache_data.get("result")
 
+def memory_store_stats() -> Dict[str, Any]:
+    """
+    获取内存存储统计（只读取计数器，O(1)）
+    
+    Returns:
+        Dict: 各存储的条目数、命中次数、未命中次数和命中率
+    """
+    sizes = {"user_state": len(_user_states), "verification_cache": len(_verification_cache)}
+    stats = {}
+    for name, size in sizes.items():
+        hits, misses = _hits[name], _misses[name]
+        total = hits + misses
+        stats[name] = {
+            "size": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
+    return stats
+
+registry.gauge(
+    "xiaohuo_store_entries",
+    "Entries in the in-memory stores",
+    ["store"],
+    lambda: [(("user_state",), len(_user_states)), (("verification_cache",), len(_verification_cache))]
+)
+registry.gauge(
+    "xiaohuo_store_hits_total",
+    "Lookups that found a live entry",
+    ["store"],
+    lambda: [((name,), count) for name, count in _hits.items()],
+    metric_type="counter"
+)
+registry.gauge(
+    "xiaohuo_store_misses_total",
+    "Lookups that found no entry or an expired one",
+    ["store"],
+    lambda: [((name,), count) for name, count in _misses.items()],
+    metric_type="counter"
+)
+
 # 模拟关闭连接的函数，保持接口兼容
 async def close_memory_store():
     """模拟关闭存储连接，实际只是清空内存"""
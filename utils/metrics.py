@@ -0,0 +1,324 @@
+"""
+指标模块
+提供计数器、直方图和按需采集的仪表，并以Prometheus文本格式输出。
+
+指标只在事件循环线程中更新，不加锁；热路径上每次记录只是一次二分查找和几次整数加法。
+调用方应在模块加载时通过 labels() 取得带标签的子序列并保存，避免每次查找标签。
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from utils.deadline import deadline_stats
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    """带固定标签值的计数器"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, _CounterChild] = {}
+
+    def labels(self, *values: str) -> _CounterChild:
+        """
+        获取带标签值的子计数器
+
+        Args:
+            values: 与 labelnames 一一对应的标签值
+
+        Returns:
+            _CounterChild: 子计数器
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _CounterChild()
+        return child
+
+    def inc(self, amount: float = 1) -> None:
+        """无标签计数器加一"""
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self._children.items()
+        ]
+
+
+class _Timer:
+    """记录代码块耗时的上下文管理器"""
+
+    __slots__ = ("_series", "_start")
+
+    def __init__(self, series: "_HistogramChild"):
+        self._series = series
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._series.observe(time.perf_counter() - self._start)
+
+
+class _HistogramChild:
+    """带固定标签值的直方图"""
+
+    __slots__ = ("_bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # 每个分桶单独计数（非累计），最后一个为 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值（秒）
+        """
+        self.counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """返回记录代码块耗时的上下文管理器: with series.time(): ..."""
+        return _Timer(self)
+
+
+class Histogram:
+    """固定分桶的直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._bounds = tuple(sorted(buckets))
+        self._children: Dict[LabelValues, _HistogramChild] = {}
+
+    def labels(self, *values: str) -> _HistogramChild:
+        """
+        获取带标签值的子直方图
+
+        Args:
+            values: 与 labelnames 一一对应的标签值
+
+        Returns:
+            _HistogramChild: 子直方图
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = _HistogramChild(self._bounds)
+        return child
+
+    def render(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self._bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Gauge:
+    """
+    仪表：数值在输出指标时由回调函数现场采集
+
+    回调返回 (标签值元组, 数值) 的序列；采集失败时该指标本次不输出。
+    """
+
+    metric_type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        metric_type: str = "gauge"
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self._collect())
+        except Exception:
+            return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+            for values, value in samples
+            if value is not None
+        ]
+
+
+class MetricsRegistry:
+    """已注册指标的集合"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        """
+        注册指标，同名指标只保留第一次注册的实例
+
+        Args:
+            metric: Counter、Histogram 或 Gauge
+
+        Returns:
+            已注册的指标实例
+        """
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        metric_type: str = "gauge"
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect, metric_type))
+
+    def render(self) -> str:
+        """
+        输出Prometheus文本格式
+
+        Returns:
+            str: 所有指标的文本
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+# 各处理阶段耗时
+STAGE_SECONDS = registry.histogram(
+    "xiaohuo_stage_duration_seconds",
+    "Time spent in each processing stage",
+    ["stage"]
+)
+
+# 按事件类型和处理结果计数
+EVENTS_TOTAL = registry.counter(
+    "xiaohuo_events_total",
+    "Events handled by event type and outcome",
+    ["event_type", "outcome"]
+)
+
+# 二维码验证结果计数
+VERIFICATIONS_TOTAL = registry.counter(
+    "xiaohuo_verifications_total",
+    "QR code verifications by outcome",
+    ["outcome"]
+)
+
+# 各阶段超出事件时间预算的次数（在 utils/deadline.py 中累计）
+DEADLINE_MISSES_TOTAL = registry.gauge(
+    "xiaohuo_deadline_misses_total",
+    "Processing stages that ran out of the per-event time budget",
+    ["stage"],
+    lambda: [((stage,), count) for stage, count in deadline_stats().items()],
+    metric_type="counter"
+)
+
+
+
+def stage_timer(stage: str) -> _HistogramChild:
+    """
+    获取某个阶段的耗时直方图，应在模块加载时调用并保存结果
+
+    Args:
+        stage: 阶段名称
+
+    Returns:
+        _HistogramChild: 可调用 observe() 或 time() 的子直方图
+    """
+    return STAGE_SECONDS.labels(stage)
+
+
+def render_metrics() -> str:
+    """
+    输出所有指标
+
+    Returns:
+        str: Prometheus文本格式
+    """
+    return registry.render()
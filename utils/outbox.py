@@ -0,0 +1,444 @@
+"""
+持久化发件箱模块
+出站操作（发送消息、添加群成员）先写入本地SQLite（WAL模式），再尝试发送；
+临时失败的操作由后台调度器按错误分类对应的重试策略批量重试，进程重启后自动重放未完成的操作。
+成功的操作随即删除记录，永久失败的记录保留 OUTBOX_DEAD_RETENTION 秒后清理。
+"""
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from config.config import (
+    OUTBOX_ENABLED,
+    OUTBOX_PATH,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_FLUSH_INTERVAL,
+    OUTBOX_DEAD_RETENTION,
+    OUTBOX_PRUNE_INTERVAL
+)
+from utils.error_handler import (
+    ErrorClass,
+    RETRY_POLICY_TABLE,
+    classify_response,
+    run_retry_hook,
+    record_retry,
+    record_retry_outcome
+)
+from utils.metrics import registry
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 操作结果状态
+OUTBOX_DONE = "done"    # 已完成，删除记录
+OUTBOX_RETRY = "retry"  # 临时失败，稍后重试
+OUTBOX_DEAD = "dead"    # 永久失败，不再重试
+
+
+class OutboxResult:
+    """一次出站操作的结果"""
+
+    __slots__ = ("status", "value", "error_class")
+
+    def __init__(self, status: str, value: Any = None, error_class: Optional[ErrorClass] = None):
+        self.status = status
+        self.value = value
+        self.error_class = error_class
+
+
+def classify_result(value: Any) -> OutboxResult:
+    """
+    根据飞书响应或调用异常生成操作结果，是否重试由错误分类的重试策略决定
+
+    Args:
+        value: SDK响应对象或异常
+
+    Returns:
+        OutboxResult: 操作结果
+    """
+    error_class = classify_response(value)
+    if error_class is None:
+        return OutboxResult(OUTBOX_DONE, value)
+    if RETRY_POLICY_TABLE[error_class].max_attempts > 1:
+        return OutboxResult(OUTBOX_RETRY, value, error_class)
+    return OutboxResult(OUTBOX_DEAD, value, error_class)
+
+
+# 出站操作处理函数: 接收payload，返回OutboxResult
+OutboxHandler = Callable[[Dict[str, Any]], Awaitable[OutboxResult]]
+
+# 执行操作及其重试钩子时进入的上下文: 接收payload（例如按payload绑定租户）
+OutboxContext = Callable[[Dict[str, Any]], ContextManager[Any]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+)
+"""
+
+
+class Outbox:
+    """
+    持久化发件箱
+
+    写入采用组提交：同一时间窗口内的插入、更新、删除合并为一个事务，
+    在专用线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        flush_interval: float = OUTBOX_FLUSH_INTERVAL,
+        dead_retention: float = OUTBOX_DEAD_RETENTION
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dead_retention = dead_retention
+
+        self._handlers: Dict[str, OutboxHandler] = {}
+        self._contexts: Dict[str, OutboxContext] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # 待提交的写操作及等待提交完成的future
+        self._writes: List[Tuple[str, tuple]] = []
+        self._write_waiters: List[asyncio.Future] = []
+        self._write_event: Optional[asyncio.Event] = None
+
+        # 未完成的操作: key -> (kind, payload, attempts, 下次重试时间)，以及按到期时间排序的堆
+        self._pending: Dict[str, Tuple[str, Dict[str, Any], int, float]] = {}
+        self._due: List[Tuple[float, str]] = []
+        # 最近一次失败的错误分类，用于统计重试结果
+        self._last_class: Dict[str, ErrorClass] = {}
+        self._due_event: Optional[asyncio.Event] = None
+        # 正在执行的操作: key -> 本次执行结果的future
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self._tasks: List[asyncio.Task] = []
+        self._counters: Dict[str, int] = {"submitted": 0, "done": 0, "retried": 0, "dead": 0}
+
+    @property
+    def running(self) -> bool:
+        """发件箱是否已启动"""
+        return self._conn is not None
+
+    def register(self, kind: str, handler: OutboxHandler, context: Optional[OutboxContext] = None) -> None:
+        """
+        注册某类出站操作的处理函数
+
+        Args:
+            kind: 操作类型
+            handler: 处理函数
+            context: 执行操作和重试钩子时进入的上下文，后台重试时调用方的上下文已不存在
+        """
+        self._handlers[kind] = handler
+        if context is not None:
+            self._contexts[kind] = context
+
+    async def start(self) -> None:
+        """打开数据库，加载未完成的操作并启动后台任务"""
+        if self.running:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox-db")
+        self._conn = await self._run_db(self._open)
+        rows = await self._run_db(self._load_pending)
+
+        for key, kind, payload, attempts, next_attempt_at in rows:
+            self._pending[key] = (kind, json.loads(payload), attempts, next_attempt_at)
+            heapq.heappush(self._due, (next_attempt_at, key))
+        if rows:
+            logger.warning("发件箱重放 %s 个未完成的出站操作", len(rows))
+
+        self._write_event = asyncio.Event()
+        self._due_event = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._flush_loop(), name="outbox-flush"),
+            asyncio.create_task(self._dispatch_loop(), name="outbox-dispatch"),
+            asyncio.create_task(self._prune_loop(), name="outbox-prune"),
+        ]
+
+    async def stop(self) -> None:
+        """停止后台任务，提交剩余写操作并关闭数据库"""
+        if not self.running:
+            return
+
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        await self._flush()
+        conn, self._conn = self._conn, None
+        await asyncio.get_running_loop().run_in_executor(self._executor, conn.close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._pending.clear()
+        self._due.clear()
+
+    async def submit(self, kind: str, key: str, payload: Dict[str, Any]) -> OutboxResult:
+        """
+        记录一个出站操作并立即尝试一次，临时失败时交给后台重试
+
+        首次尝试与写入记录同时进行，不等待提交完成才开始发送；同一操作正在执行时
+        （例如后台恰好在重试）不再重复发送，而是等待那一次的结果。
+
+        Args:
+            kind: 操作类型
+            key: 幂等键，同一操作重复提交不会产生重复记录；已永久失败的记录重新提交时恢复为待发送
+            payload: 操作参数（需可JSON序列化）
+
+        Returns:
+            OutboxResult: 首次尝试的结果
+        """
+        handler = self._handlers[kind]
+        if not self.running:
+            with self._context(kind, payload):
+                return await handler(payload)
+
+        self._counters["submitted"] += 1
+        if key in self._pending:
+            return await self._attempt(key)
+
+        self._pending[key] = (kind, payload, 0, 0.0)
+        # 插入先进入写队列，一定先于本次尝试产生的更新或删除提交；
+        # 同一键之前永久失败的记录（例如用户再次验证后重新入群）重置为新的待发送记录
+        now = time.time()
+        persisted = self._write(
+            "INSERT INTO outbox (key, kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET status = 'pending', attempts = 0, kind = excluded.kind, "
+            "payload = excluded.payload, next_attempt_at = excluded.next_attempt_at, "
+            "created_at = excluded.created_at, last_error = NULL WHERE status = 'dead'",
+            (key, kind, json.dumps(payload, ensure_ascii=False), now, now)
+        )
+        try:
+            return await self._attempt(key)
+        finally:
+            try:
+                await persisted
+            except Exception as e:
+                # 持久化失败时仍然完成了发送，只是失去重启后重放的保障
+                logger.error("出站操作 %s (%s) 持久化失败: %s", kind, key, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取发件箱统计信息
+
+        Returns:
+            Dict: 等待重试数量和各类计数
+        """
+        return {"pending": len(self._pending), **self._counters}
+
+    def _context(self, kind: str, payload: Dict[str, Any]) -> ContextManager[Any]:
+        context = self._contexts.get(kind)
+        return context(payload) if context is not None else nullcontext()
+
+    async def _attempt(self, key: str) -> OutboxResult:
+        """执行一次操作；同一操作正在执行时等待那一次的结果，避免重复发送"""
+        running = self._in_flight.get(key)
+        while running is not None:
+            try:
+                return await asyncio.shield(running)
+            except asyncio.CancelledError:
+                if not running.cancelled():
+                    raise
+            # 正在执行的那一次被取消了，由本次重新执行
+            running = self._in_flight.get(key)
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = done
+        try:
+            result = await self._execute(key)
+        except BaseException:
+            done.cancel()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        done.set_result(result)
+        return result
+
+    async def _execute(self, key: str) -> OutboxResult:
+        """执行一次操作并根据结果更新记录"""
+        kind, payload, attempts, _ = self._pending[key]
+        try:
+            with self._context(kind, payload):
+                result = await self._handlers[kind](payload)
+        except asyncio.CancelledError:
+            # 调用方被取消（如超出时间预算），交给后台立即重试
+            self._schedule(key, attempts, 0.0, "cancelled")
+            raise
+        except Exception as e:
+            result = classify_result(e)
+
+        attempts += 1
+        error_class = result.error_class or ErrorClass.RETRYABLE
+        policy = RETRY_POLICY_TABLE[error_class]
+        if result.status == OUTBOX_DONE:
+            self._pending.pop(key, None)
+            self._counters["done"] += 1
+            if attempts > 1:
+                record_retry_outcome(self._last_class.pop(key, ErrorClass.RETRYABLE), True)
+            self._write_nowait("DELETE FROM outbox WHERE key = ?", (key,))
+        elif result.status == OUTBOX_RETRY and policy.should_retry(attempts):
+            self._counters["retried"] += 1
+            self._last_class[key] = error_class
+            record_retry(error_class)
+            self._schedule(key, attempts, policy.delay(attempts), repr(result.value))
+            with self._context(kind, payload):
+                await run_retry_hook(error_class)
+        else:
+            self._pending.pop(key, None)
+            self._last_class.pop(key, None)
+            self._counters["dead"] += 1
+            if attempts > 1:
+                record_retry_outcome(error_class, False)
+            logger.error("出站操作 %s (%s) 失败，不再重试: %r", kind, key, result.value)
+            self._write_nowait(
+                "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE key = ?",
+                (attempts, repr(result.value), key)
+            )
+        return result
+
+    def _schedule(self, key: str, attempts: int, delay: float, error: str) -> None:
+        """安排一次重试"""
+        kind, payload, _, _ = self._pending[key]
+        next_attempt_at = time.time() + delay
+        self._pending[key] = (kind, payload, attempts, next_attempt_at)
+        heapq.heappush(self._due, (next_attempt_at, key))
+        self._write_nowait(
+            "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE key = ?",
+            (attempts, next_attempt_at, error, key)
+        )
+        if self._due_event is not None:
+            self._due_event.set()
+
+    async def _dispatch_loop(self) -> None:
+        """批量执行到期的重试"""
+        while True:
+            now = time.time()
+            batch = []
+            while self._due and self._due[0][0] <= now and len(batch) < self.batch_size:
+                due_at, key = heapq.heappop(self._due)
+                # 跳过已完成或已被重新安排的旧条目
+                pending = self._pending.get(key)
+                if pending is not None and pending[3] == due_at and key not in batch:
+                    batch.append(key)
+
+            if batch:
+                await asyncio.gather(*(self._attempt(key) for key in batch), return_exceptions=True)
+                continue
+
+            timeout = self._due[0][0] - now if self._due else None
+            self._due_event.clear()
+            try:
+                await asyncio.wait_for(self._due_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _prune_loop(self) -> None:
+        """定期删除超过保留时间的永久失败记录"""
+        while True:
+            self._write_nowait(
+                "DELETE FROM outbox WHERE status = 'dead' AND created_at < ?",
+                (time.time() - self.dead_retention,)
+            )
+            await asyncio.sleep(OUTBOX_PRUNE_INTERVAL)
+
+    def _write(self, sql: str, params: tuple) -> asyncio.Future:
+        """加入写队列，返回提交完成时完成的future"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._write_waiters.append(waiter)
+        self._write_nowait(sql, params)
+        return waiter
+
+    def _write_nowait(self, sql: str, params: tuple) -> None:
+        """加入写队列，不等待提交"""
+        self._writes.append((sql, params))
+        if self._write_event is not None:
+            self._write_event.set()
+
+    async def _flush_loop(self) -> None:
+        """组提交：短暂等待以合并写操作，然后一次性提交"""
+        while True:
+            await self._write_event.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._write_event.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        writes, self._writes = self._writes, []
+        waiters, self._write_waiters = self._write_waiters, []
+        if not writes:
+            return
+        try:
+            await self._run_db(self._commit, writes)
+        except Exception as e:
+            logger.error("发件箱写入失败: %s", e)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # 以下方法在数据库线程中执行
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        return conn
+
+    def _load_pending(self) -> list:
+        return self._conn.execute(
+            "SELECT key, kind, payload, attempts, next_attempt_at FROM outbox WHERE status = 'pending'"
+        ).fetchall()
+
+    def _commit(self, writes: List[Tuple[str, tuple]]) -> None:
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            for sql, params in writes:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+# 全局发件箱实例（OUTBOX_ENABLED时在应用启动时打开）
+outbox = Outbox(OUTBOX_PATH)
+
+registry.gauge("xiaohuo_outbox_pending", "Outbound operations awaiting delivery", [], lambda: [((), outbox.stats()["pending"])])
+registry.gauge(
+    "xiaohuo_outbox_operations_total",
+    "Outbox operations by result",
+    ["result"],
+    lambda: [((name,), count) for name, count in outbox.stats().items() if name != "pending"],
+    metric_type="counter"
+)
@@ -0,0 +1,267 @@
+"""
+采样性能分析模块
+按需在当前工作进程中开启一段时间的性能分析，结果写入磁盘：
+- collapsed: 后台线程定时采样调用栈，输出折叠栈格式（可直接生成火焰图）
+- pstats: 在事件循环线程上开启cProfile，输出pstats文件
+
+可以只分析某个处理函数：分析期间把模块中的函数替换为计数包装，结束后恢复原函数。
+未开启分析时没有采样线程也没有包装函数，不产生任何开销。
+"""
+import asyncio
+import cProfile
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from config.config import PROFILER_OUTPUT_DIR, PROFILER_INTERVAL, PROFILER_MAX_SECONDS, PROFILER_TARGETS
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+PROFILE_COLLAPSED = "collapsed"
+PROFILE_PSTATS = "pstats"
+
+
+class ProfilerBusy(Exception):
+    """已有进行中的性能分析时抛出"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    单进程内的按需性能分析器
+
+    同一时间只允许一个分析会话；会话在到达时长或目标函数调用次数后自动结束。
+    """
+
+    def __init__(self, output_dir: str = PROFILER_OUTPUT_DIR, interval: float = PROFILER_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = interval
+
+        self._session: Optional[Dict[str, Any]] = None
+        self._last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def active(self) -> bool:
+        """是否有进行中的分析"""
+        return self._session is not None
+
+    def start(
+        self,
+        seconds: float,
+        requests: Optional[int] = None,
+        target: Optional[str] = None,
+        output: str = PROFILE_COLLAPSED
+    ) -> Dict[str, Any]:
+        """
+        开始一次分析（需在事件循环线程中调用）
+
+        Args:
+            seconds: 最长分析时长（秒）
+            requests: 目标函数调用达到该次数后提前结束，需同时指定target
+            target: 只分析该函数的调用，取值为 PROFILER_TARGETS 中的名称
+            output: 输出格式，"collapsed" 或 "pstats"
+
+        Returns:
+            Dict: 会话信息
+
+        Raises:
+            ProfilerBusy: 已有进行中的分析
+            ValueError: 参数不合法
+        """
+        if self._session is not None:
+            raise ProfilerBusy("已有进行中的性能分析")
+        if output not in (PROFILE_COLLAPSED, PROFILE_PSTATS):
+            raise ValueError(f"未知的输出格式: {output}")
+        if target is not None and target not in PROFILER_TARGETS:
+            raise ValueError(f"未知的分析目标: {target}")
+        if requests is not None and target is None:
+            raise ValueError("按请求数分析时需要指定target")
+
+        seconds = max(0.1, min(float(seconds), PROFILER_MAX_SECONDS))
+        loop = asyncio.get_running_loop()
+        started_at = time.time()
+        path = os.path.join(
+            self.output_dir,
+            f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at))}.{output}"
+        )
+
+        session = {
+            "target": target,
+            "output": output,
+            "path": path,
+            "started_at": started_at,
+            "seconds": seconds,
+            "requests": requests,
+            "calls": 0,
+            "active_calls": 0,
+            "loop_thread": threading.get_ident(),
+        }
+        self._session = session
+
+        if target is not None:
+            self._install_wrapper(session)
+
+        if output == PROFILE_PSTATS:
+            session["profile"] = cProfile.Profile()
+            session["profile"].enable()
+        else:
+            session["samples"] = Counter()
+            session["stop_event"] = threading.Event()
+            session["thread"] = threading.Thread(
+                target=self._sample_loop, args=(session,), name="sampling-profiler", daemon=True
+            )
+            session["thread"].start()
+
+        session["timer"] = loop.call_later(seconds, self.stop)
+        logger.warning(
+            "开始性能分析: 格式=%s, 目标=%s, 时长=%s秒, 请求数=%s", output, target or '全部', seconds, requests
+        )
+        return self.stats()
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """
+        结束当前分析，恢复被替换的函数，并在后台线程中写入结果（需在事件循环线程中调用）
+
+        Returns:
+            Optional[Dict]: 结果信息，没有进行中的分析时返回None
+        """
+        session, self._session = self._session, None
+        if session is None:
+            return None
+
+        session["timer"].cancel()
+        if "original" in session:
+            setattr(session["module"], session["attr"], session["original"])
+
+        if session["output"] == PROFILE_PSTATS:
+            session["profile"].disable()
+        else:
+            session["stop_event"].set()
+
+        result = {
+            "path": session["path"],
+            "target": session["target"],
+            "output": session["output"],
+            "duration": round(time.time() - session["started_at"], 3),
+            "calls": session["calls"],
+        }
+        self._last_result = result
+        # 采样线程结束后写文件，不阻塞事件循环
+        threading.Thread(target=self._write, args=(session, result), name="profiler-writer", daemon=True).start()
+        logger.warning("性能分析结束，结果写入 %s", session['path'])
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取分析器状态
+
+        Returns:
+            Dict: 进行中会话的信息和上一次的结果
+        """
+        session = self._session
+        current = None
+        if session is not None:
+            current = {
+                "target": session["target"],
+                "output": session["output"],
+                "path": session["path"],
+                "elapsed": round(time.time() - session["started_at"], 3),
+                "seconds": session["seconds"],
+                "requests": session["requests"],
+                "calls": session["calls"],
+            }
+        return {"active": current, "last": self._last_result}
+
+    def _install_wrapper(self, session: Dict[str, Any]) -> None:
+        """把目标函数替换为记录调用的包装函数"""
+        module_name, attr = PROFILER_TARGETS[session["target"]].split(":")
+        module = importlib.import_module(module_name)
+        original = getattr(module, attr)
+
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            session["active_calls"] += 1
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                session["active_calls"] -= 1
+                session["calls"] += 1
+                limit = session["requests"]
+                if limit is not None and session["calls"] >= limit and self._session is session:
+                    self.stop()
+
+        session.update(module=module, attr=attr, original=original, target_code=original.__code__)
+        setattr(module, attr, wrapper)
+
+    def _sample_loop(self, session: Dict[str, Any]) -> None:
+        """采样线程：定时读取各线程的调用栈"""
+        samples: Counter = session["samples"]
+        stop_event: threading.Event = session["stop_event"]
+        own_ident = threading.get_ident()
+        loop_ident = session["loop_thread"]
+        target_code = session.get("target_code")
+        names = {}
+
+        while not stop_event.wait(self.interval):
+            # 指定目标时，只在目标函数执行期间采样
+            if target_code is not None and not session["active_calls"]:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = self._collect_stack(frame, target_code if ident == loop_ident else None)
+                if stack is None:
+                    continue
+                if ident not in names:
+                    names[ident] = next(
+                        (thread.name for thread in threading.enumerate() if thread.ident == ident), str(ident)
+                    )
+                samples[names[ident] + ";" + ";".join(stack)] += 1
+
+    @staticmethod
+    def _collect_stack(frame, target_code) -> Optional[List[str]]:
+        """
+        从栈顶向下收集调用栈，返回从外到内的帧名称
+
+        指定target_code时只保留从目标函数开始的部分；栈中没有目标函数时返回None。
+        """
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            if target_code is not None and frame.f_code is target_code:
+                break
+            frame = frame.f_back
+        else:
+            if target_code is not None:
+                return None
+        stack.reverse()
+        return stack
+
+    def _write(self, session: Dict[str, Any], result: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if session["output"] == PROFILE_PSTATS:
+                session["profile"].dump_stats(session["path"])
+            else:
+                session["thread"].join()
+                with open(session["path"], "w", encoding="utf-8") as f:
+                    for stack, count in session["samples"].most_common():
+                        f.write(f"{stack} {count}\n")
+                result["samples"] = sum(session["samples"].values())
+        except Exception as e:
+            logger.error("写入性能分析结果失败: %s", e)
+
+
+# 全局分析器实例
+profiler = SamplingProfiler()
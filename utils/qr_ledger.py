@@ -0,0 +1,194 @@
+"""
+二维码单次使用账本
+二维码只有一分钟有效期，且只应由持有人使用。账本记录每个二维码兑换成功（验证通过）的用户和兑换时间:
+- 其他用户再提交同一二维码时直接拒绝（截图转发、重放）
+- 兑换的用户在有效期内重新提交时放行（例如入群失败后重试），超过有效期后直接拒绝
+
+验证前只检查不登记，验证通过后才登记，提交了无效或他人二维码的用户不会把真正的持有人挡在外面。
+两种拒绝都在调用验证API之前完成，不占用验证API的配额和并发。
+
+记录写入共享状态存储（set_if_absent），多个工作进程看到同一个兑换用户；共享存储的读写在线程中执行
+（sqlite 可能等待其他进程的写锁），不阻塞事件循环。进程内另有一份缓存，重复提交时只查一次字典。
+兑换用户和兑换时间写入后不再改变，缓存的内容不会过时。
+"""
+import asyncio
+import hashlib
+import json
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from config.config import QR_TOKEN_LEDGER_ENABLED, QR_TOKEN_VALIDITY, QR_TOKEN_LEDGER_RETENTION
+from utils.metrics import registry
+from utils.state_backend import get_state_backend
+from utils.tenants import current_tenant
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 检查结果
+QR_TOKEN_ACCEPTED = "accepted"  # 尚未兑换，或兑换的用户在有效期内重新提交
+QR_TOKEN_REUSED = "reused"      # 已被其他用户兑换
+QR_TOKEN_EXPIRED = "expired"    # 兑换的用户超过有效期后重新提交
+
+# 账本记录: (兑换用户, 兑换时间, 缓存过期时间)
+_Entry = Tuple[str, float, float]
+
+
+class QrTokenLedger:
+    """
+    二维码单次使用账本
+
+    记录按 app_id 区分（不同应用的open_id不同），键中的二维码内容取哈希。
+    """
+
+    def __init__(
+        self,
+        validity: float = QR_TOKEN_VALIDITY,
+        retention: float = QR_TOKEN_LEDGER_RETENTION,
+        enabled: bool = QR_TOKEN_LEDGER_ENABLED
+    ):
+        self.validity = validity
+        self.retention = max(retention, validity)
+        self.enabled = enabled
+        # 进程内缓存: 键 -> 账本记录
+        self._entries: Dict[str, _Entry] = {}
+        self._counters: Dict[str, int] = {QR_TOKEN_ACCEPTED: 0, QR_TOKEN_REUSED: 0, QR_TOKEN_EXPIRED: 0}
+
+    async def check(self, qr_data: str, open_id: str) -> str:
+        """
+        验证前检查二维码能否由该用户使用（只检查，不登记）
+
+        Args:
+            qr_data: 二维码内容
+            open_id: 提交的用户
+
+        Returns:
+            str: QR_TOKEN_ACCEPTED、QR_TOKEN_REUSED 或 QR_TOKEN_EXPIRED
+        """
+        if not self.enabled:
+            return QR_TOKEN_ACCEPTED
+
+        key = self._key(qr_data)
+        now = time.time()
+        entry = self._cached(key, now)
+        if entry is None:
+            entry = await asyncio.to_thread(self._load_shared, key)
+            if entry is not None:
+                self._entries[key] = entry
+
+        if entry is None:
+            result = QR_TOKEN_ACCEPTED
+        elif entry[0] != open_id:
+            result = QR_TOKEN_REUSED
+            logger.warning("用户 %s 提交的二维码已被用户 %s 使用", open_id, entry[0])
+        elif now - entry[1] > self.validity:
+            result = QR_TOKEN_EXPIRED
+        else:
+            result = QR_TOKEN_ACCEPTED
+        self._counters[result] += 1
+        return result
+
+    async def redeem(self, qr_data: str, open_id: str) -> str:
+        """
+        验证通过后登记兑换的用户
+
+        两个用户同时提交同一二维码且都通过验证时，只有先登记的用户可以继续。
+
+        Args:
+            qr_data: 二维码内容
+            open_id: 验证通过的用户
+
+        Returns:
+            str: QR_TOKEN_ACCEPTED，或已被其他用户兑换时返回 QR_TOKEN_REUSED
+        """
+        if not self.enabled:
+            return QR_TOKEN_ACCEPTED
+
+        key = self._key(qr_data)
+        now = time.time()
+        entry = self._cached(key, now)
+        if entry is None:
+            entry = await asyncio.to_thread(self._redeem_shared, key, open_id, now)
+            self._entries[key] = entry
+
+        if entry[0] != open_id:
+            self._counters[QR_TOKEN_REUSED] += 1
+            logger.warning("用户 %s 验证通过的二维码已被用户 %s 兑换", open_id, entry[0])
+            return QR_TOKEN_REUSED
+        return QR_TOKEN_ACCEPTED
+
+    def cleanup(self) -> int:
+        """
+        清理进程内缓存和共享状态存储中过期的记录（在清理线程中调用）
+
+        Returns:
+            int: 进程内缓存清理的数量
+        """
+        now = time.time()
+        expired = [key for key, entry in list(self._entries.items()) if entry[2] < now]
+        for key in expired:
+            self._entries.pop(key, None)
+        if self.enabled:
+            get_state_backend().cleanup()
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取账本统计
+
+        Returns:
+            Dict: 缓存的记录数和各检查结果的次数
+        """
+        return {"entries": len(self._entries), **self._counters}
+
+    def _key(self, qr_data: str) -> str:
+        digest = hashlib.sha256(qr_data.encode("utf-8")).hexdigest()[:32]
+        return f"qr_token:{current_tenant().app_id}:{digest}"
+
+    def _cached(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None or entry[2] < now:
+            return None
+        return entry
+
+    def _entry(self, value: str) -> _Entry:
+        data = json.loads(value)
+        return data["open_id"], data["redeemed_at"], data["redeemed_at"] + self.retention
+
+    # 以下方法在线程中执行
+
+    def _load_shared(self, key: str) -> Optional[_Entry]:
+        """读取共享存储中的记录"""
+        value = get_state_backend().get(key)
+        return self._entry(value) if value is not None else None
+
+    def _redeem_shared(self, key: str, open_id: str, now: float) -> _Entry:
+        """在共享存储中登记，已有记录时返回已有的兑换用户"""
+        backend = get_state_backend()
+        value = json.dumps({"open_id": open_id, "redeemed_at": now})
+        if not backend.set_if_absent(key, value, self.retention):
+            existing = backend.get(key)
+            # 已有记录恰好在这期间过期时按首次兑换处理
+            if existing is not None:
+                return self._entry(existing)
+            backend.set(key, value, self.retention)
+        return open_id, now, now + self.retention
+
+
+# 全局二维码账本
+qr_token_ledger = QrTokenLedger()
+
+registry.gauge(
+    "xiaohuo_qr_token_ledger_entries",
+    "QR tokens cached in the in-process ledger",
+    [],
+    lambda: [((), qr_token_ledger.stats()["entries"])]
+)
+registry.gauge(
+    "xiaohuo_qr_token_checks_total",
+    "QR token submissions by ledger result",
+    ["result"],
+    lambda: [((result,), count) for result, count in qr_token_ledger.stats().items() if result != "entries"],
+    metric_type="counter"
+)
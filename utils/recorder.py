@@ -0,0 +1,208 @@
+"""
+事件录制模块
+把收到的事件匿名化后追加写入gzip压缩的JSONL文件，用于回放真实流量的节奏做容量规划。
+
+每行为 {"time": 收到事件的时间戳, "offset": 相对本次录制开始的秒数, "event": {...}}，
+与 tools/ws_replay_server.py 和 benchmarks/replay.py 的录制格式一致。
+
+匿名化规则:
+- open_id、user_id、union_id、tenant_key 等标识替换为带密钥的哈希，同一用户在录制中保持一致
+- 文本消息只保留重置命令和群组关键词，其余内容替换为占位符
+- 图片的image_key替换为哈希（同一张图片重复发送时仍然相同），回放时由替身服务器生成对应的二维码
+- 验证令牌、群名称、@提及等字段直接删除
+
+录制在后台线程中完成匿名化和写文件，事件处理路径上只有一次入队。
+"""
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from config.config import EVENT_RECORDING_PATH, EVENT_RECORDING_SALT, RESET_COMMANDS
+from utils.routing import RoutingSnapshot, current_routing
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 替换为匿名标识的字段
+_ID_KEYS = frozenset({"open_id", "user_id", "union_id", "tenant_key", "chat_id", "message_id", "root_id", "parent_id"})
+
+# 直接删除的字段
+_DROPPED_KEYS = frozenset({"token", "name", "mentions", "i18n_names", "avatar"})
+
+REDACTED_TEXT = "***"
+
+# 回放时替身服务器按该前缀识别图片（见 benchmarks/stubs.py）
+IMAGE_KEY_PREFIX = "img_"
+
+
+def sanitize_text(text: str, routing: Optional[RoutingSnapshot] = None) -> str:
+    """
+    匿名化文本消息：只保留会影响状态流转的命令和关键词
+
+    Args:
+        text: 原文
+        routing: 事件所属租户的路由快照，默认使用当前快照
+
+    Returns:
+        str: 匿名化后的文本
+    """
+    stripped = text.strip()
+    if stripped in RESET_COMMANDS:
+        return stripped
+    # 能识别出群组类型时只保留该类型的第一个关键词
+    routing = routing or current_routing()
+    group_type = routing.matcher.match(stripped)
+    if group_type is not None:
+        return routing.group_types[group_type]["keywords"][0]
+    return REDACTED_TEXT
+
+
+class EventRecorder:
+    """
+    事件录制器，未配置录制路径时 record() 直接返回
+    """
+
+    def __init__(self, path: str = EVENT_RECORDING_PATH, salt: str = EVENT_RECORDING_SALT):
+        self.path = path.replace("{pid}", str(os.getpid())) if path else ""
+        self._salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        self._queue: "queue.SimpleQueue[Optional[Tuple[float, Dict[str, Any], Optional[RoutingSnapshot]]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = time.time()
+        self.recorded = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否开启录制"""
+        return bool(self.path)
+
+    def record(self, event_data: Dict[str, Any], routing: Optional[RoutingSnapshot] = None) -> None:
+        """
+        录制一个事件（只入队，匿名化和写文件在后台线程中进行）
+
+        Args:
+            event_data: 事件数据，录制后不应再被修改
+            routing: 事件所属租户的路由快照，用于保留文本中的群组关键词
+        """
+        if not self.path:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, name="event-recorder", daemon=True)
+            self._thread.start()
+        self._queue.put((time.time(), event_data, routing))
+
+    def close(self) -> None:
+        """写出剩余事件并停止后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(5)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取录制统计
+
+        Returns:
+            Dict: 录制文件、已写入和失败的事件数
+        """
+        return {"path": self.path or None, "recorded": self.recorded, "failed": self.failed}
+
+    def pseudonym(self, value: str) -> str:
+        """
+        生成稳定的匿名标识，保留 ou_、oc_ 等类型前缀
+
+        Args:
+            value: 原始标识
+
+        Returns:
+            str: 匿名标识
+        """
+        prefix, _, _ = value.rpartition("_")
+        digest = hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:24]
+        return f"{prefix}_{digest}" if prefix and len(prefix) <= 4 else digest
+
+    def sanitize(self, event_data: Dict[str, Any], routing: Optional[RoutingSnapshot] = None) -> Dict[str, Any]:
+        """
+        匿名化事件
+
+        Args:
+            event_data: 原始事件
+            routing: 事件所属租户的路由快照，默认使用当前快照
+
+        Returns:
+            Dict: 匿名化后的新事件，原事件不变
+        """
+        sanitized = self._sanitize_value(event_data)
+        message = sanitized.get("event", {}).get("message")
+        if isinstance(message, dict) and "content" in message:
+            message["content"] = self._sanitize_content(message.get("message_type"), message["content"], routing)
+        return sanitized
+
+    def _sanitize_value(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                if key in _DROPPED_KEYS:
+                    continue
+                if key in _ID_KEYS and isinstance(item, str) and item:
+                    result[key] = self.pseudonym(item)
+                else:
+                    result[key] = self._sanitize_value(item)
+            return result
+        if isinstance(value, list):
+            return [self._sanitize_value(item) for item in value]
+        return value
+
+    def _sanitize_content(self, message_type: Optional[str], content: str, routing: Optional[RoutingSnapshot]) -> str:
+        """按消息类型匿名化消息内容（与处理逻辑一致，content为base64编码的JSON）"""
+        try:
+            data = json.loads(base64.b64decode(content).decode("utf-8"))
+        except Exception:
+            return ""
+
+        if message_type == "text":
+            data = {"text": sanitize_text(data.get("text", ""), routing)}
+        elif message_type == "image":
+            image_key = data.get("image_key", "")
+            data = {"image_key": IMAGE_KEY_PREFIX + self.pseudonym(image_key) if image_key else ""}
+        else:
+            data = {}
+        return base64.b64encode(json.dumps(data, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+    def _write_loop(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 追加模式下每次打开写入新的gzip成员，读取时会自动拼接
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                received_at, event_data, routing = item
+                try:
+                    line = json.dumps({
+                        "time": round(received_at, 6),
+                        "offset": round(received_at - self._started_at, 6),
+                        "event": self.sanitize(event_data, routing),
+                    }, ensure_ascii=False)
+                    f.write(line + "\n")
+                    self.recorded += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error("录制事件失败: %s", e)
+                if self._queue.empty():
+                    f.flush()
+
+
+# 全局录制器实例
+event_recorder = EventRecorder()
@@ -0,0 +1,47 @@
+"""
+HTTP响应工具
+为webhook提供预先序列化的固定响应，以及只作用于部分路由的CORS中间件
+"""
+from typing import Any, Iterable
+
+from fastapi.responses import ORJSONResponse, Response
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# 飞书事件的固定成功响应，预先序列化
+SUCCESS_BODY = b'{"code":0,"msg":"success"}'
+SUCCESS_RESULT = {"code": 0, "msg": "success"}
+
+
+def event_response(result: Any) -> Response:
+    """
+    生成事件回调的响应，成功响应直接使用预先序列化的字节
+    
+    Args:
+        result: handle_bot_event 的返回值
+        
+    Returns:
+        Response: HTTP响应
+    """
+    if result == SUCCESS_RESULT:
+        return Response(SUCCESS_BODY, media_type="application/json")
+    return ORJSONResponse(result)
+
+
+class PathFilteredCORSMiddleware:
+    """
+    跳过指定路径的CORS中间件
+
+    飞书回调是服务端之间的调用，不需要CORS处理，直接交给下游应用。
+    """
+
+    def __init__(self, app: ASGIApp, exclude_paths: Iterable[str], **cors_options: Any):
+        self.app = app
+        self.exclude_paths = frozenset(exclude_paths)
+        self.cors = CORSMiddleware(app, **cors_options)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+        else:
+            await self.cors(scope, receive, send)
@@ -0,0 +1,340 @@
+"""
+群组路由模块
+群组类型配置（chat_id池、关键词、卡片模板）保存在不可变的路由快照中，
+重新加载时构建完整的新快照后一次性替换引用，读取方不需要加锁。
+
+每个事件在开始处理时绑定当时的快照（contextvar），处理过程中一直使用同一份配置；
+配置在处理途中被替换时，进行中的事件仍按旧快照完成。
+
+配置来源:
+- config.py 中的 GROUP_TYPES（默认）
+- ROUTING_CONFIG_PATH 指向的JSON文件，定期检查修改时间，修改后自动重新加载
+- 管理接口提交的配置
+
+每个租户（飞书应用）有各自的路由表，见 utils/tenants.py；模板对所有路由表生效。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import weakref
+import logging
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from config.config import GROUP_TYPES, ROUTING_CONFIG_PATH, ROUTING_RELOAD_INTERVAL
+from utils.group_matcher import GroupTypeMatcher, selectable_group_types
+from utils.metrics import registry
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 按群组配置生成的预计算内容，例如序列化后的卡片
+TemplateBuilder = Callable[[Mapping[str, Mapping[str, Any]]], Any]
+
+# 已注册的模板，所有路由表共用
+_template_builders: Dict[str, TemplateBuilder] = {}
+
+# 已创建的路由表，注册模板时为每个路由表生成
+_tables: "weakref.WeakSet[RoutingTable]" = weakref.WeakSet()
+
+
+@dataclass(frozen=True)
+class RoutingSnapshot:
+    """某一版本的群组路由配置及其预计算结果"""
+
+    version: int
+    digest: str
+    source: str
+    loaded_at: float
+    group_types: Mapping[str, Mapping[str, Any]]
+    selectable: Tuple[str, ...]
+    matcher: GroupTypeMatcher
+    templates: Mapping[str, Any]
+
+    def chat_ids(self, group_type: str) -> Tuple[str, ...]:
+        """
+        获取群组类型对应的chat_id池
+
+        Args:
+            group_type: 群组类型
+
+        Returns:
+            Tuple[str, ...]: chat_id列表，未知类型时为空
+        """
+        group = self.group_types.get(group_type)
+        return group["chat_ids"] if group else ()
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def validate_group_types(group_types: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    校验群组类型配置
+
+    Args:
+        group_types: 群组类型配置，格式同 GROUP_TYPES
+
+    Returns:
+        Dict: 补全默认字段后的配置
+
+    Raises:
+        ValueError: 配置不合法
+    """
+    if not isinstance(group_types, dict) or not group_types:
+        raise ValueError("group_types 必须是非空对象")
+
+    validated = {}
+    for group_type, group in group_types.items():
+        if not isinstance(group, dict):
+            raise ValueError(f"群组类型 {group_type} 的配置必须是对象")
+        name = group.get("name")
+        if not isinstance(name, str) or not name:
+            raise ValueError(f"群组类型 {group_type} 缺少 name")
+        for field in ("chat_ids", "keywords"):
+            items = group.get(field, [])
+            if not isinstance(items, list) or not all(isinstance(item, str) and item for item in items):
+                raise ValueError(f"群组类型 {group_type} 的 {field} 必须是字符串列表")
+        validated[group_type] = {
+            **group,
+            "chat_ids": list(group.get("chat_ids", [])),
+            "keywords": list(group.get("keywords", [])),
+            "button_label": group.get("button_label") or name,
+            "selectable": bool(group.get("selectable", True)),
+        }
+    return validated
+
+
+def _digest(group_types: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(group_types, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class RoutingTable:
+    """
+    持有当前路由快照，负责从文件或管理接口重新加载
+    """
+
+    def __init__(
+        self,
+        path: str = ROUTING_CONFIG_PATH,
+        interval: float = ROUTING_RELOAD_INTERVAL,
+        group_types: Dict[str, Any] = GROUP_TYPES
+    ):
+        self.path = path
+        self.interval = interval
+        self._snapshot = self._build(validate_group_types(group_types), version=1, source="config")
+        self._mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        _tables.add(self)
+
+    @property
+    def current(self) -> RoutingSnapshot:
+        """当前快照（新事件绑定的版本）"""
+        return self._snapshot
+
+    def _add_template(self, name: str, builder: TemplateBuilder) -> None:
+        """为当前快照生成新注册的模板"""
+        snapshot = self._snapshot
+        self._snapshot = replace(
+            snapshot,
+            templates=MappingProxyType({**snapshot.templates, name: builder(snapshot.group_types)})
+        )
+
+    def load(self, group_types: Any, source: str) -> RoutingSnapshot:
+        """
+        校验配置并替换当前快照；内容没有变化时保持原版本
+
+        Args:
+            group_types: 群组类型配置，格式同 GROUP_TYPES
+            source: 配置来源，记录在快照中
+
+        Returns:
+            RoutingSnapshot: 加载后的当前快照
+
+        Raises:
+            ValueError: 配置不合法或生成模板失败，当前快照保持不变
+        """
+        validated = validate_group_types(group_types)
+        current = self._snapshot
+        if _digest(validated) == current.digest:
+            return current
+        try:
+            snapshot = self._build(validated, version=current.version + 1, source=source)
+        except Exception as e:
+            raise ValueError(f"生成路由快照失败: {e}") from e
+        self._snapshot = snapshot
+        self.reloads += 1
+        logger.warning(
+            "群组路由已更新: 版本 %s → %s (%s)，群组类型: %s",
+            current.version, snapshot.version, source, ", ".join(snapshot.group_types)
+        )
+        return snapshot
+
+    async def reload_from_file(self) -> RoutingSnapshot:
+        """
+        从配置文件重新加载
+
+        Returns:
+            RoutingSnapshot: 加载后的当前快照
+
+        Raises:
+            ValueError: 未配置文件、文件无法读取或配置不合法
+        """
+        if not self.path:
+            raise ValueError("未配置 ROUTING_CONFIG_PATH")
+        try:
+            mtime, data = await asyncio.to_thread(self._read_file)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"读取路由配置失败: {e}") from e
+        if not isinstance(data, dict):
+            raise ValueError("路由配置文件必须是JSON对象")
+        snapshot = self.load(data.get("group_types"), source=self.path)
+        self._mtime = mtime
+        return snapshot
+
+    async def start(self) -> None:
+        """加载配置文件并开始检查文件修改（未配置文件时不做任何事）"""
+        if not self.path or self._task is not None:
+            return
+        await self._try_reload()
+        self._task = asyncio.create_task(self._watch_loop(), name="routing-watch")
+
+    async def stop(self) -> None:
+        """停止检查文件修改"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取路由状态
+
+        Returns:
+            Dict: 当前版本、来源、群组类型和chat_id池，以及重新加载统计
+        """
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "digest": snapshot.digest,
+            "source": snapshot.source,
+            "loaded_at": snapshot.loaded_at,
+            "group_types": {
+                group_type: {"name": group["name"], "chat_ids": list(group["chat_ids"]), "selectable": group["selectable"]}
+                for group_type, group in snapshot.group_types.items()
+            },
+            "path": self.path or None,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+    def _build(self, group_types: Dict[str, Dict[str, Any]], version: int, source: str) -> RoutingSnapshot:
+        frozen = _freeze(group_types)
+        return RoutingSnapshot(
+            version=version,
+            digest=_digest(group_types),
+            source=source,
+            loaded_at=time.time(),
+            group_types=frozen,
+            selectable=tuple(selectable_group_types(frozen)),
+            matcher=GroupTypeMatcher(frozen),
+            templates=MappingProxyType({name: builder(frozen) for name, builder in _template_builders.items()}),
+        )
+
+    def _read_file(self) -> Tuple[float, Any]:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as f:
+            return mtime, json.load(f)
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    async def _try_reload(self) -> None:
+        try:
+            await self.reload_from_file()
+            self.last_error = None
+        except ValueError as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error("%s，继续使用版本 %s", e, self._snapshot.version)
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._mtime:
+                # 记录本次修改时间，配置错误时不会反复报错，文件再次修改后重试
+                self._mtime = mtime
+                await self._try_reload()
+
+
+def register_template(name: str, builder: TemplateBuilder) -> None:
+    """
+    注册按群组配置预计算的内容，每个路由表每次加载新快照时重新生成
+
+    Args:
+        name: 模板名称，通过 snapshot.templates[name] 读取
+        builder: 根据群组类型配置生成内容的函数
+    """
+    _template_builders[name] = builder
+    for table in list(_tables):
+        table._add_template(name, builder)
+
+
+# 全局路由表实例（默认租户使用）
+routing_table = RoutingTable()
+
+# 当前事件绑定的快照
+_bound_snapshot: ContextVar[Optional[RoutingSnapshot]] = ContextVar("xiaohuo_routing", default=None)
+
+
+def current_routing() -> RoutingSnapshot:
+    """
+    获取当前事件使用的路由快照，没有绑定时返回最新快照
+
+    Returns:
+        RoutingSnapshot: 路由快照
+    """
+    return _bound_snapshot.get() or routing_table.current
+
+
+def bind_routing(table: Optional[RoutingTable] = None) -> Token:
+    """
+    为当前事件绑定最新的路由快照，处理结束后用 unbind_routing 解除
+
+    Args:
+        table: 事件所属租户的路由表，默认使用全局路由表
+
+    Returns:
+        Token: 用于 unbind_routing 的令牌
+    """
+    return _bound_snapshot.set((table or routing_table).current)
+
+
+def unbind_routing(token: Token) -> None:
+    """解除当前事件绑定的路由快照"""
+    _bound_snapshot.reset(token)
+
+
+registry.gauge(
+    "xiaohuo_routing_version",
+    "Version of the active group routing snapshot",
+    [],
+    lambda: [((), routing_table.current.version)]
+)
@@ -0,0 +1,203 @@
+"""
+共享状态存储模块
+提供带过期时间的键值存储：memory 只在当前进程内有效，sqlite 在同一主机的多个工作进程间共享
+"""
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Optional
+
+from config.config import STATE_BACKEND, STATE_BACKEND_PATH
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+class MemoryStateBackend:
+    """进程内存储"""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expire_at)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取键值
+
+        Args:
+            key: 键
+
+        Returns:
+            Optional[str]: 值，不存在或已过期时返回None
+        """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] < time.time():
+            self._data.pop(key, None)
+            return None
+        return item[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """
+        写入键值
+
+        Args:
+            key: 键
+            value: 值
+            ttl: 有效期（秒）
+        """
+        self._data[key] = (value, time.time() + ttl)
+
+    def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        """
+        键不存在（或已过期）时写入
+
+        Args:
+            key: 键
+            value: 值
+            ttl: 有效期（秒）
+
+        Returns:
+            bool: 是否写入成功
+        """
+        if self.get(key) is not None:
+            return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key: str) -> None:
+        """删除键"""
+        self._data.pop(key, None)
+
+    def delete_if_value(self, key: str, value: str) -> bool:
+        """
+        键的值等于 value 时删除（例如只释放自己持有的租约）
+
+        Args:
+            key: 键
+            value: 期望的值
+
+        Returns:
+            bool: 是否删除
+        """
+        if self.get(key) != value:
+            return False
+        self._data.pop(key, None)
+        return True
+
+    def size(self) -> int:
+        """键的数量（含未清理的过期键）"""
+        return len(self._data)
+
+    def ping(self) -> None:
+        """检查存储是否可用（就绪检查），不可用时抛出异常"""
+
+    def cleanup(self) -> int:
+        """
+        清理过期键
+
+        Returns:
+            int: 清理的数量
+        """
+        now = time.time()
+        # 可能在清理线程中调用，先复制再遍历
+        expired = [key for key, (_, expire_at) in list(self._data.items()) if expire_at < now]
+        for key in expired:
+            self._data.pop(key, None)
+        return len(expired)
+
+
+class SqliteStateBackend:
+    """基于SQLite文件的存储，同一主机上的多个进程共享"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=1.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE key = ? AND expire_at >= ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expire_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+
+    def set_if_absent(self, key: str, value: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM state WHERE key = ? AND expire_at < ?", (key, now))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO state (key, value, expire_at) VALUES (?, ?, ?)",
+                    (key, value, now + ttl)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def delete_if_value(self, key: str, value: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM state WHERE key = ? AND value = ? AND expire_at >= ?", (key, value, time.time())
+            )
+        return cursor.rowcount == 1
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+
+    def ping(self) -> None:
+        with self._lock:
+            self._conn.execute("SELECT 1 FROM state LIMIT 1").fetchall()
+
+    def cleanup(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM state WHERE expire_at < ?", (time.time(),))
+        return cursor.rowcount
+
+
+# 缓存存储实例
+_state_backend = None
+
+
+def get_state_backend():
+    """
+    获取共享状态存储实例（单例模式）
+
+    Returns:
+        MemoryStateBackend | SqliteStateBackend: 按 STATE_BACKEND 配置创建的存储
+    """
+    global _state_backend
+
+    if _state_backend is None:
+        if STATE_BACKEND == "sqlite":
+            _state_backend = SqliteStateBackend(STATE_BACKEND_PATH)
+        else:
+            _state_backend = MemoryStateBackend()
+        logger.info("共享状态存储: %s", STATE_BACKEND)
+
+    return _state_backend
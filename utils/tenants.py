@@ -0,0 +1,365 @@
+"""
+多租户模块
+一个部署可以同时服务多个飞书应用（例如多场比赛各用一个机器人），每个租户有各自的：
+- 飞书应用凭证、访问凭证管理器和 Lark 客户端（客户端见 utils/lark_client.py，按 app_id 缓存）
+- 事件订阅 Encrypt Key
+- 验证API地址、令牌、活动ID，以及各自的熔断器和耗时统计
+- 群组路由表
+
+事件按请求头中的 app_id 找到租户，处理期间绑定在 contextvar 中（与路由快照一样），
+下游代码通过 current_tenant() 读取，不需要逐层传递。
+
+解码线程池、舱壁、事件调度器、发件箱、验证API连接池、共享状态存储和用户状态在租户间共用，
+增加租户只增加凭证刷新任务和少量对象。用户状态按open_id保存，open_id按应用区分，不会冲突。
+
+默认租户来自环境变量（FEISHU_APP_ID 等），其余租户在 TENANTS_CONFIG_PATH 指向的JSON文件中配置:
+
+    {
+        "tenants": [
+            {
+                "app_id": "cli_xxx",
+                "app_secret": "${CONTEST_B_APP_SECRET}",
+                "encrypt_key": "${CONTEST_B_ENCRYPT_KEY}",
+                "name": "B赛区",
+                "verification": {"endpoint": "https://...", "token": "...", "event_id": "..."},
+                "group_types": {...},
+                "routing_config_path": "config/contest-b-routing.json"
+            }
+        ]
+    }
+
+字符串中的 ${NAME} 会替换为同名环境变量，密钥不必写在文件中。
+group_types 格式同 GROUP_TYPES，省略时使用 GROUP_TYPES；routing_config_path 的作用同 ROUTING_CONFIG_PATH。
+"""
+import asyncio
+import json
+import os
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional
+
+from config.config import (
+    FEISHU_APP_ID,
+    FEISHU_APP_SECRET,
+    ENCRYPT_KEY,
+    API_ENDPOINT,
+    API_TOKEN,
+    EVENT_ID,
+    GROUP_TYPES,
+    TENANTS_CONFIG_PATH,
+    VERIFICATION_BREAKER_FAILURE_THRESHOLD,
+    VERIFICATION_BREAKER_RESET_TIMEOUT
+)
+from utils.circuit_breaker import CircuitBreaker
+from utils.error_handler import ErrorClass, register_retry_hook
+from utils.latency import LatencyWindow
+from utils.routing import RoutingTable, routing_table
+from utils.token_manager import TenantTokenManager, token_manager
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+
+class Tenant:
+    """一个飞书应用及其验证API和群组配置"""
+
+    def __init__(
+        self,
+        app_id: str,
+        app_secret: str,
+        encrypt_key: str,
+        api_endpoint: str,
+        api_token: str,
+        event_id: str,
+        routing: RoutingTable,
+        token_manager: TenantTokenManager,
+        name: str = "",
+        breaker_name: str = ""
+    ):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.encrypt_key = encrypt_key
+        self.api_endpoint = api_endpoint
+        self.api_token = api_token
+        self.event_id = event_id
+        self.routing = routing
+        self.token_manager = token_manager
+        self.name = name or app_id
+        self.verification_breaker = CircuitBreaker(
+            breaker_name or f"verification_api:{app_id}",
+            failure_threshold=VERIFICATION_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=VERIFICATION_BREAKER_RESET_TIMEOUT
+        )
+        self.verification_latency = LatencyWindow()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取租户状态（不含密钥）
+
+        Returns:
+            Dict: 名称、验证API、凭证、熔断器和路由版本
+        """
+        snapshot = self.routing.current
+        return {
+            "app_id": self.app_id,
+            "name": self.name,
+            "event_id": self.event_id,
+            "api_endpoint": self.api_endpoint or None,
+            "encrypted": bool(self.encrypt_key),
+            "token_ready": self.token_manager.token is not None,
+            "verification_breaker": self.verification_breaker.stats(),
+            "routing": {"version": snapshot.version, "source": snapshot.source, "path": self.routing.path or None},
+        }
+
+
+def _expand(value: Any) -> str:
+    """展开字符串中的 ${NAME} 环境变量"""
+    return os.path.expandvars(value) if isinstance(value, str) else ""
+
+
+def _tenant_from_config(item: Any) -> Tenant:
+    """
+    根据配置文件中的一项创建租户
+
+    Raises:
+        ValueError: 配置不合法
+    """
+    if not isinstance(item, dict):
+        raise ValueError("租户配置必须是对象")
+    app_id = _expand(item.get("app_id"))
+    app_secret = _expand(item.get("app_secret"))
+    if not app_id or not app_secret:
+        raise ValueError("租户配置缺少 app_id 或 app_secret")
+
+    verification = item.get("verification", {})
+    if not isinstance(verification, dict):
+        raise ValueError(f"租户 {app_id} 的 verification 必须是对象")
+    try:
+        routing = RoutingTable(
+            path=_expand(item.get("routing_config_path")),
+            group_types=item.get("group_types") or GROUP_TYPES
+        )
+    except ValueError as e:
+        raise ValueError(f"租户 {app_id} 的群组配置不合法: {e}") from e
+
+    return Tenant(
+        app_id=app_id,
+        app_secret=app_secret,
+        encrypt_key=_expand(item.get("encrypt_key")),
+        api_endpoint=_expand(verification.get("endpoint")),
+        api_token=_expand(verification.get("token")),
+        event_id=_expand(verification.get("event_id")),
+        routing=routing,
+        token_manager=TenantTokenManager(app_id, app_secret),
+        name=_expand(item.get("name")),
+    )
+
+
+class TenantRegistry:
+    """
+    租户注册表，按 app_id 查找租户
+    """
+
+    def __init__(self, default: Tenant):
+        self.default = default
+        self._tenants: Dict[str, Tenant] = {default.app_id: default}
+        self._encrypt_keys: List[str] = [default.encrypt_key] if default.encrypt_key else []
+        self.unknown = 0
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(list(self._tenants.values()))
+
+    def add(self, tenant: Tenant) -> None:
+        """
+        注册一个租户
+
+        Raises:
+            ValueError: app_id 已存在
+        """
+        if tenant.app_id in self._tenants:
+            raise ValueError(f"租户 {tenant.app_id} 重复配置")
+        self._tenants[tenant.app_id] = tenant
+        if tenant.encrypt_key and tenant.encrypt_key not in self._encrypt_keys:
+            self._encrypt_keys.append(tenant.encrypt_key)
+
+    def load_file(self, path: str) -> None:
+        """
+        从配置文件加载其余租户
+
+        Args:
+            path: JSON配置文件路径
+
+        Raises:
+            ValueError: 文件无法读取或配置不合法
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"读取租户配置失败: {e}") from e
+        if not isinstance(data, dict) or not isinstance(data.get("tenants"), list):
+            raise ValueError("租户配置文件必须是包含 tenants 列表的JSON对象")
+        for item in data["tenants"]:
+            self.add(_tenant_from_config(item))
+        logger.info("已加载 %s 个租户: %s", len(self._tenants), ", ".join(t.name for t in self._tenants.values()))
+
+    def get(self, app_id: Optional[str]) -> Optional[Tenant]:
+        """
+        按 app_id 查找租户
+
+        Args:
+            app_id: 飞书应用ID
+
+        Returns:
+            Optional[Tenant]: 租户，未配置时返回None
+        """
+        return self._tenants.get(app_id)
+
+    def for_event(self, event_data: Dict[str, Any]) -> Optional[Tenant]:
+        """
+        查找事件所属的租户
+
+        事件没有 app_id（如旧版卡片回调）时归默认租户；只有一个租户时所有事件都归默认租户，
+        与单应用部署的行为一致（例如回放其他应用录制的事件）。
+
+        Args:
+            event_data: 事件数据
+
+        Returns:
+            Optional[Tenant]: 租户，app_id 未配置时返回None
+        """
+        app_id = event_data.get("header", {}).get("app_id")
+        if not app_id or len(self._tenants) == 1:
+            return self.default
+        tenant = self._tenants.get(app_id)
+        if tenant is None:
+            self.unknown += 1
+        return tenant
+
+    def encrypt_keys(self) -> List[str]:
+        """
+        所有租户的事件订阅 Encrypt Key（去重，默认租户在前）
+
+        Returns:
+            List[str]: Encrypt Key列表，都未配置时为空
+        """
+        return self._encrypt_keys
+
+    async def start(self) -> None:
+        """加载各租户的路由配置文件并启动访问凭证的后台刷新"""
+        for tenant in self:
+            await tenant.routing.start()
+        await asyncio.gather(*(tenant.token_manager.start() for tenant in self))
+
+    async def stop(self) -> None:
+        """停止各租户的后台任务"""
+        for tenant in self:
+            await tenant.routing.stop()
+        await asyncio.gather(*(tenant.token_manager.stop() for tenant in self))
+
+    async def refresh_tokens(self) -> None:
+        """获取所有租户的访问凭证（启动预热），任一失败时抛出第一个错误"""
+        results = await asyncio.gather(
+            *(tenant.token_manager.refresh() for tenant in self),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取所有租户的状态
+
+        Returns:
+            Dict: 默认租户、各租户状态和未知 app_id 的事件数
+        """
+        return {
+            "default": self.default.app_id,
+            "tenants": [tenant.stats() for tenant in self],
+            "unknown_events": self.unknown,
+        }
+
+
+def _create_registry() -> TenantRegistry:
+    # 默认租户沿用全局的凭证管理器和路由表，熔断器名称与单租户时一致
+    registry = TenantRegistry(Tenant(
+        app_id=FEISHU_APP_ID,
+        app_secret=FEISHU_APP_SECRET,
+        encrypt_key=ENCRYPT_KEY,
+        api_endpoint=API_ENDPOINT,
+        api_token=API_TOKEN,
+        event_id=EVENT_ID,
+        routing=routing_table,
+        token_manager=token_manager,
+        breaker_name="verification_api",
+    ))
+    if TENANTS_CONFIG_PATH:
+        registry.load_file(TENANTS_CONFIG_PATH)
+    return registry
+
+
+# 全局租户注册表（配置错误时启动失败）
+tenant_registry = _create_registry()
+
+# 当前事件所属的租户
+_bound_tenant: ContextVar[Optional[Tenant]] = ContextVar("xiaohuo_tenant", default=None)
+
+
+def current_tenant() -> Tenant:
+    """
+    获取当前事件所属的租户，没有绑定时返回默认租户
+
+    Returns:
+        Tenant: 租户
+    """
+    return _bound_tenant.get() or tenant_registry.default
+
+
+def bind_tenant(tenant: Tenant) -> Token:
+    """
+    为当前事件绑定租户，处理结束后用 unbind_tenant 解除
+
+    Args:
+        tenant: 事件所属的租户
+
+    Returns:
+        Token: 用于 unbind_tenant 的令牌
+    """
+    return _bound_tenant.set(tenant)
+
+
+def unbind_tenant(token: Token) -> None:
+    """解除当前事件绑定的租户"""
+    _bound_tenant.reset(token)
+
+
+@contextmanager
+def tenant_context(payload: Dict[str, Any]) -> Iterator[Tenant]:
+    """
+    按出站操作记录的 app_id 绑定租户（发件箱在后台重试时使用）
+
+    Args:
+        payload: 出站操作参数，app_id 缺失或已不再配置时使用默认租户
+
+    Yields:
+        Tenant: 绑定的租户
+    """
+    tenant = tenant_registry.get(payload.get("app_id")) or tenant_registry.default
+    token = _bound_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _bound_tenant.reset(token)
+
+
+async def _invalidate_current_token() -> None:
+    await current_tenant().token_manager.invalidate()
+
+
+# 凭证过期或无效时，重试前先刷新当前租户的凭证
+register_retry_hook(ErrorClass.TOKEN_EXPIRED, _invalidate_current_token)
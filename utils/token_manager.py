@@ -0,0 +1,207 @@
+"""
+tenant_access_token 管理模块
+在后台提前刷新访问凭证，并通过共享状态存储在多个工作进程间复用，
+业务请求只读取已缓存的凭证，不会等待凭证获取。
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+import logging
+from typing import Optional
+
+import httpx
+
+from config.config import (
+    FEISHU_APP_ID,
+    FEISHU_APP_SECRET,
+    FEISHU_GET_TOKEN_URL,
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_MIN_REFRESH_INTERVAL
+)
+from utils.state_backend import get_state_backend
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 刷新租约有效期（秒），持有租约的进程负责向飞书获取新凭证
+_LEASE_TTL = 10.0
+
+
+class TenantTokenManager:
+    """
+    tenant_access_token 管理器
+
+    - 后台任务在凭证到期前 refresh_margin 秒刷新
+    - 凭证写入共享状态存储，其他进程直接读取，不重复获取
+    - 同一进程内并发的刷新请求合并为一次（single-flight）
+    - 共享存储的读写在线程中执行，不阻塞事件循环（sqlite 可能等待其他进程的写锁）
+    """
+
+    def __init__(self, app_id: str, app_secret: str, refresh_margin: float = TOKEN_REFRESH_MARGIN):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+
+        self._token: Optional[str] = None
+        self._expire_at = 0.0
+        self._refreshed_at = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self._inflight_forced = False
+        self._task: Optional[asyncio.Task] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def _state_key(self) -> str:
+        return f"tenant_access_token:{self.app_id}"
+
+    @property
+    def token(self) -> Optional[str]:
+        """当前可用的凭证，没有或已过期时返回None"""
+        if self._token and time.time() < self._expire_at:
+            return self._token
+        return None
+
+    async def start(self) -> None:
+        """启动后台刷新任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(), name=f"token-refresh-{self.app_id}")
+
+    async def stop(self) -> None:
+        """停止后台刷新任务"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def refresh(self, force: bool = False) -> Optional[str]:
+        """
+        刷新凭证，并发调用共享同一次刷新
+
+        强制刷新遇到进行中的普通刷新时，先等它结束：它可能重新采用了刚被飞书判定无效的凭证，
+        此时再强制刷新一次，不能直接沿用它的结果。
+
+        Args:
+            force: 是否忽略本地和共享存储中尚未到期的凭证（凭证被飞书判定无效时使用）
+
+        Returns:
+            Optional[str]: 刷新后的凭证
+        """
+        while force and self._inflight is not None and not self._inflight_forced:
+            stale_token = self._token
+            try:
+                await asyncio.shield(self._inflight)
+            except Exception:
+                pass
+            if self.token is not None and self._token != stale_token:
+                return self._token
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._do_refresh(force))
+            self._inflight_forced = force
+            self._inflight.add_done_callback(self._clear_inflight)
+        return await asyncio.shield(self._inflight)
+
+    async def invalidate(self) -> None:
+        """
+        凭证被飞书判定为过期或无效时调用，强制刷新一次
+
+        短时间内的多次调用只触发一次刷新。
+        """
+        if time.time() - self._refreshed_at < TOKEN_MIN_REFRESH_INTERVAL:
+            return
+        logger.warning("访问凭证被判定无效，强制刷新")
+        await self.refresh(force=True)
+
+    def _clear_inflight(self, future: asyncio.Future) -> None:
+        self._inflight = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                delay = max(1.0, self._expire_at - self.refresh_margin - time.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("刷新访问凭证失败: %s", e)
+                delay = 5.0
+            # 加一点抖动，避免多个进程同时刷新
+            await asyncio.sleep(delay + random.uniform(0, 1))
+
+    async def _do_refresh(self, force: bool) -> Optional[str]:
+        backend = get_state_backend()
+        stale_token = self._token if force else None
+
+        # 其他进程可能已经刷新过
+        if await self._adopt_shared(backend, stale_token):
+            return self._token
+
+        lease_key = f"{self._state_key}:lease"
+        lease_owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        leased = await asyncio.to_thread(backend.set_if_absent, lease_key, lease_owner, _LEASE_TTL)
+        if not leased:
+            # 其他进程正在刷新，等待其写入结果
+            deadline = time.monotonic() + _LEASE_TTL
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                if await self._adopt_shared(backend, stale_token):
+                    return self._token
+            # 等待超时（持有者可能已退出），租约此时应已过期，重新获取后自行刷新
+            leased = await asyncio.to_thread(backend.set_if_absent, lease_key, lease_owner, _LEASE_TTL)
+
+        try:
+            token, expire = await self._fetch()
+        finally:
+            # 只释放自己持有的租约
+            if leased:
+                await asyncio.to_thread(backend.delete_if_value, lease_key, lease_owner)
+
+        self._set_token(token, time.time() + expire)
+        await asyncio.to_thread(
+            backend.set,
+            self._state_key,
+            json.dumps({"token": token, "expire_at": self._expire_at}),
+            expire
+        )
+        logger.info("已获取新的访问凭证，有效期 %s 秒", expire)
+        return token
+
+    async def _adopt_shared(self, backend, stale_token: Optional[str]) -> bool:
+        """采用共享存储中仍在有效期内的凭证"""
+        value = await asyncio.to_thread(backend.get, self._state_key)
+        if not value:
+            return False
+        data = json.loads(value)
+        if data["token"] == stale_token or data["expire_at"] - time.time() <= self.refresh_margin:
+            return False
+        self._set_token(data["token"], data["expire_at"])
+        return True
+
+    def _set_token(self, token: str, expire_at: float) -> None:
+        self._token = token
+        self._expire_at = expire_at
+        self._refreshed_at = time.time()
+
+    async def _fetch(self):
+        """向飞书获取 tenant_access_token"""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(timeout=10.0)
+
+        response = await self._http_client.post(
+            FEISHU_GET_TOKEN_URL,
+            json={"app_id": self.app_id, "app_secret": self.app_secret}
+        )
+        data = response.json()
+        if data.get("code", -1) != 0:
+            raise RuntimeError(f"获取访问凭证失败: code={data.get('code')}, msg={data.get('msg')}")
+        return data["tenant_access_token"], data.get("expire", 7200)
+
+
+# 全局凭证管理器
+token_manager = TenantTokenManager(FEISHU_APP_ID, FEISHU_APP_SECRET)
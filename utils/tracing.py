@@ -0,0 +1,287 @@
+"""
+事件追踪模块
+每个事件一条追踪记录，处理过程中的各个调用作为子跨度，通过contextvar在协程和线程间传递。
+完成的追踪保存在环形缓冲区中，可选地以JSONL格式追加到文件。
+"""
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+from contextvars import ContextVar, Token
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config.config import TRACING_ENABLED, TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH, TRACE_MAX_SPANS
+
+# 配置日志
+logger = logging.getLogger('xiaohuo-bot')
+
+# 当前上下文所在的跨度
+_current_span: ContextVar[Optional["Span"]] = ContextVar("xiaohuo_span", default=None)
+
+_span_ids = itertools.count(1)
+
+
+class Trace:
+    """一个事件的全部跨度"""
+
+    __slots__ = ("trace_id", "started_at", "root", "spans")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration if self.root else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为可序列化的字典，跨度时间为相对追踪开始的偏移（秒）
+
+        Returns:
+            Dict: 追踪记录
+        """
+        origin = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 6),
+            "attributes": dict(self.root.attributes),
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent.span_id if span.parent else None,
+                    "name": span.name,
+                    "offset": round(span.start - origin, 6),
+                    "duration": round(span.duration, 6),
+                    "attributes": dict(span.attributes),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class Span:
+    """
+    追踪中的一个跨度
+
+    作为上下文管理器使用时，进入时成为当前跨度，退出时结束；根跨度结束时整条追踪完成。
+    """
+
+    __slots__ = ("trace", "span_id", "parent", "name", "start", "end", "attributes", "_token")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent = parent
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self._token: Optional[Token] = None
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def set(self, **attributes: Any) -> None:
+        """添加跨度属性"""
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        """结束跨度（重复调用无效）"""
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if self.parent is None:
+            _record_trace(self.trace)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        self.finish()
+
+
+class _NoopSpan:
+    """未开启追踪或当前没有追踪时使用的空跨度"""
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def start_trace(name: str, trace_id: Optional[str] = None, **attributes: Any):
+    """
+    开始一条新追踪
+
+    调用方通过 set_span() 让根跨度成为当前跨度；根跨度需要由处理完事件的一方调用 finish() 结束。
+
+    Args:
+        name: 根跨度名称
+        trace_id: 追踪ID，通常为event_id
+        attributes: 根跨度属性，例如open_id
+
+    Returns:
+        Span: 根跨度
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    trace = Trace(trace_id or uuid.uuid4().hex)
+    root = Span(trace, name, None, attributes)
+    trace.root = root
+    trace.spans.append(root)
+    return root
+
+
+def span(name: str, **attributes: Any):
+    """
+    在当前追踪下开启子跨度: with span("download"): ...
+
+    Args:
+        name: 跨度名称
+        attributes: 跨度属性
+
+    Returns:
+        Span: 子跨度；没有进行中的追踪时返回空跨度
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP_SPAN
+    trace = parent.trace
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        return _NOOP_SPAN
+    child = Span(trace, name, parent, attributes)
+    trace.spans.append(child)
+    return child
+
+
+def current_span():
+    """
+    获取当前跨度
+
+    Returns:
+        当前跨度，没有进行中的追踪时返回空跨度
+    """
+    return _current_span.get() or _NOOP_SPAN
+
+
+def trace_context() -> Optional[Tuple[str, Optional[str]]]:
+    """
+    获取当前事件的标识，用于日志等需要关联事件的地方
+
+    Returns:
+        Optional[Tuple]: (event_id, open_id)，没有进行中的追踪时返回None
+    """
+    current = _current_span.get()
+    if current is None:
+        return None
+    trace = current.trace
+    return trace.trace_id, trace.root.attributes.get("open_id")
+
+
+def set_span(current) -> Token:
+    """
+    设置当前跨度（例如开始追踪后，或事件在调度器的工作协程中处理时）
+
+    Args:
+        current: 跨度，空跨度表示没有追踪
+
+    Returns:
+        Token: 用于 reset_span 的令牌
+    """
+    return _current_span.set(current if isinstance(current, Span) else None)
+
+
+def reset_span(token: Token) -> None:
+    """恢复之前的跨度"""
+    _current_span.reset(token)
+
+
+# 最近完成的追踪
+_traces: Deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+# 导出队列和写文件线程
+_export_queue: "queue.SimpleQueue[Trace]" = queue.SimpleQueue()
+_export_thread: Optional[threading.Thread] = None
+
+
+def _export_worker() -> None:
+    """在后台线程中把追踪追加写入JSONL文件"""
+    directory = os.path.dirname(TRACE_EXPORT_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+        while True:
+            trace = _export_queue.get()
+            try:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+                if _export_queue.empty():
+                    f.flush()
+            except Exception as e:
+                logger.error("写入追踪记录失败: %s", e)
+
+
+def _record_trace(trace: Trace) -> None:
+    global _export_thread
+
+    _traces.append(trace)
+    if not TRACE_EXPORT_PATH:
+        return
+    if _export_thread is None:
+        _export_thread = threading.Thread(target=_export_worker, name="trace-exporter", daemon=True)
+        _export_thread.start()
+    _export_queue.put(trace)
+
+
+def recent_traces() -> List[Dict[str, Any]]:
+    """
+    获取环形缓冲区中的全部追踪（按完成顺序）
+
+    Returns:
+        List[Dict]: 追踪记录
+    """
+    return [trace.to_dict() for trace in list(_traces)]
+
+
+def slowest_traces(limit: int = 20, open_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    获取最近完成的追踪中耗时最长的若干条
+
+    Args:
+        limit: 返回条数
+        open_id: 只看某个用户的追踪
+
+    Returns:
+        List[Dict]: 追踪记录，按耗时从长到短
+    """
+    traces = list(_traces)
+    if open_id:
+        traces = [trace for trace in traces if trace.root.attributes.get("open_id") == open_id]
+    traces.sort(key=lambda trace: trace.duration, reverse=True)
+    return [trace.to_dict() for trace in traces[:limit]]